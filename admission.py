@@ -0,0 +1,226 @@
+"""Admission control in front of model-backed routes.
+
+Two layers keep a burst of expensive requests from exhausting the
+Anthropic rate limit and every worker thread:
+
+- TokenBucketLimiter: per-key (client IP, chat session) token buckets,
+  checked when a request arrives.
+- UpstreamGate / AsyncUpstreamGate: a per-process cap on concurrent
+  upstream calls with a bounded wait queue. Requests beyond the queue are
+  refused at once instead of piling up behind the model, so threads stay
+  free for cheap routes such as the landing page and daily wisdom.
+
+Refusals raise RateLimitedError, which routes turn into a 429 with a
+Retry-After header. State is per process, so with N workers the effective
+limits are N times the configured ones.
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+
+
+class RateLimitedError(Exception):
+    """Raised when a request is refused by a rate limit or the upstream queue"""
+
+    def __init__(self, retry_after, reason):
+        super().__init__(f"Too many requests ({reason}), retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class TokenBucketLimiter:
+    """Token bucket per key: `rate` requests per second, bursts up to `burst`.
+
+    Buckets live in an LRU of at most `max_keys`; an evicted key simply
+    starts again with a full bucket.
+    """
+
+    def __init__(self, name, rate=1.0, burst=10, max_keys=100000, enabled=True):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.enabled = enabled and rate > 0
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls, prefix, name, rate, burst):
+        """Build a limiter from <prefix>_* environment variables"""
+        return cls(
+            name=name,
+            rate=float(os.getenv(f'{prefix}_RATE', str(rate))),
+            burst=float(os.getenv(f'{prefix}_BURST', str(burst))),
+            max_keys=int(os.getenv(f'{prefix}_MAX_KEYS', '100000')),
+            enabled=os.getenv(f'{prefix}_ENABLED', '1') != '0'
+        )
+
+    def check(self, key):
+        """Take one token for `key`, or raise RateLimitedError"""
+        if not self.enabled or not key:
+            return
+        now = time.monotonic()
+        with self._lock:
+            tokens, stamp = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - stamp) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            else:
+                self.rejected += 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        if not allowed:
+            raise RateLimitedError((1 - tokens) / self.rate, self.name)
+
+    def stats(self):
+        with self._lock:
+            return {'keys': len(self._buckets), 'rejected': self.rejected}
+
+
+class _GateCounters:
+    """Bookkeeping shared by the thread and event-loop gates"""
+
+    def __init__(self, limit, queue, queue_timeout):
+        self.limit = limit
+        self.queue = queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self.rejected = {'queue_full': 0, 'queue_timeout': 0}
+        # Moving average of how long a call holds its slot, for Retry-After
+        self._hold = 1.0
+
+    def retry_after(self):
+        return max(1.0, self._hold * (self.waiting + 1) / self.limit)
+
+    def _full(self):
+        return self.active >= self.limit and self.waiting >= self.queue
+
+    def _free(self):
+        return self.active + self.waiting < self.limit
+
+    def _reject(self, reason):
+        self.rejected[reason] += 1
+        return RateLimitedError(self.retry_after(), reason)
+
+    def _released(self, held):
+        self.active -= 1
+        self._hold += 0.2 * (held - self._hold)
+
+    def stats(self):
+        return {
+            'limit': self.limit,
+            'active': self.active,
+            'waiting': self.waiting,
+            'rejected': dict(self.rejected)
+        }
+
+
+class UpstreamGate(_GateCounters):
+    """Cap on concurrent upstream calls for threaded workers.
+
+    At most `limit` calls run at once and `queue` more wait up to
+    `queue_timeout` seconds for a slot; anyone else is refused at once.
+    Keep limit + queue below the worker's thread count so some threads
+    are always free for requests that never call the model.
+    """
+
+    def __init__(self, limit=4, queue=2, queue_timeout=10.0):
+        super().__init__(limit, queue, queue_timeout)
+        self._slots = threading.Semaphore(limit)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, prefix='UPSTREAM', limit=4, queue=2, queue_timeout=10.0):
+        """Build a gate from <prefix>_* environment variables"""
+        return cls(
+            limit=int(os.getenv(f'{prefix}_CONCURRENCY', str(limit))),
+            queue=int(os.getenv(f'{prefix}_QUEUE', str(queue))),
+            queue_timeout=float(os.getenv(f'{prefix}_QUEUE_TIMEOUT', str(queue_timeout)))
+        )
+
+    def check(self):
+        """Raise RateLimitedError if a call could not even join the queue"""
+        with self._lock:
+            if self._full():
+                raise self._reject('queue_full')
+
+    def available(self):
+        """Whether a call could start now without queueing"""
+        with self._lock:
+            return self._free()
+
+    @contextmanager
+    def slot(self):
+        """Hold one upstream slot for the duration of the block"""
+        with self._lock:
+            if self._full():
+                raise self._reject('queue_full')
+            self.waiting += 1
+        acquired = self._slots.acquire(timeout=self.queue_timeout)
+        with self._lock:
+            self.waiting -= 1
+            if not acquired:
+                raise self._reject('queue_timeout')
+            self.active += 1
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._released(time.monotonic() - start)
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return super().stats()
+
+
+class AsyncUpstreamGate(_GateCounters):
+    """Event-loop counterpart of UpstreamGate.
+
+    With `queue_timeout` None a waiting call is bounded only by the
+    caller's own deadline (e.g. asyncio.wait_for around the route).
+    """
+
+    def __init__(self, limit=256, queue=512, queue_timeout=None):
+        super().__init__(limit, queue, queue_timeout)
+        self._slots = asyncio.Semaphore(limit)
+
+    def check(self):
+        if self._full():
+            raise self._reject('queue_full')
+
+    def available(self):
+        return self._free()
+
+    @asynccontextmanager
+    async def slot(self, timeout=None):
+        """Hold one upstream slot; `timeout` overrides queue_timeout for this wait"""
+        self.check()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout if timeout is not None else self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise self._reject('queue_timeout') from None
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._released(time.monotonic() - start)
+            self._slots.release()
+
+
+def retry_after_header(error):
+    """Whole seconds for a Retry-After header"""
+    return str(max(1, math.ceil(error.retry_after)))
@@ -1,46 +1,77 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, abort, g, render_template, request, jsonify, stream_with_context
 from flask_cors import CORS
 import os
+import time
 from dotenv import load_dotenv
-import anthropic
 import json
 import random
+import hashlib
+import threading
+import queue
+import sqlite3
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from content_pool import ContentPool
+from content_store import ContentStore
+from wisdom_cache import DailyWisdomCache
+from prompts import PROMPTS, ADVANCED_CATEGORIES, LESSON_LEVELS
+from regions import CULTURAL_REGIONS, REGIONS
+from chat_cache import ChatResponseCache, normalize_message
+from chat_sessions import ChatSessionStore
+import upstream
+from upstream import CircuitOpenError
+from token_budget import budgets, token_usage, estimate_tokens
+from metrics import metrics
+from static_assets import StaticAssets
+from admission import RateLimitedError, TokenBucketLimiter, UpstreamGate, retry_after_header
+from journal import RequestJournal, text_hash
 
 # Load environment variables
 load_dotenv()
 
-# Configure Flask to use current directory for templates and static files
+# Templates live in the current directory; static files are served only
+# from the STATIC_ASSETS allowlist below, never the directory itself
 app = Flask(__name__, 
             template_folder='.', 
-            static_folder='.')
+            static_folder=None)
 CORS(app)
 
-# Initialize Anthropic client with error handling
-try:
-    api_key = os.getenv('ANTHROPIC_API_KEY')
-    if not api_key:
-        print("Warning: ANTHROPIC_API_KEY not found in environment variables")
-        client = None
-    else:
-        client = anthropic.Anthropic(api_key=api_key)
-        print("Anthropic client initialized successfully")
-except Exception as e:
-    print(f"Error initializing Anthropic client: {e}")
-    client = None
-
-# Cultural data for AI responses
-CULTURAL_REGIONS = {
-    'київ': 'Київ - мати міст руських - живе у вашому серці. Ви з столиці, що тисячу років була центром української духовності.',
-    'львів': 'Львівська земля наділила вас духом свободи та культурної гордості. Ви з міста лева, де кожен камінь дихає історією.',
-    'харків': 'Харківщина дала вам силу інтелекту та стійкості. Ви з краю, що подарував світу багато геніїв.',
-    'одеса': 'Одеський гумор та життєлюбність - це частина вашої душі. Море вольності тече у ваших венах.',
-    'дніпро': 'Дніпро-батько благословив вас силою та незламністю. Ви з краю, де ковалася українська незалежність.',
-    'полтава': 'Полтавщина наділила вас мелодійністю мови та мудрістю землі. Ви з краю Гоголя та народних пісень.',
-    'галичина': 'Галицька земля - це ваша духовна батьківщина. Кожна гора Карпат пам\'ятає ваші корені.',
-    'волинь': 'Волинська земля дала вам силу духу та вірність традиціям. Ви з краю древніх лісів та чистих джерел.',
-    'закарпаття': 'Карпатські вершини навчили вас стійкості та гордості. Ви з краю, де небо торкається землі.',
-    'чернігів': 'Чернігівщина наділила вас мудрістю віків та спокійною силою. Ви з краю древніх курганів.'
-}
+# Behind N reverse proxies, take the client address from X-Forwarded-For so
+# rate limits apply per visitor rather than per proxy
+TRUSTED_PROXIES = int(os.getenv('TRUSTED_PROXIES', '0'))
+
+def client_address(remote_addr, forwarded_for):
+    """The visitor's address, shared by the WSGI and ASGI apps.
+
+    With TRUSTED_PROXIES set, it is the entry that many hops from the right
+    of X-Forwarded-For (what the nearest trusted proxy saw), as Werkzeug's
+    ProxyFix resolves it; a shorter header means the request bypassed a
+    proxy, so the peer address is used.
+    """
+    if TRUSTED_PROXIES and forwarded_for:
+        hops = [hop.strip() for hop in forwarded_for.split(',')]
+        if len(hops) >= TRUSTED_PROXIES:
+            return hops[-TRUSTED_PROXIES]
+    return remote_addr
+
+# The Anthropic client (and the SDK behind it) is built on first use or by
+# the warm-up in start_background_tasks(), not at import, so workers start
+# fast and the landing page, static files and fallback quotes never wait on it
+api_key = os.getenv('ANTHROPIC_API_KEY')
+if not api_key:
+    print("Warning: ANTHROPIC_API_KEY not found in environment variables")
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """The shared Anthropic client, built on first call"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = upstream.build_client(api_key)
+                print("Anthropic client initialized successfully")
+    return _client
 
 WISDOM_QUOTES = [
     "\"Україна - це не просто країна, це стан душі\" - Тарас Шевченко",
@@ -52,21 +83,747 @@ WISDOM_QUOTES = [
     "\"Встань, Україно, встань і йди!\" - Павло Тичина"
 ]
 
+MODEL_NAME = "claude-3-5-sonnet-20241022"
+
+# Mark long chat histories for the API's prompt cache. Prefixes shorter than
+# the model's minimum (1024 tokens for Sonnet, 2048 for Haiku) are not cached
+# upstream; the system prompts alone are a few hundred tokens, so only a
+# session's history ever gets long enough
+PROMPT_CACHING = os.getenv('PROMPT_CACHING', '1') != '0'
+PROMPT_CACHE_MIN_TOKENS = int(os.getenv('PROMPT_CACHE_MIN_TOKENS', '1024'))
+EPHEMERAL = {"type": "ephemeral"}
+
+# Pre-generated lessons and region reflections, refilled in the background
+lesson_pool = ContentPool.from_env()
+
+# Responses shared by all worker processes: the catalogue rendered offline by
+# batch_generate.py plus whatever the pools generate at runtime
+content_store = ContentStore.from_env()
+
+# Answers to repeated chat questions, keyed on the normalised message
+chat_cache = ChatResponseCache.from_env()
+
+# Per-session chat history for multi-turn conversations
+chat_sessions = ChatSessionStore.from_env()
+
+# Request rate limits for model-backed routes, per client address and per chat session
+client_limiter = TokenBucketLimiter.from_env('RATE_LIMIT_CLIENT', 'client', rate=0.5, burst=10)
+session_limiter = TokenBucketLimiter.from_env('RATE_LIMIT_SESSION', 'session', rate=0.2, burst=5)
+
+# Concurrent model calls per worker process, with a short bounded wait queue
+upstream_gate = UpstreamGate.from_env()
+
+# Model calls no request depends on (pool refills, daily wisdom, stale
+# refreshes, batch lessons) queue on their own gate, so they never take a
+# slot from a request that has nothing else to serve. Pool refills and
+# daily wisdom alone can hold 3 slots; the 4th keeps stale refreshes from
+# always waiting out STALE_DEADLINE behind them
+background_gate = UpstreamGate.from_env('UPSTREAM_BACKGROUND', limit=4, queue=8, queue_timeout=30)
+
+# Append-only journal of API requests, read back by replay_journal.py
+journal = RequestJournal.from_env()
+
+# Serve-stale mode: when a model call for a key that has answered before
+# fails or takes longer than STALE_DEADLINE seconds, the last good answer
+# (kept in content_store) is returned and the call finishes in the background
+SERVE_STALE = os.getenv('SERVE_STALE', '1') != '0'
+STALE_DEADLINE = float(os.getenv('STALE_DEADLINE', '8'))
+stale_executor = ThreadPoolExecutor(max_workers=int(os.getenv('STALE_WORKERS', '8')),
+                                    thread_name_prefix='stale-refresh')
+# A call covered by a fallback holds a request thread while it relays, so
+# at most background_gate.limit of them run at once (see claim_relay())
+stale_relays = threading.BoundedSemaphore(background_gate.limit)
+# Last good answers are written by one thread, off the request path
+store_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='content-store-writer')
+
+# Batch lesson fetches: catalogue lessons that are neither stored nor pooled
+# are generated at most LESSON_BATCH_WORKERS at a time per worker process
+LESSON_BATCH_MAX = int(os.getenv('LESSON_BATCH_MAX', '12'))
+LESSON_BATCH_WORKERS = int(os.getenv('LESSON_BATCH_WORKERS', '3'))
+lesson_batch_executor = ThreadPoolExecutor(max_workers=LESSON_BATCH_WORKERS,
+                                           thread_name_prefix='lesson-batch')
+
+# The only files under /static/; everything else in the directory stays private
+STATIC_ASSETS = ('mui.png',)
+
+# Landing page and assets, rendered, compressed and hashed once per process
+static_assets = StaticAssets.from_env()
+for asset_name in STATIC_ASSETS:
+    static_assets.add_file(asset_name, os.path.join(app.root_path, asset_name))
+with app.app_context():
+    static_assets.add('index.html', render_template('index.html', asset_url=static_assets.url),
+                      cache_control='no-cache')
+
 def check_anthropic_client():
     """Check if Anthropic client is available"""
-    if client is None:
+    if not api_key:
         return False, "Anthropic API недоступний. Будь ласка, перевірте налаштування API ключа."
     return True, None
 
+def message_params(prompt, max_tokens, temperature, system=None, history=()):
+    """Keyword arguments for messages.create()/stream() for one user turn"""
+    params = {
+        'model': MODEL_NAME,
+        'max_tokens': max_tokens,
+        'temperature': temperature,
+        'messages': [*history, {"role": "user", "content": prompt}]
+    }
+    if system:
+        params['system'] = system
+    if PROMPT_CACHING:
+        add_cache_breakpoints(params, system, history)
+    return params
+
+def add_cache_breakpoints(params, system, history):
+    """Mark the chat history as cacheable once the prefix is long enough.
+
+    The breakpoint covers the system prompt and everything before the new
+    user turn, so each follow-up in a session reads the previous turns from
+    the cache.
+    """
+    if not history:
+        return
+    prefix_tokens = estimate_tokens(system) if system else 0
+    prefix_tokens += sum(estimate_tokens(message['content']) for message in history)
+    if prefix_tokens >= PROMPT_CACHE_MIN_TOKENS:
+        last = history[-1]
+        params['messages'][len(history) - 1] = {
+            "role": last['role'],
+            "content": [{"type": "text", "text": last['content'], "cache_control": EPHEMERAL}]
+        }
+
+def messages_api(api_client, params):
+    """The prompt-caching endpoint when `params` carry cache breakpoints"""
+    cached = any(isinstance(message['content'], list) for message in params['messages'])
+    return api_client.beta.prompt_caching.messages if cached else api_client.messages
+
+def generate_text(prompt, route, prompt_key=None, temperature=0.8, coalesce=True, system=None, history=(),
+                  gate=None):
+    """Run a blocking model call (with retries and circuit breaker) and return the text.
+
+    `max_tokens` comes from the token budget for `route`/`prompt_key`, and
+    the output tokens actually used are recorded against the route.
+    Identical concurrent calls on the same gate share one upstream request
+    unless `coalesce` is False, as for pool refills that must produce a
+    fresh variant.
+    `system` and `history` carry the chat instructions and earlier turns.
+    The call waits for a slot on `gate`, upstream_gate unless given.
+    """
+    max_tokens = budgets.for_prompt(route, prompt_key)
+    params = message_params(prompt, max_tokens, temperature, system, history)
+    gate = gate or upstream_gate
+
+    def call():
+        with gate.slot():
+            start = time.perf_counter()
+            try:
+                message = upstream.call(lambda: messages_api(get_client(), params).create(**params))
+            except CircuitOpenError as e:
+                metrics.observe_upstream(route, None, e)
+                raise
+            except Exception as e:
+                metrics.observe_upstream(route, time.perf_counter() - start, e)
+                raise
+            metrics.observe_upstream(route, time.perf_counter() - start)
+        token_usage.record(route, message.usage, max_tokens, message.stop_reason)
+        journal.note_usage(message.usage)
+        return message.content[0].text
+
+    # Follow-up turns depend on their session's history, so only
+    # first turns are worth coalescing
+    if not coalesce or history:
+        return call()
+    # Callers only share a flight queued on their own gate, so a foreground
+    # request never waits behind a background-queued leader
+    return upstream.coalescer.do((gate, MODEL_NAME, system, prompt, temperature, max_tokens), call)
+
+def upstream_unavailable(error):
+    """Fail fast while the circuit breaker is open"""
+    response = jsonify({
+        'error': 'Сервіс тимчасово перевантажений. Будь ласка, спробуйте трохи пізніше.',
+        'success': False
+    })
+    response.headers['Retry-After'] = str(max(1, int(error.retry_after)))
+    return response, 503
+
+def rate_limited(error):
+    """Refuse a request over its rate limit or beyond the upstream queue"""
+    response = jsonify({
+        'error': 'Забагато запитів. Будь ласка, зачекайте трохи і спробуйте знову.',
+        'success': False
+    })
+    response.headers['Retry-After'] = retry_after_header(error)
+    return response, 429
+
+def content_key(text):
+    """Short store key for free-form prompts (stories, custom topics)"""
+    return hashlib.sha256(text.encode()).hexdigest()[:32]
+
+def last_good(endpoint, key):
+    """The most recent good response stored for `key`, or None"""
+    if not SERVE_STALE or key is None:
+        return None
+    try:
+        return content_store.last_good(endpoint, key)
+    except sqlite3.Error as e:
+        print(f"Last good {endpoint} response unavailable: {e}")
+        return None
+
+def remember(endpoint, key, text):
+    """Keep `text` as the last good response for `key`, in the background"""
+    if SERVE_STALE and key is not None:
+        try:
+            store_writer.submit(keep_last_good, endpoint, key, text)
+        except RuntimeError:
+            # A refresh that outlived the process's shutdown
+            pass
+
+def keep_last_good(endpoint, key, text):
+    # Best effort: a locked store costs a future fallback, never an answer
+    try:
+        content_store.keep(endpoint, key, text)
+    except sqlite3.Error as e:
+        print(f"Could not keep last good {endpoint} response: {e}")
+
+def skip_upstream(gate, relay_gate):
+    """Why a call covered by a fallback should not start at all, or None.
+
+    Such a call never queues: if the breaker is open, `gate` would refuse
+    the request or `relay_gate` has no free slot, the fallback is served at
+    once instead of holding a worker thread until STALE_DEADLINE.
+    """
+    try:
+        upstream.breaker.check()
+        gate.check()
+    except CircuitOpenError:
+        return 'circuit_open'
+    except RateLimitedError as e:
+        return e.reason
+    if not relay_gate.available():
+        return 'background_busy'
+    return None
+
+def claim_relay():
+    """Take a stale_relays slot for a call covered by a fallback.
+
+    Returns None once claimed, to be released when the call ends, else why
+    the fallback should be served at once instead.
+    """
+    reason = skip_upstream(upstream_gate, background_gate)
+    if reason is None and not stale_relays.acquire(blocking=False):
+        reason = 'relays_busy'
+    return reason
+
+def served_stale(endpoint, reason):
+    print(f"Serving stale {endpoint} response ({reason})")
+    metrics.inc('stale_responses_total', (('route', endpoint),))
+
+def serve_stale(endpoint, key, fallback, produce, gate=None):
+    """Return (text, stale) for a blocking model call made by `produce(gate)`.
+
+    Without a `fallback` the call runs inline through `gate` (upstream_gate
+    unless given). With one, the fallback is returned at once unless
+    claim_relay() succeeds; then the call runs on stale_executor through
+    background_gate, and if it fails or misses STALE_DEADLINE the fallback
+    is returned while a late result still replaces it.
+    """
+    journal.note_key(endpoint, key)
+    if fallback is None:
+        text = produce(gate or upstream_gate)
+        remember(endpoint, key, text)
+        return text, False
+
+    reason = claim_relay()
+    if reason is not None:
+        served_stale(endpoint, reason)
+        return fallback, True
+
+    def finished(future):
+        stale_relays.release()
+        if future.exception() is None:
+            remember(endpoint, key, future.result())
+
+    try:
+        # In the request's context, so the call's tokens are journalled with it
+        future = stale_executor.submit(contextvars.copy_context().run, produce, background_gate)
+    except RuntimeError:
+        stale_relays.release()
+        raise
+    future.add_done_callback(finished)
+    try:
+        return future.result(timeout=STALE_DEADLINE), False
+    except Exception as e:
+        served_stale(endpoint, upstream.error_class(e))
+        return fallback, True
+
+def content_response(payload, stale=False):
+    """JSON response, tagged when it carries a stale fallback"""
+    if not stale:
+        return jsonify(payload)
+    response = jsonify({**payload, 'stale': True})
+    response.headers['X-Content-Stale'] = '1'
+    return response
+
+def admit(session_id=None):
+    """Charge the request to its client's (and chat session's) rate limit"""
+    client_limiter.check(client_address(request.remote_addr, request.headers.get('X-Forwarded-For')))
+    session_limiter.check(session_id)
+
+# Daily wisdom is generated once per calendar day and persisted across restarts
+wisdom_cache = DailyWisdomCache(
+    producer=lambda: generate_text(PROMPTS.render('wisdom'), 'daily-wisdom', gate=background_gate),
+    fallback=WISDOM_QUOTES,
+    path=os.getenv('WISDOM_CACHE_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'daily_wisdom.json')),
+    default_tz=os.getenv('WISDOM_TIMEZONE', 'Europe/Kyiv')
+)
+
+def start_background_tasks():
+    """Build the model client and warm caches that make model calls, off the request path.
+
+    Under gunicorn this runs in each worker after fork (see gunicorn.conf.py),
+    so the preloaded master never opens upstream connections that forked
+    workers would inherit.
+    """
+    if not api_key:
+        return
+
+    def warm():
+        try:
+            get_client()
+        except Exception as e:
+            print(f"Error initializing Anthropic client: {e}")
+            return
+        wisdom_cache.warm()
+
+    threading.Thread(target=warm, name='warm-up', daemon=True).start()
+
+if not os.getenv('APP_MANAGED_STARTUP'):
+    start_background_tasks()
+
+def wants_stream(data):
+    """Clients opt into streaming with {"stream": true} or an SSE Accept header"""
+    if data and data.get('stream'):
+        return True
+    return 'text/event-stream' in request.headers.get('Accept', '')
+
+def sse_event(payload, event=None):
+    """Format one Server-Sent Event frame"""
+    frame = f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+    if event:
+        frame = f"event: {event}\n{frame}"
+    return frame
+
+def stream_text(prompt, route, prompt_key=None, temperature=0.8, on_complete=None, system=None, history=(),
+                stale_key=None, fallback=None):
+    """Stream model output to the client as Server-Sent Events.
+
+    Each text delta is sent as a `data: {"text": ...}` frame, followed by a
+    final `done` event (or an `error` event if the upstream call fails).
+    `on_complete` is called with the full text once the stream finishes,
+    and the text is kept as the last good response for `stale_key`.
+    Raises CircuitOpenError or RateLimitedError up front so the route can
+    answer with a 503 or 429 instead of a stream that fails at once.
+
+    With a `fallback` the stream is the fallback itself unless
+    claim_relay() succeeds; then the call goes through background_gate and
+    relay_or_fallback() enforces STALE_DEADLINE on the first token.
+    """
+    journal.note_key(route, stale_key)
+    if fallback is None:
+        upstream.breaker.check()
+        upstream_gate.check()
+    else:
+        reason = claim_relay()
+        if reason is not None:
+            return sse_response(stale_frames(route, fallback, reason, on_complete))
+    gate = upstream_gate if fallback is None else background_gate
+    max_tokens = budgets.for_prompt(route, prompt_key)
+    params = message_params(prompt, max_tokens, temperature, system, history)
+    # Set once the client has been sent the fallback instead of this stream
+    superseded = threading.Event()
+
+    def generate():
+        # Flush a comment frame right away so proxies and the browser see
+        # the first byte before the model starts producing tokens
+        yield ": stream-start\n\n"
+        start = None
+        probe = False
+        try:
+            with gate.slot():
+                probe = upstream.breaker.before_call()
+                start = time.perf_counter()
+                with messages_api(get_client(), params).stream(**params) as stream:
+                    chunks = []
+                    for text in stream.text_stream:
+                        chunks.append(text)
+                        yield sse_event({'text': text})
+                    message = stream.get_final_message()
+            upstream.record_outcome()
+            metrics.observe_upstream(route, time.perf_counter() - start)
+            token_usage.record(route, message.usage, max_tokens, message.stop_reason)
+            journal.note_usage(message.usage)
+            journal.note(stream=True, response_hash=text_hash(''.join(chunks)))
+            remember(route, stale_key, ''.join(chunks))
+            if on_complete is not None and not superseded.is_set():
+                on_complete(''.join(chunks))
+            yield sse_event({'success': True}, event='done')
+        except RateLimitedError as e:
+            yield sse_event({'error': f'Помилка: {str(e)}', 'success': False}, event='error')
+        except CircuitOpenError as e:
+            metrics.observe_upstream(route, None, e)
+            yield sse_event({'error': f'Помилка: {str(e)}', 'success': False}, event='error')
+        except Exception as e:
+            upstream.record_outcome(e)
+            metrics.observe_upstream(route, time.perf_counter() - start if start else None, e)
+            yield sse_event({'error': f'Помилка: {str(e)}', 'success': False}, event='error')
+        finally:
+            # A client that disconnects mid-stream leaves no verdict
+            if probe:
+                upstream.breaker.abandon_probe()
+
+    frames = generate()
+    if fallback is not None:
+        frames = relay_or_fallback(frames, route, fallback, superseded, on_complete, stale_relays.release)
+    return sse_response(frames)
+
+def sse_response(frames):
+    return Response(
+        stream_with_context(frames),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+def stale_frames(endpoint, fallback, reason, on_stale=None):
+    """Answer a stream with its fallback: one text frame and a stale `done` event"""
+    served_stale(endpoint, reason)
+    journal.note(stream=True, stale=True, response_hash=text_hash(fallback))
+    if on_stale is not None:
+        on_stale(fallback, True)
+    yield sse_event({'text': fallback})
+    yield sse_event({'success': True, 'stale': True}, event='done')
+
+def relay_or_fallback(frames, endpoint, fallback, superseded, on_stale=None, on_finish=None):
+    """Relay SSE `frames` from a stale_executor thread, or send `fallback` instead.
+
+    The streaming counterpart of serve_stale(): if the stream fails or sends
+    no text within STALE_DEADLINE, the client gets the fallback as one text
+    frame and a stale `done` event, and the stream keeps running in the
+    background so its answer replaces the fallback. `on_stale` is called
+    with the fallback in place of the stream's on_complete, and `on_finish`
+    once the stream has ended. The stream starts right away rather than
+    when the response is first read, so `on_finish` runs even if it never is.
+    """
+    deadline = time.monotonic() + STALE_DEADLINE
+    relayed = queue.Queue()
+
+    def pump():
+        try:
+            for frame in frames:
+                relayed.put(frame)
+        finally:
+            relayed.put(None)
+            if on_finish is not None:
+                on_finish()
+
+    try:
+        # In the request's context, so the call's tokens are journalled with it
+        stale_executor.submit(contextvars.copy_context().run, pump)
+    except RuntimeError:
+        if on_finish is not None:
+            on_finish()
+        raise
+    return relayed_frames(relayed, deadline, endpoint, fallback, superseded, on_stale)
+
+def relayed_frames(relayed, deadline, endpoint, fallback, superseded, on_stale):
+    """The frames relay_or_fallback() sends the client, read from `relayed`"""
+    yield ": stream-start\n\n"
+
+    while True:
+        try:
+            frame = relayed.get(timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Empty:
+            frame, reason = None, 'no token in time'
+            break
+        reason = 'stream failed'
+        # Skip the stream's own comment frames while waiting for the first token
+        if frame is None or not frame.startswith(':'):
+            break
+    if frame is None or frame.startswith('event: error'):
+        superseded.set()
+        yield from stale_frames(endpoint, fallback, reason, on_stale)
+        return
+
+    while frame is not None:
+        yield frame
+        frame = relayed.get()
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+    if request.path.startswith('/api/') and app.config.get('REQUEST_METRICS', True):
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        g.journal_entry = journal.begin(route, request.method, request.get_json(silent=True),
+                                        request.query_string.decode())
+
+@app.after_request
+def record_request(response):
+    """Time and journal every request; streamed responses are timed until the stream closes"""
+    start = g.get('request_start')
+    if start is not None and app.config.get('REQUEST_METRICS', True):
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        method, status = request.method, response.status_code
+        entry = g.get('journal_entry')
+        body = None if entry is None or response.is_streamed else response.get_data()
+
+        def finished():
+            latency = time.perf_counter() - start
+            metrics.observe_request(route, method, status, latency)
+            journal.finish(entry, status, latency, body)
+
+        response.call_on_close(finished)
+    return response
+
+@metrics.collector
+def collect_component_stats():
+    """Export the counters caches and the token ledger already keep"""
+    samples = []
+    pool, cache, flights = lesson_pool.stats(), chat_cache.stats(), upstream.coalescer.stats()
+    store = content_store.stats()
+    for cache_name, result, value in (
+        ('content_store', 'hit', store['hits']),
+        ('content_store', 'miss', store['misses']),
+        ('lesson_pool', 'hit', pool['hits']),
+        ('lesson_pool', 'miss', pool['misses']),
+        ('chat', 'hit', cache['hits']),
+        ('chat', 'near_hit', cache['near_hits']),
+        ('chat', 'miss', cache['misses']),
+        ('single_flight', 'shared', flights['calls_saved']),
+        ('single_flight', 'leader', flights['upstream_calls'])
+    ):
+        samples.append(('cache_lookups_total', 'counter', (('cache', cache_name), ('result', result)), value))
+    samples.append(('chat_cache_entries', 'gauge', (), cache['entries']))
+    samples.append(('lesson_pool_entries', 'gauge', (), pool['entries']))
+    sessions = chat_sessions.stats()
+    samples.append(('chat_sessions', 'gauge', (), sessions['sessions']))
+    samples.append(('chat_sessions_bytes', 'gauge', (), sessions['bytes']))
+    for route, usage in token_usage.stats().items():
+        samples.append(('tokens_total', 'counter', (('route', route), ('direction', 'input')), usage['input_tokens']))
+        samples.append(('tokens_total', 'counter', (('route', route), ('direction', 'output')), usage['output_tokens']))
+        samples.append(('tokens_total', 'counter', (('route', route), ('direction', 'cache_read')), usage['cache_read_tokens']))
+        samples.append(('tokens_total', 'counter', (('route', route), ('direction', 'cache_write')), usage['cache_write_tokens']))
+        samples.append(('truncated_responses_total', 'counter', (('route', route),), usage['truncated']))
+    # Tokens of model calls no journalled request was waiting on
+    for direction, value in journal.stats()['unattributed_tokens'].items():
+        if direction != 'calls':
+            samples.append(('journal_unattributed_tokens_total', 'counter', (('direction', direction),), value))
+    samples.append(('upstream_circuit_open', 'gauge', (), int(upstream.breaker.state != 'closed')))
+    samples.append(('upstream_circuit_trips_total', 'counter', (), upstream.breaker.trips))
+    samples.append(('admission_rejected_total', 'counter', (('reason', 'client_limit'),), client_limiter.stats()['rejected']))
+    samples.append(('admission_rejected_total', 'counter', (('reason', 'session_limit'),), session_limiter.stats()['rejected']))
+    samples.extend(gate_samples('thread', upstream_gate.stats()))
+    samples.extend(gate_samples('background', background_gate.stats()))
+    return samples
+
+def gate_samples(gate_name, gate):
+    """Metric samples for an upstream gate's stats()"""
+    label = ('gate', gate_name)
+    samples = [
+        ('upstream_active_calls', 'gauge', (label,), gate['active']),
+        ('upstream_queued_calls', 'gauge', (label,), gate['waiting'])
+    ]
+    for reason, value in gate['rejected'].items():
+        samples.append(('admission_rejected_total', 'counter', (('reason', reason), label), value))
+    return samples
+
+def reflection_prompt(user_story):
+    """Return (pool_key, system, prompt) for the cultural reflection on a user story.
+
+    Stories that mention a region get the shorter regional prompt with the
+    region's note. Stories that say nothing beyond one region share a
+    pooled reflection per region, so only they get a pool key.
+    """
+    match = REGIONS.match(user_story)
+    if match is None:
+        return None, PROMPTS.render('reflection', 'system'), PROMPTS.render('reflection', user_story=user_story)
+
+    system = PROMPTS.render('reflection', 'regional_system')
+    region_names = ', '.join(REGIONS.display_name(region) for region in match.regions)
+    region_note = ' '.join(CULTURAL_REGIONS[region] for region in match.regions)
+    if match.region_only:
+        region = match.regions[0]
+        return ('reflect', 'region', region), system, PROMPTS.render(
+            'reflection', 'region_only', region=region_names, region_note=region_note)
+    return None, system, PROMPTS.render(
+        'reflection', 'regional', region=region_names, region_note=region_note, user_story=user_story)
+
+def lesson_prompt(lesson_type, user_level):
+    """Return (lesson_type, user_level, prompt), falling back to the first level's language lesson.
+
+    Both values end up in the pool key, so unknown ones must not create keys.
+    """
+    if not PROMPTS.has('lesson', lesson_type):
+        lesson_type = 'language'
+    if user_level not in LESSON_LEVELS:
+        user_level = LESSON_LEVELS[0]
+    return lesson_type, user_level, PROMPTS.render('lesson', lesson_type, user_level)
+
+def advanced_lesson_prompt(category, subcategory, subcategory_name):
+    """Return (pool_key, system, prompt) for an advanced lesson.
+
+    Catalogue lessons are a single fixed prompt with no system part.
+    Free-form topics depend on client input, so their pool key is None.
+    """
+    if PROMPTS.has(category, subcategory) and category in ADVANCED_CATEGORIES:
+        return ('advanced', category, subcategory), None, PROMPTS.render(category, subcategory)
+    
+    return None, PROMPTS.render('advanced_fallback', 'system'), PROMPTS.render(
+        'advanced_fallback', topic=subcategory_name, topic_category=category)
+
+def pooled_content(endpoint, pool_key, producer):
+    """Serve a response from the shared store, else from this worker's pool.
+
+    Pool refills are written through to the store, so once a key has
+    enough variants every worker serves it without generating its own.
+    With `producer` None the lookup is read-only: a pooled response is
+    peeked at rather than used up, and nothing is generated or refilled.
+    """
+    store_key = ':'.join(pool_key)
+    journal.note_key(endpoint, store_key)
+    text = content_store.random(endpoint, store_key)
+    if text is not None:
+        return text
+
+    if producer is None:
+        return lesson_pool.peek(pool_key)
+
+    def produce():
+        text = producer()
+        content_store.add(endpoint, store_key, text)
+        return text
+
+    return lesson_pool.take(pool_key, produce)
+
+def batch_lesson_spec(item):
+    """Return (endpoint, pool_key, budget_key, prompt) for a batch item, or None.
+
+    Items are {"type", "level"} for basic lessons or {"category",
+    "subcategory"} for advanced ones. Free-form topics are not batched, and
+    unlike /api/lesson an unknown type or level is not mapped to a default.
+    """
+    if not isinstance(item, dict):
+        return None
+    category, subcategory = item.get('category'), item.get('subcategory')
+    if isinstance(category, str) and isinstance(subcategory, str):
+        pool_key, _, prompt = advanced_lesson_prompt(category, subcategory, subcategory)
+        if pool_key is None:
+            return None
+        return 'advanced-lesson', pool_key, ':'.join(pool_key), prompt
+    lesson_type, user_level = item.get('type'), item.get('level', LESSON_LEVELS[0])
+    if isinstance(lesson_type, str) and PROMPTS.has('lesson', lesson_type) and user_level in LESSON_LEVELS:
+        lesson_type, user_level, prompt = lesson_prompt(lesson_type, user_level)
+        return 'lesson', ('lesson', lesson_type, user_level), f'lesson:{lesson_type}', prompt
+    return None
+
+def cached_lesson(spec, refill=True):
+    """A stored or pooled lesson for a batch item, or None.
+
+    Without `refill` the lookup is read-only (see pooled_content()).
+    """
+    endpoint, pool_key, budget_key, prompt = spec
+    if not refill:
+        return pooled_content(endpoint, pool_key, None)
+    return pooled_content(endpoint, pool_key, lambda: generate_text(
+        prompt, endpoint, budget_key, coalesce=False, gate=background_gate))
+
+def generated_lesson(spec):
+    """Return (text, stale) for a batch item that had to be generated"""
+    endpoint, pool_key, budget_key, prompt = spec
+    stale_key = ':'.join(pool_key)
+    return serve_stale(endpoint, stale_key, last_good(endpoint, stale_key), lambda gate: generate_text(
+        prompt, endpoint, budget_key, gate=gate), background_gate)
+
+def batch_lesson_result(text, stale=False):
+    result = {'lesson': text, 'success': True}
+    if stale:
+        result['stale'] = True
+    return result
+
+# A prefetched lesson that is neither stored nor pooled yet
+PREFETCH_MISS = {'error': 'Урок ще не підготовлено', 'missing': True, 'success': False}
+
+def batch_lesson_error(error):
+    """Per-lesson error entry, worded like the matching single-lesson response"""
+    if isinstance(error, RateLimitedError):
+        return {'error': 'Забагато запитів. Будь ласка, зачекайте трохи і спробуйте знову.',
+                'retry_after': int(retry_after_header(error)), 'success': False}
+    if isinstance(error, CircuitOpenError):
+        return {'error': 'Сервіс тимчасово перевантажений. Будь ласка, спробуйте трохи пізніше.',
+                'retry_after': max(1, int(error.retry_after)), 'success': False}
+    return {'error': f'Помилка: {str(error)}', 'success': False}
+
+def chat_prompt(user_message):
+    """Return (system, prompt) for a chat turn"""
+    return PROMPTS.render('chat', 'system'), PROMPTS.render('chat', user_message=user_message)
+
+def serve_asset(name):
+    status, body, headers = static_assets.response(
+        name,
+        accept_encoding=request.headers.get('Accept-Encoding'),
+        if_none_match=request.headers.get('If-None-Match'),
+        version=request.args.get('v')
+    )
+    return Response(body, status=status, headers=headers)
+
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return serve_asset('index.html')
 
 @app.route('/static/<path:filename>')
 def static_files(filename):
-    """Serve static files from the current directory"""
-    from flask import send_from_directory
-    return send_from_directory('.', filename)
+    """Serve allowlisted static assets"""
+    if filename not in STATIC_ASSETS:
+        abort(404)
+    return serve_asset(filename)
+
+@app.route('/api/stats')
+def stats():
+    """Cache, pool and upstream counters for this worker process"""
+    return jsonify({
+        'lesson_pool': lesson_pool.stats(),
+        'content_store': content_store.stats(),
+        'chat_cache': chat_cache.stats(),
+        'chat_sessions': chat_sessions.stats(),
+        'single_flight': upstream.coalescer.stats(),
+        'token_usage': token_usage.stats(),
+        'circuit_breaker': {'state': upstream.breaker.state, 'trips': upstream.breaker.trips},
+        'admission': {
+            'upstream': upstream_gate.stats(),
+            'background': background_gate.stats(),
+            'client_limit': client_limiter.stats(),
+            'session_limit': session_limiter.stats()
+        },
+        'journal': journal.stats()
+    })
+
+@app.route('/api/ready')
+def readiness():
+    """Readiness probe: 200 once the model client is loaded, with cache warmth alongside"""
+    client_ready = not api_key or _client is not None
+    return jsonify({
+        'ready': client_ready,
+        'client': _client is not None,
+        'daily_wisdom': wisdom_cache.ready(),
+        'lesson_pool_entries': lesson_pool.stats()['entries'],
+        'content_store_keys': content_store.stats()['keys']
+    }), 200 if client_ready else 503
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Request, upstream, token and cache metrics for this worker process"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/api/reflect', methods=['POST'])
 def generate_reflection():
@@ -82,40 +839,38 @@ def generate_reflection():
         if not user_story:
             return jsonify({'error': 'Будь ласка, розкажіть про себе'}), 400
         
-        # Create AI prompt for cultural reflection
-        prompt = f"""
-        Ти - мудрий наставник української культури та ідентичності. Користувач розповів свою особисту історію. 
-        Твоє завдання - створити глибоке, емоційне відображення їхнього зв'язку з Україною.
+        admit()
         
-        Історія користувача: "{user_story}"
+        pool_key, system, prompt = reflection_prompt(user_story)
         
-        Створи персоналізовану відповідь (250-400 слів) ТІЛЬКИ УКРАЇНСЬКОЮ МОВОЮ, що включає:
-        1. Теплий, емоційний тон
-        2. Зв'язок з українською культурою, традиціями, історією
-        3. Персональні деталі з їхньої історії
-        4. Використання символів (соняшник 🌻, тризуб, калина, вишиванка)
-        5. Підтвердження їхньої української ідентичності
-        6. Натхнення та гордість
+        # Stories that only name a region share pre-generated reflections
+        if pool_key is not None:
+            reflection = pooled_content('reflect', pool_key, lambda: generate_text(
+                prompt, 'reflect', system=system, coalesce=False, gate=background_gate))
+            if reflection is not None:
+                return jsonify({
+                    'reflection': reflection,
+                    'success': True
+                })
         
-        Почни з "💙" і зроби відповідь душевною, особистою та надихаючою.
-        """
+        stale_key = content_key(prompt)
+        fallback = last_good('reflect', stale_key)
         
-        message = client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=1000,
-            temperature=0.8,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
-        )
+        if wants_stream(data):
+            return stream_text(prompt, 'reflect', system=system, stale_key=stale_key, fallback=fallback)
         
-        reflection = message.content[0].text
+        reflection, stale = serve_stale('reflect', stale_key, fallback, lambda gate: generate_text(
+            prompt, 'reflect', system=system, gate=gate))
         
-        return jsonify({
+        return content_response({
             'reflection': reflection,
             'success': True
-        })
+        }, stale)
         
+    except RateLimitedError as e:
+        return rate_limited(e)
+    except CircuitOpenError as e:
+        return upstream_unavailable(e)
     except Exception as e:
         return jsonify({
             'error': f'Помилка: {str(e)}',
@@ -132,61 +887,35 @@ def get_lesson():
         
         data = request.json
         lesson_type = data.get('type', '')
-        user_level = data.get('level', 'початковий')
-        
-        lesson_prompts = {
-            'language': f"""
-            Створи урок української мови для {user_level} рівня. Включи:
-            1. 5 красивих українських слів з поясненням
-            2. 2-3 корисні фрази
-            3. Українське прислів'я з поясненням
-            4. Короткий вірш або пісню
-            Використай емоційний підхід та культурний контекст. Тільки українською мовою.
-            """,
-            'history': f"""
-            Розкажи захоплюючу історичну історію з української історії для {user_level} рівня:
-            1. Виберіть цікавий період або особистість
-            2. Розкажіть як захоплюючу розповідь
-            3. Поясніть значення для сучасної України
-            4. Додайте емоційний зв'язок
-            Тільки українською мовою, 300-400 слів.
-            """,
-            'culture': f"""
-            Поділися українською культурною традицією для {user_level} рівня:
-            1. Виберіть свято, обряд або традицію
-            2. Поясніть історію та значення
-            3. Як це практикувати сьогодні
-            4. Чому це важливо для ідентичності
-            Тільки українською мовою, з емоційним підходом.
-            """,
-            'folklore': f"""
-            Розказжи українську народну казку або легенду для {user_level} рівня:
-            1. Виберіть менш відому, але цікаву історію
-            2. Розкажіть живо та захоплююче
-            3. Поясніть мораль та культурне значення
-            4. Зв'яжіть з сучасним життям
-            Тільки українською мовою.
-            """
-        }
+        user_level = data.get('level', LESSON_LEVELS[0])
         
-        prompt = lesson_prompts.get(lesson_type, lesson_prompts['language'])
+        admit()
         
-        message = client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=1000,
-            temperature=0.8,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
-        )
+        lesson_type, user_level, prompt = lesson_prompt(lesson_type, user_level)
+        budget_key = f'lesson:{lesson_type}'
+        pool_key = ('lesson', lesson_type, user_level)
         
-        lesson_content = message.content[0].text
+        # Serve a pre-rendered or pre-generated lesson when one is ready
+        lesson_content = pooled_content('lesson', pool_key, lambda: generate_text(
+            prompt, 'lesson', budget_key, coalesce=False, gate=background_gate))
+        stale = False
+        if lesson_content is None:
+            stale_key = ':'.join(pool_key)
+            fallback = last_good('lesson', stale_key)
+            if wants_stream(data):
+                return stream_text(prompt, 'lesson', budget_key, stale_key=stale_key, fallback=fallback)
+            lesson_content, stale = serve_stale('lesson', stale_key, fallback, lambda gate: generate_text(
+                prompt, 'lesson', budget_key, gate=gate))
         
-        return jsonify({
+        return content_response({
             'lesson': lesson_content,
             'success': True
-        })
+        }, stale)
         
+    except RateLimitedError as e:
+        return rate_limited(e)
+    except CircuitOpenError as e:
+        return upstream_unavailable(e)
     except Exception as e:
         return jsonify({
             'error': f'Помилка: {str(e)}',
@@ -206,320 +935,133 @@ def get_advanced_lesson():
         subcategory = data.get('subcategory', '')
         subcategory_name = data.get('subcategoryName', '')
         
-        # Advanced intellectual prompts for Ukrainian content - well formatted and informative
-        advanced_prompts = {
-            'language': {
-                'etymology': """
-                Розкажи про одне цікаве українське слово, його походження та культурне значення.
-                Структуруй відповідь з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                150-200 слів, тільки українською мовою.
-                """,
-                'dialects': """
-                Поділися цікавою особливістю українського діалекту або говірки.
-                Включи назву регіону, приклади слів та їх значення.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                150-200 слів, тільки українською мовою.
-                """,
-                'language_culture_code': """
-                Покажи на прикладі, як українська мова відображає наш світогляд.
-                Обери вираз або поняття, що розкриває українську ментальність.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                150-200 слів, тільки українською мовою.
-                """,
-                'neologisms_archaisms': """
-                Розкажи про нове або старе українське слово та його значення.
-                Поясни його походження та використання.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                150-200 слів, тільки українською мовою.
-                """,
-                'psycholinguistics': """
-                Поділися фактом про те, як українська мова впливає на наше мислення.
-                Покажи зв'язок мови та свідомості на конкретному прикладі.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                150-200 слів, тільки українською мовою.
-                """,
-                'linguistics_random': """
-                Розкажи про цікаву лінгвістичну особливість української мови.
-                Обери те, що здивує і надихне вивчати мову глибше.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                150-200 слів, тільки українською мовою.
-                """
-            },
-            'history': {
-                'kyivan_rus': """
-                Розкажи про важливу подію або постать Київської Русі.
-                Включи дати, історичний контекст та значення для сучасної України.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                200-250 слів, тільки українською мовою.
-                """,
-                'cossack_state': """
-                Поділися цікавою історією з часів козацької держави.
-                Включи історичні факти, постаті та їх вплив на українську ідентичність.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                200-250 слів, тільки українською мовою.
-                """,
-                'galicia_volhynia': """
-                Розкажи про важливу подію Галицько-Волинського князівства.
-                Покажи європейські зв'язки, культурні досягнення та історичне значення.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                200-250 слів, тільки українською мовою.
-                """,
-                'unr_liberation': """
-                Поділися яскравою історією визвольних змагань 1917-1921.
-                Включи ключові події, постаті та їх значення для української державності.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                200-250 слів, тільки українською мовою.
-                """,
-                'holodomor_repressions': """
-                Розкажи про конкретну історію пам'яті про Голодомор.
-                Покажи важливість збереження історичної правди та пам'яті.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                200-250 слів, тільки українською мовою.
-                """,
-                'history_random': """
-                Поділися захоплюючою історією з українського минулого.
-                Обери те, що надихає та показує силу українського духу.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                200-250 слів, тільки українською мовою.
-                """
-            },
-            'ethnography': {
-                'calendar_rituals': """
-                Розкажи про українське свято або обряд та його значення.
-                Включи історію, традиції та сучасне відзначення.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                150-200 слів, тільки українською мовою.
-                """,
-                'folk_beliefs': """
-                Поділися цікавою українською легендою або віруванням.
-                Покажи мудрість предків та зв'язок з природою і традиціями.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                150-200 слів, тільки українською мовою.
-                """,
-                'traditional_economy': """
-                Розкажи про традиційне українське ремесло або заняття.
-                Покажи майстерність, техніки та зв'язок з землею і культурою.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                150-200 слів, тільки українською мовою.
-                """,
-                'family_traditions': """
-                Поділися українською родинною традицією.
-                Покажи, як це зміцнює сім'ю, передає цінності та зберігає культуру.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                150-200 слів, тільки українською мовою.
-                """,
-                'oral_folklore': """
-                Розкажи українську народну казку або приказку.
-                Покажи мудрість, гумор та життєві уроки нашого народу.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                150-200 слів, тільки українською мовою.
-                """,
-                'ethnography_random': """
-                Поділися цікавою українською традицією.
-                Обери те, що показує красу та унікальність нашої культури.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                150-200 слів, тільки українською мовою.
-                """
-            },
-            'literature': {
-                'romanticism_shevchenko': """
-                Поділися улюбленим віршем або рядком Тараса Шевченка.
-                Включи контекст написання та вплив на українську літературу.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                150-200 слів, тільки українською мовою.
-                """,
-                'realism_19th': """
-                Розкажи про твір українського реалізму XIX століття.
-                Покажи, як література відображала життя народу та соціальні проблеми.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                150-200 слів, тільки українською мовою.
-                """,
-                'modernism_1920s': """
-                Поділися фактом про "розстріляне відродження" 1920-х.
-                Покажи талант, новаторство та трагічну долю того покоління.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                150-200 слів, тільки українською мовою.
-                """,
-                'sixtiers_dissidents': """
-                Розкажи про одного з шістдесятників та його внесок.
-                Покажи мужність, творчість та відданість українській справі.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                150-200 слів, тільки українською мовою.
-                """,
-                'contemporary_literature': """
-                Поділися сучасним українським твором або автором.
-                Покажи, як література розвивається та відображає сучасні реалії.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                150-200 слів, тільки українською мовою.
-                """,
-                'literature_random': """
-                Розкажи про цікаву постать української літератури.
-                Обери те, що надихне читати більше та пишатися спадщиною.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                150-200 слів, тільки українською мовою.
-                """
-            },
-            'freedom': {
-                'cossack_uprisings': """
-                Розкажи про козацького героя та його подвиг.
-                Включи історичний контекст, дії та вплив на українську боротьбу за свободу.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                200-250 слів, тільки українською мовою.
-                """,
-                'liberation_1917_1921': """
-                Поділися героїчною історією визвольних змагань.
-                Покажи жертовність, боротьбу та прагнення до незалежності.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                200-250 слів, тільки українською мовою.
-                """,
-                'oun_upa': """
-                Розкажи про акт опору або героїзму ОУН-УПА.
-                Покажи незламність духу борців за волю та їх жертви.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                200-250 слів, тільки українською мовою.
-                """,
-                'dissident_movement': """
-                Поділися історією українського дисидента.
-                Покажи мужність боротьби за правду та права людини.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                200-250 слів, тільки українською мовою.
-                """,
-                'revolution_dignity': """
-                Розкажи про яскравий момент Революції Гідності.
-                Покажи силу об'єднаного народу та прагнення до змін.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                200-250 слів, тільки українською мовою.
-                """,
-                'freedom_random': """
-                Поділися історією українського героїзму.
-                Обери те, що надихає на боротьбу за свободу та гідність.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                200-250 слів, тільки українською мовою.
-                """
-            },
-            'content': {
-                'classic_songs': """
-                🎵 Розкажи про класичну українську пісню та її історію.
-                Включи автора, рік створення, контекст та вплив на культуру.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                ВАЖЛИВО: Завершуй відповідь повністю, не обривай речення посередині.
-                150-200 слів, тільки українською мовою.
-                """,
-                'modern_music': """
-                🎤 Поділися сучасною українською піснею та її значенням.
-                Покажи, як музика об'єднує покоління та популяризує українську культуру.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                ВАЖЛИВО: Завершуй відповідь повністю, не обривай речення посередині.
-                150-200 слів, тільки українською мовою.
-                """,
-                'iconic_books': """
-                📚 Розкажи про знакову українську книгу.
-                Покажи її значення, вплив на суспільство та чому варто прочитати.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                ВАЖЛИВО: Завершуй відповідь повністю, не обривай речення посередині.
-                150-200 слів, тільки українською мовою.
-                """,
-                'cinema_theater': """
-                🎬 Поділися українським фільмом або виставою.
-                Покажи, як візуальне мистецтво розповідає нашу історію та культуру.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                ВАЖЛИВО: Завершуй відповідь повністю, не обривай речення посередині.
-                150-200 слів, тільки українською мовою.
-                """,
-                'folk_songs': """
-                🎭 Розкажи про українську народну пісню або коляду.
-                Покажи її красу, історію та зв'язок з традиціями і обрядами.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                ВАЖЛИВО: Завершуй відповідь повністю, не обривай речення посередині.
-                150-200 слів, тільки українською мовою.
-                """,
-                'content_random': """
-                Поділися цікавим фактом про український контент.
-                Обери те, що показує багатство та різноманітність нашої культури.
-                Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
-                ВАЖЛИВО: Завершуй відповідь повністю, не обривай речення посередині.
-                150-200 слів, тільки українською мовою.
-                """
-            }
-        }
+        admit()
         
-        # Get the appropriate prompt
-        category_prompts = advanced_prompts.get(category, {})
-        prompt = category_prompts.get(subcategory, f"""
-        Створи інтелектуальний матеріал на тему "{subcategory_name}" у категорії "{category}".
-        Розкрий тему глибоко, академічно, з аналізом та сучасною актуальністю.
-        400-500 слів, тільки українською мовою.
-        """)
-        
-        message = client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=1000,
-            temperature=0.8,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
-        )
-        
-        lesson_content = message.content[0].text
+        pool_key, system, prompt = advanced_lesson_prompt(category, subcategory, subcategory_name)
         
-        return jsonify({
+        budget_key = ':'.join(pool_key) if pool_key else None
+        
+        lesson_content = None
+        if pool_key is not None:
+            lesson_content = pooled_content('advanced-lesson', pool_key, lambda: generate_text(
+                prompt, 'advanced-lesson', budget_key, coalesce=False, gate=background_gate))
+        
+        stale = False
+        if lesson_content is None:
+            stale_key = budget_key or content_key(prompt)
+            fallback = last_good('advanced-lesson', stale_key)
+            if wants_stream(data):
+                return stream_text(prompt, 'advanced-lesson', budget_key, system=system, stale_key=stale_key,
+                                   fallback=fallback)
+            lesson_content, stale = serve_stale('advanced-lesson', stale_key, fallback, lambda gate: generate_text(
+                prompt, 'advanced-lesson', budget_key, system=system, gate=gate))
+        
+        return content_response({
             'lesson': lesson_content,
             'success': True
-        })
+        }, stale)
         
+    except RateLimitedError as e:
+        return rate_limited(e)
+    except CircuitOpenError as e:
+        return upstream_unavailable(e)
     except Exception as e:
         return jsonify({
             'error': f'Помилка: {str(e)}',
             'success': False
         }), 500
 
-@app.route('/api/daily-wisdom')
-def get_daily_wisdom():
+@app.route('/api/lessons', methods=['POST'])
+def get_lessons():
+    """Several catalogue lessons in one round trip, in request order.
+
+    Stored and pooled lessons are answered at once; the rest are generated
+    concurrently on lesson_batch_executor. The batch counts as one request
+    against the client's rate limit, and each further lesson it has to
+    generate as one more.
+
+    With {"prefetch": true} (the page warming a category grid) only stored
+    and pooled lessons are returned, without using up pool entries, and the
+    rest are reported missing so the click can stream them; nothing is
+    generated, but the batch is still charged as one request.
+
+    A batch naming an unknown lesson is refused with a 400.
+    """
     try:
         # Check if Anthropic client is available
         client_available, error_msg = check_anthropic_client()
         if not client_available:
-            # Fallback to static quotes if API is not available
-            fallback_wisdom = random.choice(WISDOM_QUOTES)
-            return jsonify({
-                'wisdom': fallback_wisdom,
-                'success': True
-            })
+            return jsonify({'error': error_msg, 'success': False}), 500
         
-        # Use AI to generate personalized daily wisdom
-        prompt = """
-        Створи надихаючу українську мудрість дня. Це може бути:
-        1. Цитата українського письменника/поета
-        2. Народна мудрість або прислів'я
-        3. Сучасна мотивація в українському дусі
+        data = request.json
+        items = data.get('lessons')
         
-        Зроби це коротко (1-2 речення), надихаюче та автентично українським.
-        Тільки українською мовою.
-        """
+        if not isinstance(items, list) or not 0 < len(items) <= LESSON_BATCH_MAX:
+            return jsonify({'error': f'Вкажіть від 1 до {LESSON_BATCH_MAX} уроків', 'success': False}), 400
         
-        message = client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=1000,
-            temperature=0.8,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
-        )
+        specs = [batch_lesson_spec(item) for item in items]
+        if None in specs:
+            return jsonify({'error': 'Невідомий урок', 'success': False}), 400
         
-        wisdom = message.content[0].text
+        admit()
+        
+        prefetch = bool(data.get('prefetch'))
+        results = [None] * len(items)
+        pending = {}
+        for index, spec in enumerate(specs):
+            text = cached_lesson(spec, refill=not prefetch)
+            if text is not None:
+                results[index] = batch_lesson_result(text)
+                continue
+            if prefetch:
+                results[index] = PREFETCH_MISS
+                continue
+            try:
+                if pending:
+                    client_limiter.check(client_address(request.remote_addr, request.headers.get('X-Forwarded-For')))
+            except RateLimitedError as e:
+                results[index] = batch_lesson_error(e)
+                continue
+            pending[index] = lesson_batch_executor.submit(contextvars.copy_context().run, generated_lesson, spec)
+        
+        for index, future in pending.items():
+            try:
+                results[index] = batch_lesson_result(*future.result())
+            except Exception as e:
+                results[index] = batch_lesson_error(e)
         
         return jsonify({
-            'wisdom': wisdom,
+            'lessons': results,
             'success': True
         })
         
+    except RateLimitedError as e:
+        return rate_limited(e)
     except Exception as e:
-        # Fallback to static quotes
+        return jsonify({
+            'error': f'Помилка: {str(e)}',
+            'success': False
+        }), 500
+
+@app.route('/api/daily-wisdom')
+def get_daily_wisdom():
+    # Check if Anthropic client is available
+    client_available, error_msg = check_anthropic_client()
+    if not client_available:
+        # Fallback to static quotes if API is not available
         fallback_wisdom = random.choice(WISDOM_QUOTES)
         return jsonify({
             'wisdom': fallback_wisdom,
             'success': True
         })
+    
+    # Cached once per day; a static quote is served while it is generated
+    wisdom = wisdom_cache.get(request.args.get('tz'))
+    
+    return jsonify({
+        'wisdom': wisdom,
+        'success': True
+    })
 
 @app.route('/api/chat', methods=['POST'])
 def chat():
@@ -531,44 +1073,56 @@ def chat():
         
         data = request.json
         user_message = data.get('message', '')
+        session_id = data.get('session_id')
         
         if not user_message:
             return jsonify({'error': 'Повідомлення не може бути порожнім'}), 400
         
-        # Create AI prompt for general chat
-        prompt = f"""
-        Ти - мудрий український наставник та друг. Користувач написав: "{user_message}"
-        
-        Відповідай як досвідчений українець, що:
-        1. Розуміє українську культуру та історію
-        2. Може дати мудрі поради
-        3. Підтримує українську ідентичність
-        4. Говорить тільки українською мовою
-        5. Використовує емоційний, теплий тон
-        6. При потребі включає культурні референси
-        
-        ВАЖЛИВО: Завершуй відповідь повністю, не обривай речення посередині.
-        Тримай відповідь в межах 150-250 слів, але завжди закінчуй думку.
-        """
-        
-        message = client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=1000,
-            temperature=0.8,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
-        )
-        
-        response = message.content[0].text
-        print(f"Chat response length: {len(response)}")
-        print(f"Chat response ends with: {response[-50:]}")
+        if session_id is not None and not chat_sessions.valid_id(session_id):
+            return jsonify({'error': 'Невірний ідентифікатор сесії', 'success': False}), 400
         
-        return jsonify({
+        admit(session_id)
+        
+        history = chat_sessions.messages(session_id)
+        
+        # Answers that depend on earlier turns are not reusable. Keys are
+        # hashed: the store outlives the message and the question is the user's own
+        stale_key = content_key(normalize_message(user_message)) if not history else None
+        
+        def finish(text, stale=False):
+            if not history and not stale:
+                chat_cache.put(user_message, text)
+            chat_sessions.append(session_id, user_message, text)
+        
+        # Repeated questions are answered from the cache without a model call
+        response = chat_cache.get(user_message) if not history else None
+        if response is not None:
+            chat_sessions.append(session_id, user_message, response)
+            return jsonify({
+                'response': response,
+                'success': True
+            })
+        
+        system, prompt = chat_prompt(user_message)
+        fallback = last_good('chat', stale_key)
+        
+        if wants_stream(data):
+            return stream_text(prompt, 'chat', on_complete=finish, system=system, history=history,
+                               stale_key=stale_key, fallback=fallback)
+        
+        response, stale = serve_stale('chat', stale_key, fallback, lambda gate: generate_text(
+            prompt, 'chat', system=system, history=history, gate=gate))
+        finish(response, stale)
+        
+        return content_response({
             'response': response,
             'success': True
-        })
+        }, stale)
         
+    except RateLimitedError as e:
+        return rate_limited(e)
+    except CircuitOpenError as e:
+        return upstream_unavailable(e)
     except Exception as e:
         return jsonify({
             'error': f'Помилка: {str(e)}',
@@ -576,4 +1130,8 @@ def chat():
         }), 500
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=8080)
+    # Development server only; production runs under gunicorn:
+    #   gunicorn app:app          (threaded workers, see gunicorn.conf.py)
+    #   SERVER_MODE=async gunicorn asgi:app
+    app.run(debug=os.getenv('FLASK_DEBUG') == '1', host='0.0.0.0', port=int(os.getenv('PORT', '8080')))
+
@@ -0,0 +1,742 @@
+"""Async serving mode.
+
+The model-backed API routes run natively on an event loop with
+AsyncAnthropic, so a single process can hold hundreds of in-flight model
+calls. Everything else (the landing page and static files) is delegated to
+the Flask app. Routes, status codes and JSON shapes match app.py.
+
+The content store, chat sessions and wisdom cache are shared with app.py
+and read SQLite or JSON files; those calls run in worker threads
+(asyncio.to_thread) so a slow disk or a locked database never stalls the
+loop.
+
+Run with:
+    uvicorn asgi:app --host 0.0.0.0 --port 8080
+"""
+import asyncio
+import json
+import os
+import random
+import time
+
+from asgiref.wsgi import WsgiToAsgi
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.exceptions import HTTPException
+
+import app as flask_app
+import upstream
+from admission import AsyncUpstreamGate, RateLimitedError, retry_after_header
+from journal import text_hash
+from upstream import CircuitOpenError
+from token_budget import budgets, token_usage
+from metrics import metrics
+
+# Upper bound on concurrent upstream calls per process; excess requests
+# wait for a slot within their route timeout, up to MAX_QUEUE of them
+MAX_CONCURRENCY = int(os.getenv('ASYNC_MAX_CONCURRENCY', '256'))
+MAX_QUEUE = int(os.getenv('ASYNC_MAX_QUEUE', '512'))
+
+# Total time budget per route in seconds, including waiting for a slot
+ROUTE_TIMEOUTS = {
+    'reflect': float(os.getenv('ASYNC_TIMEOUT_REFLECT', '60')),
+    'lesson': float(os.getenv('ASYNC_TIMEOUT_LESSON', '60')),
+    'advanced-lesson': float(os.getenv('ASYNC_TIMEOUT_ADVANCED_LESSON', '60')),
+    'chat': float(os.getenv('ASYNC_TIMEOUT_CHAT', '45'))
+}
+
+TIMEOUT_ERROR = 'Помилка: перевищено час очікування відповіді'
+
+_async_client = None
+
+upstream_gate = AsyncUpstreamGate(MAX_CONCURRENCY, MAX_QUEUE)
+# Stale refreshes and batch lessons, as with app.background_gate
+background_gate = AsyncUpstreamGate(int(os.getenv('ASYNC_BACKGROUND_CONCURRENCY', '32')),
+                                    int(os.getenv('ASYNC_BACKGROUND_QUEUE', '64')))
+coalescer = upstream.AsyncSingleFlight()
+
+# Model calls that outlived their stale deadline and are finishing in the background
+stale_refreshes = set()
+
+
+def get_async_client():
+    """The shared AsyncAnthropic client, built on first call.
+
+    The SDK import itself normally happens earlier, in the app's warm-up.
+    """
+    global _async_client
+    if _async_client is None:
+        _async_client = upstream.build_async_client(flask_app.api_key)
+    return _async_client
+
+
+def check_async_client():
+    """Check if the async Anthropic client is available"""
+    if not flask_app.api_key:
+        return False, "Anthropic API недоступний. Будь ласка, перевірте налаштування API ключа."
+    return True, None
+
+
+def error_response(message, status_code):
+    return JSONResponse({'error': message, 'success': False}, status_code=status_code)
+
+
+def upstream_unavailable(error):
+    response = error_response('Сервіс тимчасово перевантажений. Будь ласка, спробуйте трохи пізніше.', 503)
+    response.headers['Retry-After'] = str(max(1, int(error.retry_after)))
+    return response
+
+
+def rate_limited(error):
+    response = error_response('Забагато запитів. Будь ласка, зачекайте трохи і спробуйте знову.', 429)
+    response.headers['Retry-After'] = retry_after_header(error)
+    return response
+
+
+def client_address(request):
+    """The visitor's address, resolved through TRUSTED_PROXIES like the Flask app"""
+    return flask_app.client_address(request.client.host if request.client else None,
+                                    request.headers.get('x-forwarded-for'))
+
+
+def admit(request, session_id=None):
+    """Charge the request to its client's (and chat session's) rate limit"""
+    flask_app.client_limiter.check(client_address(request))
+    flask_app.session_limiter.check(session_id)
+
+
+def wants_stream(request, data):
+    if data and data.get('stream'):
+        return True
+    return 'text/event-stream' in request.headers.get('accept', '')
+
+
+def claim_relay():
+    """Async counterpart of app.claim_relay: None if a fallback-covered call may start.
+
+    Relays are counted in stale_refreshes, which a caller adds its task to
+    before it next awaits, so nothing needs releasing.
+    """
+    reason = flask_app.skip_upstream(upstream_gate, background_gate)
+    if reason is None and len(stale_refreshes) >= background_gate.limit:
+        reason = 'relays_busy'
+    return reason
+
+
+async def serve_stale(endpoint, key, fallback, produce, gate=None):
+    """Async counterpart of app.serve_stale; `produce(gate)` returns a fresh awaitable"""
+    flask_app.journal.note_key(endpoint, key)
+    if fallback is None:
+        text = await produce(gate or upstream_gate)
+        flask_app.remember(endpoint, key, text)
+        return text, False
+
+    reason = claim_relay()
+    if reason is not None:
+        flask_app.served_stale(endpoint, reason)
+        return fallback, True
+
+    task = asyncio.ensure_future(produce(background_gate))
+    stale_refreshes.add(task)
+
+    def refreshed(task):
+        stale_refreshes.discard(task)
+        if not task.cancelled() and task.exception() is None:
+            flask_app.remember(endpoint, key, task.result())
+
+    task.add_done_callback(refreshed)
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), flask_app.STALE_DEADLINE), False
+    except Exception as e:
+        flask_app.served_stale(endpoint, upstream.error_class(e))
+        return fallback, True
+
+
+def content_response(payload, stale=False):
+    if not stale:
+        return JSONResponse(payload)
+    return JSONResponse({**payload, 'stale': True}, headers={'X-Content-Stale': '1'})
+
+
+async def read_json(request):
+    """Parse the request body, mirroring Flask's `request.json`"""
+    return json.loads(await request.body() or b'null')
+
+
+async def generate_text(prompt, route, prompt_key=None, temperature=0.8, system=None, history=(), gate=None):
+    """Run one model call within the route's timeout and return its text, queueing on `gate` if given"""
+    max_tokens = budgets.for_prompt(route, prompt_key)
+    params = flask_app.message_params(prompt, max_tokens, temperature, system, history)
+    gate = gate or upstream_gate
+
+    async def call():
+        async with gate.slot():
+            start = time.perf_counter()
+            try:
+                message = await upstream.acall(lambda: flask_app.messages_api(get_async_client(), params).create(**params))
+            except CircuitOpenError as e:
+                metrics.observe_upstream(route, None, e)
+                raise
+            except Exception as e:
+                metrics.observe_upstream(route, time.perf_counter() - start, e)
+                raise
+            metrics.observe_upstream(route, time.perf_counter() - start)
+        token_usage.record(route, message.usage, max_tokens, message.stop_reason)
+        flask_app.journal.note_usage(message.usage)
+        return message.content[0].text
+
+    if history:
+        return await asyncio.wait_for(call(), ROUTE_TIMEOUTS[route])
+    # Identical concurrent requests on the same gate share one upstream call
+    key = (gate, flask_app.MODEL_NAME, system, prompt, temperature, max_tokens)
+    return await asyncio.wait_for(coalescer.do(key, call), ROUTE_TIMEOUTS[route])
+
+
+def stream_text(prompt, route, prompt_key=None, temperature=0.8, on_complete=None, system=None, history=(),
+                stale_key=None, fallback=None):
+    """Async counterpart of app.stream_text with a total deadline"""
+    flask_app.journal.note_key(route, stale_key)
+    if fallback is None:
+        upstream.breaker.check()
+        upstream_gate.check()
+    else:
+        reason = claim_relay()
+        if reason is not None:
+            return sse_response(stale_frames(route, fallback, reason, on_complete))
+    gate = upstream_gate if fallback is None else background_gate
+    max_tokens = budgets.for_prompt(route, prompt_key)
+    params = flask_app.message_params(prompt, max_tokens, temperature, system, history)
+    timeout = ROUTE_TIMEOUTS[route]
+    superseded = False
+
+    async def generate():
+        yield ": stream-start\n\n"
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        start = None
+        probe = False
+        try:
+            async with gate.slot(timeout):
+                probe = upstream.breaker.before_call()
+                start = time.perf_counter()
+                async with flask_app.messages_api(get_async_client(), params).stream(**params) as stream:
+                    chunks = stream.text_stream.__aiter__()
+                    received = []
+                    while True:
+                        try:
+                            text = await asyncio.wait_for(chunks.__anext__(), deadline - loop.time())
+                        except StopAsyncIteration:
+                            break
+                        received.append(text)
+                        yield flask_app.sse_event({'text': text})
+                    message = await stream.get_final_message()
+            upstream.record_outcome()
+            metrics.observe_upstream(route, time.perf_counter() - start)
+            token_usage.record(route, message.usage, max_tokens, message.stop_reason)
+            flask_app.journal.note_usage(message.usage)
+            flask_app.journal.note(stream=True, response_hash=text_hash(''.join(received)))
+            flask_app.remember(route, stale_key, ''.join(received))
+            if on_complete is not None and not superseded:
+                await asyncio.to_thread(on_complete, ''.join(received))
+            yield flask_app.sse_event({'success': True}, event='done')
+        except asyncio.TimeoutError as e:
+            metrics.observe_upstream(route, time.perf_counter() - start if start else None, e)
+            yield flask_app.sse_event({'error': TIMEOUT_ERROR, 'success': False}, event='error')
+        except RateLimitedError as e:
+            yield flask_app.sse_event({'error': f'Помилка: {str(e)}', 'success': False}, event='error')
+        except CircuitOpenError as e:
+            metrics.observe_upstream(route, None, e)
+            yield flask_app.sse_event({'error': f'Помилка: {str(e)}', 'success': False}, event='error')
+        except Exception as e:
+            upstream.record_outcome(e)
+            metrics.observe_upstream(route, time.perf_counter() - start if start else None, e)
+            yield flask_app.sse_event({'error': f'Помилка: {str(e)}', 'success': False}, event='error')
+        finally:
+            if probe:
+                upstream.breaker.abandon_probe()
+
+    async def relay(relayed, deadline):
+        """Async counterpart of app.relay_or_fallback"""
+        nonlocal superseded
+        loop = asyncio.get_running_loop()
+        yield ": stream-start\n\n"
+
+        while True:
+            try:
+                frame = await asyncio.wait_for(relayed.get(), max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                frame, reason = None, 'no token in time'
+                break
+            reason = 'stream failed'
+            if frame is None or not frame.startswith(':'):
+                break
+        if frame is None or frame.startswith('event: error'):
+            superseded = True
+            async for frame in stale_frames(route, fallback, reason, on_complete):
+                yield frame
+            return
+
+        while frame is not None:
+            yield frame
+            frame = await relayed.get()
+
+    if fallback is None:
+        return sse_response(generate())
+
+    relayed = asyncio.Queue()
+
+    async def pump():
+        try:
+            async for frame in generate():
+                await relayed.put(frame)
+        finally:
+            await relayed.put(None)
+
+    # Started now, not when the response is first read, so the relay counts
+    # against claim_relay() from the moment it was granted
+    task = asyncio.ensure_future(pump())
+    stale_refreshes.add(task)
+    task.add_done_callback(stale_refreshes.discard)
+    return sse_response(relay(relayed, asyncio.get_running_loop().time() + flask_app.STALE_DEADLINE))
+
+
+def sse_response(frames):
+    return StreamingResponse(
+        frames,
+        media_type='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
+async def stale_frames(endpoint, fallback, reason, on_stale=None):
+    """Async counterpart of app.stale_frames"""
+    flask_app.served_stale(endpoint, reason)
+    flask_app.journal.note(stream=True, stale=True, response_hash=text_hash(fallback))
+    if on_stale is not None:
+        await asyncio.to_thread(on_stale, fallback, True)
+    yield flask_app.sse_event({'text': fallback})
+    yield flask_app.sse_event({'success': True, 'stale': True}, event='done')
+
+
+async def generate_reflection(request):
+    try:
+        client_available, error_msg = check_async_client()
+        if not client_available:
+            return error_response(error_msg, 500)
+
+        data = await read_json(request)
+        user_story = data.get('story', '')
+
+        if not user_story:
+            return error_response('Будь ласка, розкажіть про себе', 400)
+
+        admit(request)
+
+        pool_key, system, prompt = flask_app.reflection_prompt(user_story)
+
+        # Stories that only name a region share pre-generated reflections
+        if pool_key is not None:
+            reflection = await asyncio.to_thread(
+                flask_app.pooled_content, 'reflect', pool_key, lambda: flask_app.generate_text(
+                    prompt, 'reflect', system=system, coalesce=False, gate=flask_app.background_gate))
+            if reflection is not None:
+                return JSONResponse({'reflection': reflection, 'success': True})
+
+        stale_key = flask_app.content_key(prompt)
+        fallback = await asyncio.to_thread(flask_app.last_good, 'reflect', stale_key)
+
+        if wants_stream(request, data):
+            return stream_text(prompt, 'reflect', system=system, stale_key=stale_key, fallback=fallback)
+
+        reflection, stale = await serve_stale('reflect', stale_key, fallback, lambda gate: generate_text(
+            prompt, 'reflect', system=system, gate=gate))
+
+        return content_response({'reflection': reflection, 'success': True}, stale)
+
+    except asyncio.TimeoutError:
+        return error_response(TIMEOUT_ERROR, 504)
+    except RateLimitedError as e:
+        return rate_limited(e)
+    except CircuitOpenError as e:
+        return upstream_unavailable(e)
+    except Exception as e:
+        return error_response(f'Помилка: {str(e)}', 500)
+
+
+async def get_lesson(request):
+    try:
+        client_available, error_msg = check_async_client()
+        if not client_available:
+            return error_response(error_msg, 500)
+
+        data = await read_json(request)
+        lesson_type = data.get('type', '')
+        user_level = data.get('level', flask_app.LESSON_LEVELS[0])
+
+        admit(request)
+
+        lesson_type, user_level, prompt = flask_app.lesson_prompt(lesson_type, user_level)
+        budget_key = f'lesson:{lesson_type}'
+
+        pool_key = ('lesson', lesson_type, user_level)
+
+        # Pool refills run on the shared background workers
+        lesson_content = await asyncio.to_thread(
+            flask_app.pooled_content, 'lesson', pool_key, lambda: flask_app.generate_text(
+                prompt, 'lesson', budget_key, coalesce=False, gate=flask_app.background_gate))
+        stale = False
+        if lesson_content is None:
+            stale_key = ':'.join(pool_key)
+            fallback = await asyncio.to_thread(flask_app.last_good, 'lesson', stale_key)
+            if wants_stream(request, data):
+                return stream_text(prompt, 'lesson', budget_key, stale_key=stale_key, fallback=fallback)
+            lesson_content, stale = await serve_stale('lesson', stale_key, fallback, lambda gate: generate_text(
+                prompt, 'lesson', budget_key, gate=gate))
+
+        return content_response({'lesson': lesson_content, 'success': True}, stale)
+
+    except asyncio.TimeoutError:
+        return error_response(TIMEOUT_ERROR, 504)
+    except RateLimitedError as e:
+        return rate_limited(e)
+    except CircuitOpenError as e:
+        return upstream_unavailable(e)
+    except Exception as e:
+        return error_response(f'Помилка: {str(e)}', 500)
+
+
+async def get_advanced_lesson(request):
+    try:
+        client_available, error_msg = check_async_client()
+        if not client_available:
+            return error_response(error_msg, 500)
+
+        data = await read_json(request)
+        category = data.get('category', '')
+        subcategory = data.get('subcategory', '')
+        subcategory_name = data.get('subcategoryName', '')
+
+        admit(request)
+
+        pool_key, system, prompt = flask_app.advanced_lesson_prompt(category, subcategory, subcategory_name)
+        budget_key = ':'.join(pool_key) if pool_key else None
+
+        lesson_content = None
+        if pool_key is not None:
+            lesson_content = await asyncio.to_thread(
+                flask_app.pooled_content, 'advanced-lesson', pool_key, lambda: flask_app.generate_text(
+                    prompt, 'advanced-lesson', budget_key, coalesce=False, gate=flask_app.background_gate))
+
+        stale = False
+        if lesson_content is None:
+            stale_key = budget_key or flask_app.content_key(prompt)
+            fallback = await asyncio.to_thread(flask_app.last_good, 'advanced-lesson', stale_key)
+            if wants_stream(request, data):
+                return stream_text(prompt, 'advanced-lesson', budget_key, system=system, stale_key=stale_key,
+                                   fallback=fallback)
+            lesson_content, stale = await serve_stale('advanced-lesson', stale_key, fallback, lambda gate: generate_text(
+                prompt, 'advanced-lesson', budget_key, system=system, gate=gate))
+
+        return content_response({'lesson': lesson_content, 'success': True}, stale)
+
+    except asyncio.TimeoutError:
+        return error_response(TIMEOUT_ERROR, 504)
+    except RateLimitedError as e:
+        return rate_limited(e)
+    except CircuitOpenError as e:
+        return upstream_unavailable(e)
+    except Exception as e:
+        return error_response(f'Помилка: {str(e)}', 500)
+
+
+async def generated_lesson(spec, slots):
+    """Async counterpart of app.generated_lesson, holding one of the batch's slots"""
+    endpoint, pool_key, budget_key, prompt = spec
+    stale_key = ':'.join(pool_key)
+    async with slots:
+        fallback = await asyncio.to_thread(flask_app.last_good, endpoint, stale_key)
+        return await serve_stale(endpoint, stale_key, fallback, lambda gate: generate_text(
+            prompt, endpoint, budget_key, gate=gate), background_gate)
+
+
+async def get_lessons(request):
+    try:
+        client_available, error_msg = check_async_client()
+        if not client_available:
+            return error_response(error_msg, 500)
+
+        data = await read_json(request)
+        items = data.get('lessons')
+
+        if not isinstance(items, list) or not 0 < len(items) <= flask_app.LESSON_BATCH_MAX:
+            return error_response(f'Вкажіть від 1 до {flask_app.LESSON_BATCH_MAX} уроків', 400)
+
+        specs = [flask_app.batch_lesson_spec(item) for item in items]
+        if None in specs:
+            return error_response('Невідомий урок', 400)
+
+        admit(request)
+
+        # See app.get_lessons: a prefetch only reads the store and pools
+        prefetch = bool(data.get('prefetch'))
+
+        # Upstream calls are cheap to hold here, so the bound is per batch
+        # rather than the per-process pool of the threaded app
+        slots = asyncio.Semaphore(flask_app.LESSON_BATCH_WORKERS)
+        results = [None] * len(items)
+        pending = {}
+        for index, spec in enumerate(specs):
+            text = await asyncio.to_thread(flask_app.cached_lesson, spec, not prefetch)
+            if text is not None:
+                results[index] = flask_app.batch_lesson_result(text)
+                continue
+            if prefetch:
+                results[index] = flask_app.PREFETCH_MISS
+                continue
+            try:
+                if pending:
+                    flask_app.client_limiter.check(client_address(request))
+            except RateLimitedError as e:
+                results[index] = flask_app.batch_lesson_error(e)
+                continue
+            pending[index] = generated_lesson(spec, slots)
+
+        outcomes = await asyncio.gather(*pending.values(), return_exceptions=True)
+        for index, outcome in zip(pending, outcomes):
+            if isinstance(outcome, asyncio.TimeoutError):
+                results[index] = {'error': TIMEOUT_ERROR, 'success': False}
+            elif isinstance(outcome, Exception):
+                results[index] = flask_app.batch_lesson_error(outcome)
+            else:
+                results[index] = flask_app.batch_lesson_result(*outcome)
+
+        return JSONResponse({'lessons': results, 'success': True})
+
+    except RateLimitedError as e:
+        return rate_limited(e)
+    except Exception as e:
+        return error_response(f'Помилка: {str(e)}', 500)
+
+
+async def get_daily_wisdom(request):
+    client_available, _ = flask_app.check_anthropic_client()
+    if not client_available:
+        return JSONResponse({'wisdom': random.choice(flask_app.WISDOM_QUOTES), 'success': True})
+
+    # The cache never waits on the model: it returns a fallback quote while
+    # generating. A miss rereads the shared file, hence the thread
+    wisdom = await asyncio.to_thread(flask_app.wisdom_cache.get, request.query_params.get('tz'))
+    return JSONResponse({'wisdom': wisdom, 'success': True})
+
+
+async def chat(request):
+    try:
+        client_available, error_msg = check_async_client()
+        if not client_available:
+            return error_response(error_msg, 500)
+
+        data = await read_json(request)
+        user_message = data.get('message', '')
+        session_id = data.get('session_id')
+
+        if not user_message:
+            return error_response('Повідомлення не може бути порожнім', 400)
+
+        if session_id is not None and not flask_app.chat_sessions.valid_id(session_id):
+            return error_response('Невірний ідентифікатор сесії', 400)
+
+        admit(request, session_id)
+
+        history = await asyncio.to_thread(flask_app.chat_sessions.messages, session_id)
+
+        stale_key = flask_app.content_key(flask_app.normalize_message(user_message)) if not history else None
+
+        def finish(text, stale=False):
+            if not history and not stale:
+                flask_app.chat_cache.put(user_message, text)
+            flask_app.chat_sessions.append(session_id, user_message, text)
+
+        response = flask_app.chat_cache.get(user_message) if not history else None
+        if response is not None:
+            await asyncio.to_thread(flask_app.chat_sessions.append, session_id, user_message, response)
+            return JSONResponse({'response': response, 'success': True})
+
+        system, prompt = flask_app.chat_prompt(user_message)
+        fallback = await asyncio.to_thread(flask_app.last_good, 'chat', stale_key)
+
+        if wants_stream(request, data):
+            return stream_text(prompt, 'chat', on_complete=finish, system=system, history=history,
+                               stale_key=stale_key, fallback=fallback)
+
+        response, stale = await serve_stale('chat', stale_key, fallback, lambda gate: generate_text(
+            prompt, 'chat', system=system, history=history, gate=gate))
+        await asyncio.to_thread(finish, response, stale)
+
+        return content_response({'response': response, 'success': True}, stale)
+
+    except asyncio.TimeoutError:
+        return error_response(TIMEOUT_ERROR, 504)
+    except RateLimitedError as e:
+        return rate_limited(e)
+    except CircuitOpenError as e:
+        return upstream_unavailable(e)
+    except Exception as e:
+        return error_response(f'Помилка: {str(e)}', 500)
+
+
+async def stats(request):
+    return JSONResponse({
+        'lesson_pool': flask_app.lesson_pool.stats(),
+        'content_store': await asyncio.to_thread(flask_app.content_store.stats),
+        'chat_cache': flask_app.chat_cache.stats(),
+        'chat_sessions': await asyncio.to_thread(flask_app.chat_sessions.stats),
+        'single_flight': coalescer.stats(),
+        'token_usage': token_usage.stats(),
+        'circuit_breaker': {'state': upstream.breaker.state, 'trips': upstream.breaker.trips},
+        'admission': {
+            'upstream': upstream_gate.stats(),
+            'background': background_gate.stats(),
+            'client_limit': flask_app.client_limiter.stats(),
+            'session_limit': flask_app.session_limiter.stats()
+        },
+        'journal': flask_app.journal.stats()
+    })
+
+
+async def readiness(request):
+    """Readiness probe for this server's own upstream path.
+
+    503 until the AsyncAnthropic client can be built (building it here
+    spares the first request), and while the breaker is open or the async
+    gate is refusing calls, so a balancer sends traffic to other instances.
+    """
+    client_ready = not flask_app.api_key
+    if flask_app.api_key:
+        try:
+            client_ready = get_async_client() is not None
+        except Exception as e:
+            print(f"Async client not ready: {e}")
+    gate = upstream_gate.stats()
+    gate_full = gate['active'] >= gate['limit'] and gate['waiting'] >= upstream_gate.queue
+    # Past its reset timeout an open breaker lets a probe through, so the
+    # instance is ready again rather than waiting for traffic it no longer gets
+    try:
+        upstream.breaker.check()
+        breaker_open = False
+    except CircuitOpenError:
+        breaker_open = True
+    ready = client_ready and not breaker_open and not gate_full
+    return JSONResponse({
+        'ready': ready,
+        'client': _async_client is not None,
+        'circuit_breaker': upstream.breaker.state,
+        'upstream_gate': gate,
+        'daily_wisdom': flask_app.wisdom_cache.ready(),
+        'lesson_pool_entries': flask_app.lesson_pool.stats()['entries'],
+        'content_store_keys': (await asyncio.to_thread(flask_app.content_store.stats))['keys']
+    }, status_code=200 if ready else 503)
+
+
+@metrics.collector
+def collect_async_stats():
+    flights = coalescer.stats()
+    return [
+        ('cache_lookups_total', 'counter', (('cache', 'single_flight_async'), ('result', 'shared')), flights['calls_saved']),
+        ('cache_lookups_total', 'counter', (('cache', 'single_flight_async'), ('result', 'leader')), flights['upstream_calls']),
+        *flask_app.gate_samples('async', upstream_gate.stats()),
+        *flask_app.gate_samples('async_background', background_gate.stats())
+    ]
+
+
+api_routes = [
+    Route('/api/reflect', generate_reflection, methods=['POST']),
+    Route('/api/lesson', get_lesson, methods=['POST']),
+    Route('/api/advanced-lesson', get_advanced_lesson, methods=['POST']),
+    Route('/api/lessons', get_lessons, methods=['POST']),
+    Route('/api/daily-wisdom', get_daily_wisdom, methods=['GET']),
+    Route('/api/chat', chat, methods=['POST']),
+    Route('/api/stats', stats, methods=['GET']),
+    Route('/api/ready', readiness, methods=['GET'])
+]
+
+
+class MetricsMiddleware:
+    """Time every request, labelled with the route pattern that serves it,
+    and journal the API requests.
+
+    The Flask hooks cannot time mounted requests (WsgiToAsgi never closes
+    the response), so they are switched off and this covers both apps.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.paths = {route.path for route in api_routes}
+        self.flask_routes = flask_app.app.url_map.bind('localhost')
+        flask_app.app.config['REQUEST_METRICS'] = False
+
+    def route(self, scope):
+        if scope['path'] in self.paths:
+            return scope['path']
+        try:
+            rule, _ = self.flask_routes.match(scope['path'], scope['method'], return_rule=True)
+            return rule.rule
+        except HTTPException:
+            return 'unmatched'
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+        route = self.route(scope)
+        entry = None
+        if scope['path'].startswith('/api/'):
+            entry = flask_app.journal.begin(route, scope['method'], query=scope['query_string'].decode())
+        request_body, response_body = [], []
+        streamed = False
+
+        async def receive_body():
+            message = await receive()
+            if entry is not None and message['type'] == 'http.request':
+                request_body.append(message.get('body', b''))
+            return message
+
+        async def send_with_status(message):
+            nonlocal status, streamed
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                # Streams are hashed over their text when they complete
+                streamed = b'text/event-stream' in dict(message.get('headers', ())).get(b'content-type', b'')
+            elif message['type'] == 'http.response.body' and entry is not None and not streamed:
+                response_body.append(message.get('body', b''))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_body if entry is not None else receive, send_with_status)
+        finally:
+            latency = time.perf_counter() - start
+            metrics.observe_request(route, scope['method'], status, latency)
+            if entry is not None:
+                try:
+                    flask_app.journal.note_request(entry, json.loads(b''.join(request_body) or b'null'))
+                except ValueError:
+                    pass
+                flask_app.journal.finish(entry, status, latency, None if streamed else b''.join(response_body))
+
+
+app = Starlette(routes=api_routes + [
+    # Landing page, static files and /metrics stay on the Flask app
+    Mount('/', app=WsgiToAsgi(flask_app.app))
+], middleware=[
+    # Same permissive policy as CORS(app) in app.py
+    Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*']),
+    Middleware(MetricsMiddleware)
+])
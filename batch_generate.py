@@ -0,0 +1,166 @@
+"""Pre-render the lesson catalogue into the content store.
+
+Generates K variants of every basic lesson (type x level), every
+advanced-lesson subcategory and the reflection for each region-only
+story, and stores them so /api/lesson, /api/advanced-lesson and those
+/api/reflect requests answer without a model call:
+
+    python batch_generate.py --variants 3                  # parallel calls
+    python batch_generate.py --variants 3 --mode batch     # Message Batches API, half price
+    python batch_generate.py --endpoint advanced-lesson --keys advanced:history
+
+`--mode pool` runs the calls on a bounded thread pool through the app's
+own retry policy, circuit breaker and token budgets. `--mode batch` submits
+one Message Batch and polls until it ends (usually minutes, at most 24h).
+A key's variants are replaced only once they have all been generated.
+Stored keys are served until the next run replaces them: the store's
+max_age rotation applies only to variants generated at runtime.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Importing the app must not start its warm-up calls
+os.environ.setdefault('APP_MANAGED_STARTUP', '1')
+
+import app  # noqa: E402
+from admission import UpstreamGate  # noqa: E402
+from prompts import ADVANCED_CATEGORIES, LESSON_LEVELS, PROMPTS  # noqa: E402
+from regions import REGION_FORMS  # noqa: E402
+from token_budget import budgets  # noqa: E402
+
+LESSON_TYPES = ('language', 'history', 'culture', 'folklore')
+
+
+def catalogue(endpoints, levels):
+    """Yield (endpoint, store_key, route, budget_key, system, prompt) for every catalogue entry"""
+    if 'lesson' in endpoints:
+        for lesson_type in LESSON_TYPES:
+            for level in levels:
+                lesson_type, level, prompt = app.lesson_prompt(lesson_type, level)
+                yield 'lesson', f'lesson:{lesson_type}:{level}', 'lesson', f'lesson:{lesson_type}', None, prompt
+    if 'advanced-lesson' in endpoints:
+        for category in ADVANCED_CATEGORIES:
+            for subcategory in PROMPTS.subcategories(category):
+                pool_key, _, prompt = app.advanced_lesson_prompt(category, subcategory, subcategory)
+                key = ':'.join(pool_key)
+                yield 'advanced-lesson', key, 'advanced-lesson', key, None, prompt
+    if 'reflect' in endpoints:
+        for region in REGION_FORMS:
+            # The story is just the region's name, so the prompt is the region-only one
+            pool_key, system, prompt = app.reflection_prompt(region)
+            yield 'reflect', ':'.join(pool_key), 'reflect', None, system, prompt
+
+
+def run_pool(items, variants, workers):
+    """Generate with concurrent calls; returns {(endpoint, key): [texts]}"""
+    results = {}
+    failures = 0
+    # --workers bounds the calls here, not the server's per-process upstream gate
+    gate = UpstreamGate(limit=workers, queue=0)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for endpoint, key, route, budget_key, system, prompt in items:
+            for _ in range(variants):
+                future = executor.submit(app.generate_text, prompt, route, budget_key,
+                                         coalesce=False, system=system, gate=gate)
+                futures[future] = (endpoint, key)
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                results.setdefault(futures[future], []).append(future.result())
+            except Exception as e:
+                failures += 1
+                print(f"Failed {futures[future][1]}: {e}")
+            if done % 10 == 0 or done == len(futures):
+                print(f"{done}/{len(futures)} calls done")
+    return results, failures
+
+
+def run_batch(items, variants, poll_interval):
+    """Generate through one Message Batch; returns {(endpoint, key): [texts]}"""
+    requests, targets = [], {}
+    for endpoint, key, route, budget_key, system, prompt in items:
+        max_tokens = budgets.for_prompt(route, budget_key)
+        for _ in range(variants):
+            # custom_id allows only [a-zA-Z0-9_-], so keys are mapped by index
+            custom_id = f'req-{len(requests)}'
+            targets[custom_id] = (endpoint, key)
+            requests.append({'custom_id': custom_id,
+                             'params': app.message_params(prompt, max_tokens, 0.8, system)})
+
+    batches = app.get_client().beta.messages.batches
+    batch = batches.create(requests=requests)
+    print(f"Submitted batch {batch.id} with {len(requests)} requests")
+    while batch.processing_status != 'ended':
+        time.sleep(poll_interval)
+        batch = batches.retrieve(batch.id)
+        counts = batch.request_counts
+        print(f"{batch.processing_status}: {counts.succeeded} succeeded, {counts.errored} errored, "
+              f"{counts.processing} processing")
+
+    results = {}
+    failures = 0
+    for entry in batches.results(batch.id):
+        if entry.result.type == 'succeeded':
+            message = entry.result.message
+            results.setdefault(targets[entry.custom_id], []).append(message.content[0].text)
+        else:
+            failures += 1
+            print(f"Failed {targets[entry.custom_id][1]}: {entry.result.type}")
+    return results, failures
+
+
+def store_results(results, variants):
+    """Store every key that got all its variants; returns how many were stored"""
+    stored = 0
+    for (endpoint, key), texts in results.items():
+        # Keep the previous variants of a key rather than store a partial set
+        if len(texts) == variants:
+            app.content_store.replace(endpoint, key, texts)
+            stored += 1
+    return stored
+
+
+def check_variants(parser, variants):
+    """Exit with a usage error unless the store would serve `variants` per key"""
+    if variants < app.content_store.min_variants:
+        parser.error(f"--variants must be at least {app.content_store.min_variants}: "
+                     f"the content store serves a key only once it has that many")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pre-render the lesson catalogue into the content store')
+    parser.add_argument('--variants', type=int, default=3, help='variants per catalogue key')
+    parser.add_argument('--mode', choices=['pool', 'batch'], default='pool')
+    parser.add_argument('--workers', type=int, default=8, help='concurrent calls in pool mode')
+    parser.add_argument('--poll-interval', type=float, default=30.0, help='seconds between batch status checks')
+    parser.add_argument('--endpoint', choices=['lesson', 'advanced-lesson', 'reflect', 'all'], default='all')
+    parser.add_argument('--levels', default=LESSON_LEVELS[0], help='comma-separated basic lesson levels')
+    parser.add_argument('--keys', help='only keys starting with this prefix, e.g. advanced:history')
+    args = parser.parse_args()
+    check_variants(parser, args.variants)
+
+    ok, error_msg = app.check_anthropic_client()
+    if not ok:
+        sys.exit(error_msg)
+
+    endpoints = ('lesson', 'advanced-lesson', 'reflect') if args.endpoint == 'all' else (args.endpoint,)
+    items = [item for item in catalogue(endpoints, args.levels.split(','))
+             if not args.keys or item[1].startswith(args.keys)]
+    print(f"{len(items)} catalogue keys x {args.variants} variants -> {app.content_store.path}")
+
+    if args.mode == 'batch':
+        results, failures = run_batch(items, args.variants, args.poll_interval)
+    else:
+        results, failures = run_pool(items, args.variants, args.workers)
+
+    stored = store_results(results, args.variants)
+    print(f"Stored {stored}/{len(items)} keys, {failures} failed calls")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+"""Local stand-in for the Anthropic Messages API.
+
+Answers POST /v1/messages (plain and streaming) with synthetic Ukrainian
+text after a configurable latency, at a configurable token rate, and fails
+a configurable fraction of requests with 529/500 errors. Message Batches
+are accepted too and complete immediately. Point the app at it
+with ANTHROPIC_BASE_URL so benchmarks never spend API credit:
+
+    python bench/fake_anthropic.py --port 8765 --latency 0.4 --tokens-per-second 80
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8765 ANTHROPIC_API_KEY=bench gunicorn app:app
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ['Україна', 'мова', 'пісня', 'калина', 'степ', 'козак', 'воля', 'слово',
+         'традиція', 'вишиванка', 'Дніпро', 'мудрість', 'свобода', 'родина']
+
+
+class FakeSettings:
+    def __init__(self, latency=0.4, jitter=0.1, tokens_per_second=80.0,
+                 output_tokens=300, error_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.error_rate = error_rate
+        self.requests = 0
+        self.cached_prefixes = set()
+        self.batches = {}
+        self.lock = threading.Lock()
+
+
+class FakeMessagesHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    settings = FakeSettings()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.startswith('/v1/messages'):
+            self._send_json(404, {'type': 'error', 'error': {'type': 'not_found_error', 'message': self.path}})
+            return
+
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        settings = self.settings
+        with settings.lock:
+            settings.requests += 1
+
+        if self.path.startswith('/v1/messages/batches'):
+            self._create_batch(body)
+            return
+
+        time.sleep(max(0.0, random.gauss(settings.latency, settings.jitter)))
+
+        if random.random() < settings.error_rate:
+            status = random.choice([529, 500])
+            error_type = 'overloaded_error' if status == 529 else 'api_error'
+            self._send_json(status, {'type': 'error', 'error': {'type': error_type, 'message': 'fake failure'}})
+            return
+
+        message = self._message(body)
+        if body.get('stream'):
+            try:
+                self._stream(body, message)
+            except (BrokenPipeError, ConnectionResetError):
+                # The app abandoned the stream (client gone, route timeout)
+                pass
+        else:
+            time.sleep(message['usage']['output_tokens'] / settings.tokens_per_second)
+            self._send_json(200, message)
+
+    def do_GET(self):
+        # Message Batches: GET /v1/messages/batches/<id>[/results]
+        parts = self.path.split('?')[0].strip('/').split('/')
+        if len(parts) < 4 or parts[:3] != ['v1', 'messages', 'batches'] or parts[3] not in self.settings.batches:
+            self._send_json(404, {'type': 'error', 'error': {'type': 'not_found_error', 'message': self.path}})
+            return
+        batch_id = parts[3]
+        if len(parts) == 5 and parts[4] == 'results':
+            data = ''.join(json.dumps(line, ensure_ascii=False) + '\n' for line in self.settings.batches[batch_id])
+            data = data.encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/binary')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        self._send_json(200, self._batch(batch_id, 'ended'))
+
+    def _message(self, body):
+        settings = self.settings
+        max_tokens = body.get('max_tokens', 1000)
+        output_tokens = min(max_tokens, max(1, int(random.gauss(settings.output_tokens, settings.output_tokens * 0.15))))
+        input_tokens = len(json.dumps([body.get('system'), body.get('messages', [])], ensure_ascii=False)) // 3
+        cache_usage = self._cache_usage(body)
+        return {
+            'id': f'msg_fake_{settings.requests}',
+            'type': 'message',
+            'role': 'assistant',
+            'model': body.get('model', 'fake'),
+            'content': [{'type': 'text', 'text': ' '.join(random.choice(WORDS) for _ in range(output_tokens))}],
+            'stop_reason': 'max_tokens' if output_tokens >= max_tokens else 'end_turn',
+            'stop_sequence': None,
+            'usage': {'input_tokens': input_tokens - sum(cache_usage.values()), 'output_tokens': output_tokens,
+                      **cache_usage}
+        }
+
+    def _create_batch(self, body):
+        # Results are ready immediately; the batch reports "ended" from the first poll
+        batch_id = f'msgbatch_fake_{uuid.uuid4().hex[:12]}'
+        results = []
+        for request in body.get('requests', []):
+            if random.random() < self.settings.error_rate:
+                result = {'type': 'errored', 'error': {'type': 'error', 'error': {
+                    'type': 'overloaded_error', 'message': 'fake failure'}}}
+            else:
+                result = {'type': 'succeeded', 'message': self._message(request['params'])}
+            results.append({'custom_id': request['custom_id'], 'result': result})
+        with self.settings.lock:
+            self.settings.batches[batch_id] = results
+        self._send_json(200, self._batch(batch_id, 'in_progress'))
+
+    def _batch(self, batch_id, status):
+        results = self.settings.batches[batch_id]
+        succeeded = sum(1 for line in results if line['result']['type'] == 'succeeded')
+        ended = status == 'ended'
+        now = datetime.now(timezone.utc)
+        return {
+            'id': batch_id,
+            'type': 'message_batch',
+            'processing_status': status,
+            'request_counts': {
+                'processing': 0 if ended else len(results),
+                'succeeded': succeeded if ended else 0,
+                'errored': len(results) - succeeded if ended else 0,
+                'canceled': 0,
+                'expired': 0
+            },
+            'created_at': now.isoformat(),
+            'expires_at': (now + timedelta(days=1)).isoformat(),
+            'ended_at': now.isoformat() if ended else None,
+            'archived_at': None,
+            'cancel_initiated_at': None,
+            'results_url': f"http://{self.headers['Host']}/v1/messages/batches/{batch_id}/results" if ended else None
+        }
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _event(self, name, payload):
+        self.wfile.write(f"event: {name}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n".encode())
+        self.wfile.flush()
+
+    def _cache_usage(self, body):
+        """Prompt-caching usage: the longest previously cached block prefix is
+        read, and the rest up to the last cache_control block is written"""
+        blocks = []
+        system = body.get('system')
+        if isinstance(system, list):
+            blocks.extend(system)
+        for message in body.get('messages', []):
+            if isinstance(message.get('content'), list):
+                blocks.extend(message['content'])
+            else:
+                blocks.append({'text': message.get('content', '')})
+        marked = [i for i, block in enumerate(blocks) if block.get('cache_control')]
+        if not marked:
+            return {}
+        # Compare on text only, so moving a breakpoint does not change the prefix
+        texts = [block.get('text', '') for block in blocks[:marked[-1] + 1]]
+        total = len(''.join(texts)) // 3
+        with self.settings.lock:
+            read = 0
+            for end in range(len(texts), 0, -1):
+                if tuple(texts[:end]) in self.settings.cached_prefixes:
+                    read = len(''.join(texts[:end])) // 3
+                    break
+            self.settings.cached_prefixes.add(tuple(texts))
+        return {'cache_read_input_tokens': read, 'cache_creation_input_tokens': total - read}
+
+    def _stream(self, body, message):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        usage = message['usage']
+        self._event('message_start', {'type': 'message_start', 'message': {
+            **message, 'content': [], 'stop_reason': None, 'usage': {**usage, 'output_tokens': 1}
+        }})
+        self._event('content_block_start', {'type': 'content_block_start', 'index': 0,
+                                            'content_block': {'type': 'text', 'text': ''}})
+        interval = 1.0 / self.settings.tokens_per_second
+        for word in message['content'][0]['text'].split(' '):
+            time.sleep(interval)
+            self._event('content_block_delta', {'type': 'content_block_delta', 'index': 0,
+                                                'delta': {'type': 'text_delta', 'text': word + ' '}})
+        self._event('content_block_stop', {'type': 'content_block_stop', 'index': 0})
+        self._event('message_delta', {'type': 'message_delta',
+                                      'delta': {'stop_reason': message['stop_reason'], 'stop_sequence': None},
+                                      'usage': {'output_tokens': usage['output_tokens']}})
+        self._event('message_stop', {'type': 'message_stop'})
+
+
+def make_server(host='127.0.0.1', port=8765, **settings):
+    """Build (but do not start) a fake API server"""
+    handler = type('Handler', (FakeMessagesHandler,), {'settings': FakeSettings(**settings)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Anthropic Messages API for benchmarks')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.4, help='mean seconds before the first token')
+    parser.add_argument('--jitter', type=float, default=0.1, help='stddev of the latency in seconds')
+    parser.add_argument('--tokens-per-second', type=float, default=80.0)
+    parser.add_argument('--output-tokens', type=int, default=300, help='mean tokens per response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests failing with 529/500')
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, latency=args.latency, jitter=args.jitter,
+                         tokens_per_second=args.tokens_per_second, output_tokens=args.output_tokens,
+                         error_rate=args.error_rate)
+    print(f"Fake Anthropic API listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Import-time profile of the app, for catching slow-startup regressions in CI.
+
+    python bench/import_profile.py                      # import app, show the slowest modules
+    python bench/import_profile.py --module asgi --budget-ms 400
+
+Imports the module in a fresh interpreter under `python -X importtime`
+(with APP_MANAGED_STARTUP=1, so no warm-up starts) and reports the median
+of --runs imports. Exits non-zero when the import exceeds --budget-ms or
+pulls in a module that must load lazily (--forbid, by default the
+Anthropic SDK and its httpx/pydantic stack).
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAZY_MODULES = ('anthropic', 'httpx', 'pydantic')
+
+
+def profile(module):
+    """Import `module` once; returns {module_name: (self_us, cumulative_us)}"""
+    env = dict(os.environ, APP_MANAGED_STARTUP='1')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.exit(f"import {module} failed:\n{result.stderr}")
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import-time profile of the app')
+    parser.add_argument('--module', default='app', help='module to import (app or asgi)')
+    parser.add_argument('--runs', type=int, default=3, help='imports to take the median of')
+    parser.add_argument('--top', type=int, default=15, help='slowest modules to list')
+    parser.add_argument('--budget-ms', type=float, help='fail when the import takes longer')
+    parser.add_argument('--forbid', default=','.join(LAZY_MODULES),
+                        help='comma-separated modules that must not be imported')
+    args = parser.parse_args()
+
+    runs = [profile(args.module) for _ in range(args.runs)]
+    total_ms = statistics.median(run[args.module][1] for run in runs) / 1000
+    last = runs[-1]
+
+    print(f"import {args.module}: {total_ms:.1f} ms (median of {args.runs})")
+    print(f"{'cumulative ms':>14} {'self ms':>8}  module")
+    slowest = sorted(last.items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+    for name, (self_us, cumulative_us) in slowest:
+        print(f"{cumulative_us / 1000:14.1f} {self_us / 1000:8.1f}  {name}")
+
+    failures = []
+    forbidden = [name for name in args.forbid.split(',') if name and name in last]
+    if forbidden:
+        failures.append(f"imported at startup: {', '.join(forbidden)}")
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        failures.append(f"{total_ms:.1f} ms exceeds the {args.budget_ms:.0f} ms budget")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
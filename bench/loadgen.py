@@ -0,0 +1,282 @@
+"""Load generator for the API routes.
+
+Drives /api/daily-wisdom, /api/lesson, /api/advanced-lesson, /api/chat and
+/api/reflect with a weighted, realistic mix from a pool of keep-alive
+connections, then reports p50/p95/p99 latency, time-to-first-byte,
+time-to-first-token (for streamed requests) and throughput, per route and
+overall. Results are written as JSON tagged with the git commit, and can be
+compared against an earlier run to catch regressions:
+
+    python bench/loadgen.py --url http://127.0.0.1:8080 --duration 30 \\
+        --out bench/results/after.json --compare bench/results/before.json
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prompts import ADVANCED_CATEGORIES, PROMPTS  # noqa: E402
+
+# Page loads dominate; lesson cards are the most common clicks
+ROUTE_MIX = {
+    'daily-wisdom': 40,
+    'advanced-lesson': 25,
+    'lesson': 15,
+    'chat': 15,
+    'reflect': 5
+}
+
+LESSON_TYPES = ['language', 'history', 'culture', 'folklore']
+
+ADVANCED_KEYS = [(category, subcategory)
+                 for category in ADVANCED_CATEGORIES
+                 for subcategory in PROMPTS.subcategories(category)]
+
+CHAT_MESSAGES = [
+    'Як вивчити українську?',
+    'Розкажи про Шевченка',
+    'Які традиції на Різдво?',
+    'Що означає вишиванка?',
+    'Порадь українську книгу',
+    'Хто такі козаки?',
+    'Як готувати борщ?',
+    'Розкажи про Лесю Українку'
+]
+
+STORIES = [
+    'Моя бабуся з Полтави, і я виріс на її піснях.',
+    'Я народилася у Львові, але зараз живу в Канаді.',
+    'Мій дід був з Києва, а я вперше їду в Україну цього літа.',
+    'Я з Харкова, вивчаю українську мову та історію.',
+    'Наша родина з Одеси, ми святкуємо всі українські свята.'
+]
+
+PERCENTILES = (50, 95, 99)
+
+# Allowed rise in the share of failed requests (429s included) against a baseline
+MAX_ERROR_RATE_INCREASE = 0.01
+
+
+def build_request(route, rng):
+    """Return (method, path, body) for one request on `route`"""
+    if route == 'daily-wisdom':
+        return 'GET', '/api/daily-wisdom?tz=Europe/Kyiv', None
+    if route == 'lesson':
+        return 'POST', '/api/lesson', {'type': rng.choice(LESSON_TYPES), 'level': 'початковий'}
+    if route == 'advanced-lesson':
+        category, subcategory = rng.choice(ADVANCED_KEYS)
+        return 'POST', '/api/advanced-lesson', {'category': category, 'subcategory': subcategory,
+                                                'subcategoryName': subcategory}
+    if route == 'chat':
+        return 'POST', '/api/chat', {'message': rng.choice(CHAT_MESSAGES)}
+    return 'POST', '/api/reflect', {'story': rng.choice(STORIES)}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples, elapsed):
+    """Aggregate raw samples into latency/TTFB/TTFT percentiles and throughput"""
+    ok = [s for s in samples if s['status'] < 400]
+    # Latency covers successful requests only, so a run that sheds load
+    # with fast 429s must be caught by its error rate instead
+    summary = {
+        'requests': len(samples),
+        'errors': len(samples) - len(ok),
+        'rejected': sum(1 for s in samples if s['status'] == 429),
+        'error_rate': round((len(samples) - len(ok)) / len(samples), 4) if samples else 0.0,
+        'throughput_rps': round(len(ok) / elapsed, 2) if elapsed else 0.0
+    }
+    for metric in ('latency', 'ttfb', 'ttft'):
+        values = sorted(s[metric] for s in ok if s.get(metric) is not None)
+        for pct in PERCENTILES:
+            value = percentile(values, pct)
+            summary[f'{metric}_p{pct}_ms'] = round(value * 1000, 1) if value is not None else None
+    return summary
+
+
+class Worker(threading.Thread):
+    def __init__(self, url, deadline, stream_ratio, seed, samples, lock):
+        super().__init__(daemon=True)
+        self.url = urlparse(url)
+        self.deadline = deadline
+        self.stream_ratio = stream_ratio
+        self.rng = random.Random(seed)
+        self.samples = samples
+        self.lock = lock
+        self.conn = None
+        self.routes = list(ROUTE_MIX)
+        self.weights = [ROUTE_MIX[route] for route in self.routes]
+
+    def connect(self):
+        self.conn = http.client.HTTPConnection(self.url.hostname, self.url.port or 80, timeout=120)
+
+    def run(self):
+        self.connect()
+        while time.monotonic() < self.deadline:
+            route = self.rng.choices(self.routes, self.weights)[0]
+            sample = self.request(route)
+            with self.lock:
+                self.samples.append(sample)
+
+    def request(self, route):
+        method, path, body = build_request(route, self.rng)
+        stream = body is not None and self.rng.random() < self.stream_ratio
+        headers = {'Content-Type': 'application/json'}
+        if stream:
+            body['stream'] = True
+            headers['Accept'] = 'text/event-stream'
+        payload = json.dumps(body, ensure_ascii=False).encode() if body is not None else None
+
+        sample = {'route': route, 'stream': stream, 'status': 599, 'latency': None, 'ttfb': None, 'ttft': None}
+        start = time.monotonic()
+        try:
+            self.conn.request(method, path, body=payload, headers=headers)
+            response = self.conn.getresponse()
+            response.read(1)
+            sample['ttfb'] = time.monotonic() - start
+            if response.getheader('Content-Type', '').startswith('text/event-stream'):
+                while True:
+                    line = response.readline()
+                    if not line:
+                        break
+                    if sample['ttft'] is None and line.startswith(b'data: {"text"'):
+                        sample['ttft'] = time.monotonic() - start
+            else:
+                response.read()
+                sample['ttft'] = sample['ttfb']
+            sample['status'] = response.status
+            sample['latency'] = time.monotonic() - start
+            if response.getheader('Connection', '').lower() == 'close':
+                self.conn.close()
+                self.connect()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.connect()
+        return sample
+
+
+def run_load(url, duration=30.0, concurrency=16, stream_ratio=0.5, seed=1, warmup=0.0):
+    """Run the load for `duration` seconds and return the result document"""
+    if warmup:
+        run_load(url, duration=warmup, concurrency=concurrency, stream_ratio=stream_ratio, seed=seed + 1000)
+
+    samples = []
+    lock = threading.Lock()
+    start = time.monotonic()
+    deadline = start + duration
+    workers = [Worker(url, deadline, stream_ratio, seed + i, samples, lock) for i in range(concurrency)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.monotonic() - start
+
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'url': url,
+            'duration_s': duration,
+            'concurrency': concurrency,
+            'stream_ratio': stream_ratio,
+            'seed': seed,
+            'mix': ROUTE_MIX
+        },
+        'overall': summarize(samples, elapsed),
+        'routes': {route: summarize([s for s in samples if s['route'] == route], elapsed)
+                   for route in ROUTE_MIX}
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(result):
+    columns = ('requests', 'errors', 'rejected', 'throughput_rps', 'latency_p50_ms', 'latency_p95_ms',
+               'latency_p99_ms', 'ttfb_p50_ms', 'ttft_p50_ms', 'ttft_p95_ms')
+    print(f"{'route':<16}" + ''.join(f'{name:>16}' for name in columns))
+    rows = list(result['routes'].items()) + [('overall', result['overall'])]
+    for route, summary in rows:
+        print(f'{route:<16}' + ''.join(f"{'-' if summary[name] is None else summary[name]:>16}" for name in columns))
+
+
+def compare(result, baseline, max_regression):
+    """Print error rate and p95 latency/TTFB deltas against a baseline; return True if within tolerance"""
+    ok = True
+    print(f"\nvs {baseline['meta'].get('commit')} (max regression {max_regression:.0%})")
+    for route in ['overall'] + list(result['routes']):
+        current = result['overall'] if route == 'overall' else result['routes'][route]
+        previous = baseline['overall'] if route == 'overall' else baseline['routes'].get(route)
+        if not previous:
+            continue
+        before, after = previous.get('error_rate'), current.get('error_rate')
+        if before is not None and after is not None:
+            flag = ''
+            if after - before > MAX_ERROR_RATE_INCREASE:
+                flag = '  REGRESSION'
+                ok = False
+            print(f'{route:<16}{"error_rate":<16}{before:>10.2%} -> {after:>10.2%}{flag}')
+        for metric in ('latency_p95_ms', 'ttfb_p95_ms', 'ttft_p95_ms'):
+            before, after = previous.get(metric), current.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            flag = ''
+            if change > max_regression:
+                flag = '  REGRESSION'
+                ok = False
+            print(f'{route:<16}{metric:<16}{before:>10.1f} -> {after:>10.1f} ms ({change:+.1%}){flag}')
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load generator for the API routes')
+    parser.add_argument('--url', default='http://127.0.0.1:8080')
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds of measured load')
+    parser.add_argument('--warmup', type=float, default=0.0, help='seconds of unmeasured load first')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--stream-ratio', type=float, default=0.5,
+                        help='fraction of POST requests that ask for SSE streaming')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', help='write the JSON result here')
+    parser.add_argument('--compare', help='baseline JSON result to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.10,
+                        help='allowed relative p95 increase before failing (default 0.10)')
+    args = parser.parse_args()
+
+    result = run_load(args.url, args.duration, args.concurrency, args.stream_ratio, args.seed, args.warmup)
+    print_report(result)
+
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if not compare(result, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
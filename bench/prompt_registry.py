@@ -0,0 +1,64 @@
+"""Micro-benchmark: per-request prompt construction, before and after the registry.
+
+"Before" reproduces what the handlers used to do on every request: rebuild
+the whole advanced-lesson table to look up one entry, and format all four
+basic lesson templates to use one of them.
+
+    python bench/prompt_registry.py [--number N]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prompts import ADVANCED_TEMPLATES, LESSON_TEMPLATES, PROMPTS  # noqa: E402
+
+
+# Compiled from a dict literal, exactly like the old inline table, so the
+# timing includes CPython's per-call BUILD_MAP work and nothing more
+_LEGACY_ADVANCED_SOURCE = f"""
+def legacy_advanced(category, subcategory):
+    advanced_prompts = {ADVANCED_TEMPLATES!r}
+    return advanced_prompts.get(category, {{}}).get(subcategory)
+"""
+exec(_LEGACY_ADVANCED_SOURCE)
+
+
+def legacy_lesson(lesson_type, level):
+    lesson_prompts = {name: text.format(level=level) for name, text in LESSON_TEMPLATES.items()}
+    return lesson_prompts.get(lesson_type, lesson_prompts['language'])
+
+
+def registry_advanced(category, subcategory):
+    return PROMPTS.render(category, subcategory)
+
+
+def registry_lesson(lesson_type, level):
+    return PROMPTS.render('lesson', lesson_type, level)
+
+
+def measure(func, args, number):
+    seconds = min(timeit.repeat(lambda: func(*args), number=number, repeat=5))
+    return seconds / number * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--number', type=int, default=20000, help='calls per timing run')
+    args = parser.parse_args()
+
+    cases = [
+        ('advanced-lesson', legacy_advanced, registry_advanced, ('history', 'cossack_state')),
+        ('lesson', legacy_lesson, registry_lesson, ('history', 'початковий'))
+    ]
+    print(f"{'route':<16} {'before ns':>10} {'after ns':>10} {'speedup':>8}")
+    for route, before, after, call_args in cases:
+        before_ns = measure(before, call_args, args.number)
+        after_ns = measure(after, call_args, args.number)
+        print(f"{route:<16} {before_ns:>10.0f} {after_ns:>10.0f} {before_ns / after_ns:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
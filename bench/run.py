@@ -0,0 +1,122 @@
+"""One-shot benchmark: fake API + app server + load generator.
+
+Starts the fake Messages API in-process, launches the app against it in a
+subprocess (the same gunicorn entry point production uses), waits for it to
+come up, runs the load mix and writes a result JSON named after the current
+commit. Every run starts from empty caches, so results are comparable
+across commits:
+
+    python bench/run.py --duration 30
+    python bench/run.py --server async --compare bench/results/<commit>.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_anthropic import make_server  # noqa: E402
+from loadgen import compare, git_commit, print_report, run_load  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVER_COMMANDS = {
+    'sync': ['gunicorn', 'app:app'],
+    'async': ['gunicorn', 'asgi:app'],
+    'dev': [sys.executable, 'app.py']
+}
+
+
+def wait_until_up(url, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=2) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"App did not come up at {url}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the full local benchmark')
+    parser.add_argument('--server', choices=sorted(SERVER_COMMANDS), default='sync')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--fake-port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--warmup', type=float, default=5.0)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--stream-ratio', type=float, default=0.5)
+    parser.add_argument('--latency', type=float, default=0.4)
+    parser.add_argument('--tokens-per-second', type=float, default=80.0)
+    parser.add_argument('--output-tokens', type=int, default=300)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--out', help='result path (default bench/results/<commit>-<server>.json)')
+    parser.add_argument('--compare', help='baseline result JSON')
+    parser.add_argument('--max-regression', type=float, default=0.10)
+    args = parser.parse_args()
+
+    fake = make_server(port=args.fake_port, latency=args.latency, tokens_per_second=args.tokens_per_second,
+                       output_tokens=args.output_tokens, error_rate=args.error_rate)
+    threading.Thread(target=fake.serve_forever, daemon=True).start()
+
+    cache_dir = tempfile.mkdtemp(prefix='bench-cache-')
+    env = dict(
+        os.environ,
+        ANTHROPIC_BASE_URL=f'http://127.0.0.1:{args.fake_port}',
+        ANTHROPIC_API_KEY='bench',
+        PORT=str(args.port),
+        WEB_WORKERS=str(args.workers),
+        WEB_ACCESS_LOG='/dev/null',
+        SERVER_MODE='async' if args.server == 'async' else 'sync',
+        # A handful of load generator clients would otherwise spend the run on 429s
+        RATE_LIMIT_CLIENT_ENABLED='0',
+        RATE_LIMIT_SESSION_ENABLED='0',
+        # Everything the app persists goes to this run's directory
+        WISDOM_CACHE_FILE=os.path.join(cache_dir, 'daily_wisdom.json'),
+        CONTENT_STORE_PATH=os.path.join(cache_dir, 'content.db'),
+        CHAT_SESSIONS_PATH=os.path.join(cache_dir, 'chat_sessions.db'),
+        JOURNAL_PATH=os.path.join(cache_dir, 'journal', 'requests.jsonl')
+    )
+    server = subprocess.Popen(SERVER_COMMANDS[args.server], cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{args.port}'
+    try:
+        wait_until_up(url + '/')
+        result = run_load(url, args.duration, args.concurrency, args.stream_ratio, warmup=args.warmup)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+        fake.shutdown()
+
+    result['meta'].update({
+        'server': args.server,
+        'workers': args.workers,
+        'fake_api': {'latency': args.latency, 'tokens_per_second': args.tokens_per_second,
+                     'output_tokens': args.output_tokens, 'error_rate': args.error_rate}
+    })
+    print_report(result)
+
+    out = args.out or os.path.join(ROOT, 'bench', 'results', f"{git_commit() or 'unknown'}-{args.server}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\nResults written to {out}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if not compare(result, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from difflib import SequenceMatcher
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+
+# Words that can differ between two phrasings of the same question:
+# conjunctions, the в/у alternation, particles and politeness. Anything
+# else, including numbers, roman numerals, question words and
+# prepositions, is a content word.
+FILLER_WORDS = frozenset([
+    'і', 'й', 'та', 'а', 'в', 'у', 'ж', 'же', 'б', 'би', 'ну', 'от', 'ось',
+    'будь', 'ласка', 'мені', 'please'
+])
+
+# Common Ukrainian inflectional endings, longest first. Stripping them is a
+# deliberately light stemmer: it only needs to make "Шевченка" and
+# "Шевченко" collide, not to be linguistically exact.
+UKRAINIAN_SUFFIXES = sorted([
+    'ами', 'ями', 'ові', 'еві', 'єві', 'ого', 'ому', 'ими', 'іми',
+    'ах', 'ях', 'ів', 'їв', 'ою', 'ею', 'єю', 'ом', 'ем', 'єм', 'ий', 'ій',
+    'ої', 'их', 'ім', 'им', 'ти', 'ть', 'ся', 'ли', 'ла', 'ло',
+    'а', 'я', 'о', 'е', 'є', 'и', 'і', 'ї', 'у', 'ю', 'й'
+], key=len, reverse=True)
+
+
+def stem_word(word):
+    """Strip one inflectional ending, keeping a stem of at least 3 letters"""
+    for suffix in UKRAINIAN_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def normalize_message(text, stem=False):
+    """Casefold and strip punctuation and extra whitespace from a message"""
+    text = text.casefold().replace('’', "'").replace("'", '')
+    words = _NON_WORD.sub(' ', text).split()
+    if stem:
+        words = [stem_word(word) for word in words]
+    return ' '.join(words)
+
+
+def content_words(key):
+    """Sorted content words of a normalised key"""
+    return tuple(sorted(word for word in key.split() if word not in FILLER_WORDS))
+
+
+class ChatResponseCache:
+    """LRU/TTL cache of chat responses keyed on normalised messages.
+
+    Lookups match the exact normalised key. When `threshold` is below 1.0,
+    the most recently used `scan_limit` entries are also compared word by
+    word: a candidate qualifies only if it has exactly the same content
+    words (numbers and roman numerals included), so phrasings may differ
+    only in filler words, and the best one whose word-level similarity
+    ratio reaches the threshold is served.
+    """
+
+    def __init__(self, max_entries=1000, ttl=86400, max_bytes=8 * 1024 * 1024,
+                 threshold=1.0, stem=False, scan_limit=200, enabled=True):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.threshold = threshold
+        self.stem = stem
+        self.scan_limit = scan_limit
+        self.enabled = enabled
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls, prefix='CHAT_CACHE'):
+        """Build a cache from <prefix>_* environment variables"""
+        return cls(
+            max_entries=int(os.getenv(f'{prefix}_MAX_ENTRIES', '1000')),
+            ttl=float(os.getenv(f'{prefix}_TTL', '86400')),
+            max_bytes=int(os.getenv(f'{prefix}_MAX_BYTES', str(8 * 1024 * 1024))),
+            threshold=float(os.getenv(f'{prefix}_THRESHOLD', '1.0')),
+            stem=os.getenv(f'{prefix}_STEM', '0') == '1',
+            scan_limit=int(os.getenv(f'{prefix}_SCAN_LIMIT', '200')),
+            enabled=os.getenv(f'{prefix}_ENABLED', '1') != '0'
+        )
+
+    def get(self, message):
+        """Return a cached response for `message`, or None"""
+        if not self.enabled:
+            return None
+        key = normalize_message(message, self.stem)
+        if not key:
+            return None
+
+        with self._lock:
+            entry = self._live(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            if self.threshold < 1.0:
+                match = self._nearest(key)
+                if match is not None:
+                    self._entries.move_to_end(match)
+                    self.near_hits += 1
+                    return self._entries[match][1]
+
+            self.misses += 1
+            return None
+
+    def put(self, message, response):
+        if not self.enabled or not response:
+            return
+        key = normalize_message(message, self.stem)
+        if not key:
+            return
+        size = len(key.encode()) + len(response.encode())
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (time.time(), response, size, content_words(key))
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[2]
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.near_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'near_hits': self.near_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits + self.near_hits) / lookups if lookups else 0.0
+            }
+
+    def _live(self, key):
+        # Caller holds the lock
+        entry = self._entries.get(key)
+        if entry is not None and time.time() - entry[0] > self.ttl:
+            del self._entries[key]
+            self._bytes -= entry[2]
+            return None
+        return entry
+
+    def _nearest(self, key):
+        # Caller holds the lock; walk the most recently used entries only
+        best_key, best_ratio = None, self.threshold
+        cutoff = time.time() - self.ttl
+        words = content_words(key)
+        matcher = SequenceMatcher(None, autojunk=False)
+        matcher.set_seq2(key.split())
+        for index, (candidate, entry) in enumerate(reversed(self._entries.items())):
+            if index >= self.scan_limit:
+                break
+            if entry[0] < cutoff or entry[3] != words:
+                continue
+            matcher.set_seq1(candidate.split())
+            if matcher.real_quick_ratio() < best_ratio or matcher.quick_ratio() < best_ratio:
+                continue
+            ratio = matcher.ratio()
+            if ratio >= best_ratio:
+                best_key, best_ratio = candidate, ratio
+        return best_key
@@ -0,0 +1,241 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from token_budget import estimate_tokens
+
+_SESSION_ID = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chat_sessions (
+    session_id TEXT PRIMARY KEY,
+    turns TEXT NOT NULL,
+    topics TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS chat_sessions_last_used ON chat_sessions (last_used);
+
+CREATE TABLE IF NOT EXISTS chat_sessions_totals (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    sessions INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+"""
+
+# Running totals for stores written before chat_sessions_totals existed
+BACKFILL = """
+INSERT OR IGNORE INTO chat_sessions_totals (id, sessions, size)
+SELECT 0, count(*), coalesce(sum(size), 0) FROM chat_sessions
+"""
+
+
+class _Session:
+    __slots__ = ('turns', 'topics', 'size')
+
+    def __init__(self, turns=(), topics=()):
+        self.turns = [tuple(turn) for turn in turns]
+        self.topics = list(topics)
+        self.size = sum(len(user_text.encode()) + len(assistant_text.encode())
+                        for user_text, assistant_text in self.turns)
+        self.size += sum(len(topic.encode()) for topic in self.topics)
+
+
+class ChatSessionStore:
+    """Bounded chat histories keyed by a client-supplied session id.
+
+    Sessions live in a SQLite file in WAL mode shared by every worker
+    process (like content_store), so a follow-up turn sees its history
+    whichever worker gunicorn hands it to.
+
+    Each session keeps its most recent (user, assistant) turns within
+    `history_tokens`. Once over, older turns are compacted down to half the
+    budget into a short list of the topics the user asked about, which is
+    sent ahead of the history instead of the full exchange. Compacting in
+    steps keeps the history prefix unchanged for several turns, so it can
+    be served from the API's prompt cache. Sessions idle for longer than `idle_ttl` expire,
+    and the least recently used ones are evicted once `max_sessions` or
+    `max_bytes` is exceeded. The session count and total size are kept as
+    running totals updated in the same transaction as each write, so
+    checking the bounds never scans the table.
+
+    History is best-effort: a locked or unreadable file costs the
+    conversation its context, never the answer.
+    """
+
+    def __init__(self, path, max_sessions=10000, max_bytes=32 * 1024 * 1024, idle_ttl=3600,
+                 history_tokens=1500, max_topics=8, topic_chars=80, enabled=True):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.history_tokens = history_tokens
+        self.max_topics = max_topics
+        self.topic_chars = topic_chars
+        self.enabled = enabled
+        self._local = threading.local()
+        self.compactions = 0
+        self.evictions = 0
+        self.errors = 0
+
+    @classmethod
+    def from_env(cls, prefix='CHAT_SESSIONS'):
+        """Build a store from <prefix>_* environment variables"""
+        default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'chat_sessions.db')
+        return cls(
+            path=os.getenv(f'{prefix}_PATH', default_path),
+            max_sessions=int(os.getenv(f'{prefix}_MAX_SESSIONS', '10000')),
+            max_bytes=int(os.getenv(f'{prefix}_MAX_BYTES', str(32 * 1024 * 1024))),
+            idle_ttl=float(os.getenv(f'{prefix}_IDLE_TTL', '3600')),
+            history_tokens=int(os.getenv(f'{prefix}_HISTORY_TOKENS', '1500')),
+            max_topics=int(os.getenv(f'{prefix}_MAX_TOPICS', '8')),
+            enabled=os.getenv(f'{prefix}_ENABLED', '1') != '0'
+        )
+
+    @staticmethod
+    def valid_id(session_id):
+        return isinstance(session_id, str) and bool(_SESSION_ID.match(session_id))
+
+    def messages(self, session_id):
+        """Return the session history as Messages API turns (empty if none)"""
+        if not self.enabled or not session_id:
+            return []
+        try:
+            session = self._load(self._db(), session_id)
+        except sqlite3.Error as e:
+            self.errors += 1
+            print(f"Chat session read failed: {e}")
+            return []
+        if session is None:
+            return []
+
+        messages = []
+        for user_text, assistant_text in session.turns:
+            messages.append({"role": "user", "content": user_text})
+            messages.append({"role": "assistant", "content": assistant_text})
+        if session.topics and messages:
+            note = 'Раніше в цій розмові ми говорили про: ' + '; '.join(session.topics)
+            messages[0] = {"role": "user", "content": f"{note}\n\n{messages[0]['content']}"}
+        return messages
+
+    def append(self, session_id, user_text, assistant_text):
+        """Record one completed turn, compacting and evicting as needed"""
+        if not self.enabled or not session_id or not assistant_text:
+            return
+        try:
+            db = self._db()
+            # IMMEDIATE takes the write lock up front, so two workers
+            # answering the same session cannot drop each other's turn
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                session = self._load(db, session_id) or _Session()
+                session.turns.append((user_text, assistant_text))
+                session.size += len(user_text.encode()) + len(assistant_text.encode())
+                self._compact(session)
+                # An expired row not yet evicted is replaced too, so its
+                # size comes off the totals whether or not it was loaded
+                old = db.execute('SELECT size FROM chat_sessions WHERE session_id = ?', (session_id,)).fetchone()
+                db.execute('INSERT OR REPLACE INTO chat_sessions (session_id, turns, topics, size, last_used) '
+                           'VALUES (?, ?, ?, ?, ?)',
+                           (session_id, json.dumps(session.turns, ensure_ascii=False),
+                            json.dumps(session.topics, ensure_ascii=False), session.size, time.time()))
+                self._adjust(db, 0 if old else 1, session.size - (old[0] if old else 0))
+                self._evict(db)
+                db.execute('COMMIT')
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            self.errors += 1
+            print(f"Chat session write failed: {e}")
+
+    def stats(self):
+        sessions, size = 0, 0
+        if self.enabled:
+            try:
+                sessions, size = self._totals(self._db())
+            except sqlite3.Error:
+                self.errors += 1
+        return {
+            'sessions': sessions,
+            'bytes': size,
+            'compactions': self.compactions,
+            'evictions': self.evictions,
+            'errors': self.errors
+        }
+
+    def _load(self, db, session_id):
+        row = db.execute('SELECT turns, topics FROM chat_sessions WHERE session_id = ? AND last_used >= ?',
+                         (session_id, time.time() - self.idle_ttl)).fetchone()
+        return _Session(json.loads(row[0]), json.loads(row[1])) if row else None
+
+    def _compact(self, session):
+        if self._tokens(session) <= self.history_tokens:
+            return
+        # Always keep the latest turn, however long it is
+        while len(session.turns) > 1 and self._tokens(session) > self.history_tokens // 2:
+            user_text, assistant_text = session.turns.pop(0)
+            session.size -= len(user_text.encode()) + len(assistant_text.encode())
+            topic = ' '.join(user_text.split())[:self.topic_chars]
+            session.topics.append(topic)
+            session.size += len(topic.encode())
+            if len(session.topics) > self.max_topics:
+                session.size -= len(session.topics.pop(0).encode())
+            self.compactions += 1
+
+    def _tokens(self, session):
+        return sum(estimate_tokens(user_text) + estimate_tokens(assistant_text)
+                   for user_text, assistant_text in session.turns)
+
+    def _evict(self, db):
+        # Caller holds the write transaction. Both queries walk the
+        # last_used index and touch only the rows being dropped
+        cutoff = time.time() - self.idle_ttl
+        expired, expired_size = db.execute('SELECT count(*), coalesce(sum(size), 0) FROM chat_sessions '
+                                           'WHERE last_used < ?', (cutoff,)).fetchone()
+        if expired:
+            db.execute('DELETE FROM chat_sessions WHERE last_used < ?', (cutoff,))
+        count, size = self._totals(db)
+        count, size = count - expired, size - expired_size
+        evicted, evicted_size = 0, 0
+        while count > self.max_sessions or size > self.max_bytes:
+            row = db.execute('SELECT session_id, size FROM chat_sessions ORDER BY last_used LIMIT 1').fetchone()
+            if row is None:
+                break
+            db.execute('DELETE FROM chat_sessions WHERE session_id = ?', (row[0],))
+            count, size = count - 1, size - row[1]
+            evicted, evicted_size = evicted + 1, evicted_size + row[1]
+            self.evictions += 1
+        if expired or evicted:
+            self._adjust(db, -(expired + evicted), -(expired_size + evicted_size))
+
+    def _totals(self, db):
+        return db.execute('SELECT sessions, size FROM chat_sessions_totals WHERE id = 0').fetchone()
+
+    def _adjust(self, db, sessions, size):
+        db.execute('UPDATE chat_sessions_totals SET sessions = sessions + ?, size = size + ? WHERE id = 0',
+                   (sessions, size))
+
+    def _db(self):
+        # One connection per thread, reopened after a fork: sqlite3
+        # connections must not be shared across threads or processes
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = self._local.db = self._connect()
+            self._local.pid = os.getpid()
+        return db
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        created = db.execute("SELECT 1 FROM sqlite_master WHERE name = 'chat_sessions_totals'").fetchone() is None
+        db.executescript(SCHEMA)
+        if created:
+            db.execute(BACKFILL)
+        return db
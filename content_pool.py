@@ -0,0 +1,171 @@
+"""Per-worker pools of pre-generated model responses.
+
+Routes take a ready response instead of waiting on the model, and a few
+background threads refill each pool from the producer its last request
+registered. Per-key sizes and TTLs can be overridden with
+CONTENT_POOL_OVERRIDES, a JSON object keyed like "lesson:history:середній".
+"""
+import json
+import os
+import random
+import threading
+import time
+import queue
+
+
+class ContentPool:
+    """Per-key pools of pre-generated model responses.
+
+    Each key (e.g. a lesson type or an advanced-lesson subcategory) holds up
+    to `size` ready responses. Requests take one instantly; when a pool drops
+    below its low-water mark a background worker tops it back up using the
+    producer registered for that key. Entries older than `ttl` seconds are
+    discarded so content keeps rotating.
+    """
+
+    def __init__(self, size=3, low_water=1, ttl=3600, max_uses=1, pick='random',
+                 max_keys=256, workers=2, overrides=None, enabled=True):
+        self.size = size
+        self.low_water = low_water
+        self.ttl = ttl
+        self.max_uses = max_uses
+        self.pick = pick
+        self.max_keys = max_keys
+        self.workers = workers
+        self.enabled = enabled
+        self._overrides = dict(overrides or {})
+        self._entries = {}
+        self._producers = {}
+        self._pending = set()
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._pid = None
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls, prefix='CONTENT_POOL'):
+        """Build a pool from <prefix>_* environment variables"""
+        overrides = os.getenv(f'{prefix}_OVERRIDES')
+        return cls(
+            size=int(os.getenv(f'{prefix}_SIZE', '3')),
+            low_water=int(os.getenv(f'{prefix}_LOW_WATER', '1')),
+            ttl=float(os.getenv(f'{prefix}_TTL', '3600')),
+            max_uses=int(os.getenv(f'{prefix}_MAX_USES', '1')),
+            pick=os.getenv(f'{prefix}_PICK', 'random'),
+            max_keys=int(os.getenv(f'{prefix}_MAX_KEYS', '256')),
+            workers=int(os.getenv(f'{prefix}_WORKERS', '2')),
+            overrides=json.loads(overrides) if overrides else None,
+            enabled=os.getenv(f'{prefix}_ENABLED', '1') != '0'
+        )
+
+    def take(self, key, producer):
+        """Return a pooled response for `key`, or None if the pool is empty.
+
+        `producer` is a zero-argument callable that generates one fresh
+        response; it is remembered for background refills of this key.
+        """
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            if key not in self._producers and len(self._producers) >= self.max_keys:
+                return None
+            self._producers[key] = producer
+            entries = self._live_entries(key)
+
+            text = None
+            if entries:
+                index = random.randrange(len(entries)) if self.pick == 'random' else 0
+                entry = entries[index]
+                entry[2] += 1
+                if entry[2] >= self.max_uses:
+                    entries.pop(index)
+                text = entry[1]
+                self.hits += 1
+            else:
+                self.misses += 1
+
+            if len(entries) < self._setting(key, 'low_water'):
+                self._schedule(key)
+
+        return text
+
+    def peek(self, key):
+        """Return a pooled response for `key` without using it up, or None.
+
+        Read-only: the entry stays in the pool and no refill is scheduled.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                return None
+            cutoff = time.time() - self._setting(key, 'ttl')
+            live = [entry for entry in entries if entry[0] >= cutoff]
+            return random.choice(live)[1] if live else None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'keys': len(self._producers),
+                'entries': sum(len(entries) for entries in self._entries.values()),
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+    def _key_name(self, key):
+        return ':'.join(str(part) for part in key) if isinstance(key, tuple) else str(key)
+
+    def _setting(self, key, name):
+        return self._overrides.get(self._key_name(key), {}).get(name, getattr(self, name))
+
+    def _live_entries(self, key):
+        # Caller holds the lock
+        entries = self._entries.setdefault(key, [])
+        cutoff = time.time() - self._setting(key, 'ttl')
+        if entries and entries[0][0] < cutoff:
+            entries[:] = [entry for entry in entries if entry[0] >= cutoff]
+        return entries
+
+    def _schedule(self, key):
+        # Caller holds the lock
+        if key in self._pending:
+            return
+        self._pending.add(key)
+        self._ensure_workers()
+        self._queue.put(key)
+
+    def _ensure_workers(self):
+        # Threads do not survive fork(), so restart them in each new process
+        if self._pid == os.getpid() and all(t.is_alive() for t in self._threads):
+            return
+        self._pid = os.getpid()
+        self._threads = []
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'content-pool-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _worker(self):
+        while True:
+            key = self._queue.get()
+            try:
+                self._fill(key)
+            except Exception as e:
+                print(f"Content pool refill failed for {self._key_name(key)}: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+
+    def _fill(self, key):
+        while True:
+            with self._lock:
+                producer = self._producers.get(key)
+                if producer is None or len(self._live_entries(key)) >= self._setting(key, 'size'):
+                    return
+            text = producer()
+            with self._lock:
+                self._entries.setdefault(key, []).append([time.time(), text, 0])
@@ -0,0 +1,243 @@
+"""SQLite store of generated responses shared by every worker process.
+
+Holds the lesson catalogue rendered offline by batch_generate.py, the
+variants pools write through at runtime, and the last good answer per key
+that serve-stale falls back on. See ContentStore for the layout.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS content (
+    endpoint TEXT NOT NULL,
+    key TEXT NOT NULL,
+    variant INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (endpoint, key, variant)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS content_keys (
+    endpoint TEXT NOT NULL,
+    key TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    next INTEGER NOT NULL,
+    updated REAL NOT NULL,
+    catalogue INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (endpoint, key)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS last_good (
+    endpoint TEXT NOT NULL,
+    key TEXT NOT NULL,
+    text TEXT NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (endpoint, key)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS last_good_created ON last_good (created);
+"""
+
+# Variant counts for stores written before content_keys existed
+BACKFILL = """
+INSERT OR IGNORE INTO content_keys (endpoint, key, count, next, updated)
+SELECT endpoint, key, count(*), 0, max(created) FROM content GROUP BY endpoint, key
+"""
+
+# Catalogue flag for stores created before the column existed
+ADD_CATALOGUE = 'ALTER TABLE content_keys ADD COLUMN catalogue INTEGER NOT NULL DEFAULT 0'
+
+# One round trip: the key's variant count picks the row by primary key
+RANDOM_VARIANT = """
+SELECT c.text FROM content_keys k
+JOIN content c ON c.endpoint = k.endpoint AND c.key = k.key AND c.variant = (random() % k.count + k.count) % k.count
+WHERE k.endpoint = ? AND k.key = ? AND k.count >= ? AND (k.catalogue OR k.updated >= ?)
+"""
+
+
+class ContentStore:
+    """Shared on-disk store of generated responses keyed by (endpoint, key, variant).
+
+    A single SQLite file in WAL mode, read through mmap: every worker process
+    reads the same pages from the OS page cache instead of holding its own
+    copy, and readers never block on a writer. Variants of a key are
+    numbered 0..n-1 and counted in content_keys, so a random variant is one
+    indexed lookup. Keys are filled offline (batch_generate.py) or at
+    runtime with add(), which keeps a ring of at most `variants` entries.
+
+    A key is served once it has `min_variants` entries. A key not written to
+    for `max_age` seconds is reported missing, so the caller generates a
+    fresh variant and the content keeps rotating slowly. Keys stored with
+    replace() are catalogue keys: they were rendered offline to be served
+    until the next run replaces them, so max_age does not apply to them.
+
+    Separately, last_good holds one answer per key for serving stale when
+    the model is slow or down. Its keys include hashed free-form prompts, so
+    it is bounded: entries older than `stale_ttl` seconds are dropped, and
+    the oldest once there are more than `stale_max_keys`.
+    """
+
+    def __init__(self, path, variants=5, min_variants=3, max_age=86400,
+                 mmap_size=64 * 1024 * 1024, stale_ttl=7 * 86400, stale_max_keys=50000,
+                 prune_every=100, enabled=True):
+        self.path = path
+        self.variants = variants
+        self.min_variants = min_variants
+        self.max_age = max_age
+        self.mmap_size = mmap_size
+        self.stale_ttl = stale_ttl
+        self.stale_max_keys = stale_max_keys
+        self.prune_every = prune_every
+        self.enabled = enabled
+        self._kept = 0
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls, prefix='CONTENT_STORE'):
+        """Build a store from <prefix>_* environment variables"""
+        default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'content.db')
+        return cls(
+            path=os.getenv(f'{prefix}_PATH', default_path),
+            variants=int(os.getenv(f'{prefix}_VARIANTS', '5')),
+            min_variants=int(os.getenv(f'{prefix}_MIN_VARIANTS', '3')),
+            max_age=float(os.getenv(f'{prefix}_MAX_AGE', '86400')),
+            mmap_size=int(os.getenv(f'{prefix}_MMAP_BYTES', str(64 * 1024 * 1024))),
+            stale_ttl=float(os.getenv(f'{prefix}_STALE_TTL', str(7 * 86400))),
+            stale_max_keys=int(os.getenv(f'{prefix}_STALE_MAX_KEYS', '50000')),
+            enabled=os.getenv(f'{prefix}_ENABLED', '1') != '0'
+        )
+
+    def random(self, endpoint, key):
+        """Return a random stored variant for the key, or None"""
+        if not self.enabled:
+            return None
+        fresh_since = time.time() - self.max_age if self.max_age else 0
+        row = self._db().execute(RANDOM_VARIANT, (endpoint, key, self.min_variants, fresh_since)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def latest(self, endpoint, key):
+        """Return the most recently written variant regardless of age or count, or None"""
+        if not self.enabled:
+            return None
+        row = self._db().execute(
+            'SELECT text FROM content WHERE endpoint = ? AND key = ? ORDER BY created DESC LIMIT 1',
+            (endpoint, key)).fetchone()
+        return row[0] if row else None
+
+    def last_good(self, endpoint, key):
+        """Return the answer kept for the key, else its newest variant, or None"""
+        if not self.enabled:
+            return None
+        fresh_since = time.time() - self.stale_ttl if self.stale_ttl else 0
+        row = self._db().execute('SELECT text FROM last_good WHERE endpoint = ? AND key = ? AND created >= ?',
+                                 (endpoint, key, fresh_since)).fetchone()
+        return row[0] if row else self.latest(endpoint, key)
+
+    def keep(self, endpoint, key, text):
+        """Keep `text` as the key's last good answer, pruning the table now and then"""
+        if not self.enabled or not text:
+            return
+        db = self._db()
+        db.execute('INSERT OR REPLACE INTO last_good (endpoint, key, text, created) VALUES (?, ?, ?, ?)',
+                   (endpoint, key, text, time.time()))
+        self._kept += 1
+        if self._kept % self.prune_every == 0:
+            self.prune()
+
+    def prune(self):
+        """Drop last good answers past `stale_ttl`, then the oldest beyond `stale_max_keys`"""
+        db = self._db()
+        if self.stale_ttl:
+            db.execute('DELETE FROM last_good WHERE created < ?', (time.time() - self.stale_ttl,))
+        if self.stale_max_keys:
+            db.execute('DELETE FROM last_good WHERE created <= (SELECT created FROM last_good '
+                       'ORDER BY created DESC LIMIT 1 OFFSET ?)', (self.stale_max_keys,))
+
+    def add(self, endpoint, key, text):
+        """Add one variant, replacing the oldest once the key holds `variants`"""
+        if not self.enabled or not text:
+            return
+        db = self._db()
+        # IMMEDIATE takes the write lock up front, so concurrent writers in
+        # other processes cannot pick the same slot
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            row = db.execute('SELECT count, next, catalogue FROM content_keys WHERE endpoint = ? AND key = ?',
+                             (endpoint, key)).fetchone()
+            count, slot, catalogue = row if row else (0, 0, 0)
+            if count < self.variants:
+                slot, count = count, count + 1
+            now = time.time()
+            db.execute('INSERT OR REPLACE INTO content (endpoint, key, variant, text, created) VALUES (?, ?, ?, ?, ?)',
+                       (endpoint, key, slot, text, now))
+            db.execute('INSERT OR REPLACE INTO content_keys (endpoint, key, count, next, updated, catalogue) '
+                       'VALUES (?, ?, ?, ?, ?, ?)',
+                       (endpoint, key, count, (slot + 1) % self.variants, now, catalogue))
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+
+    def replace(self, endpoint, key, texts):
+        """Store `texts` as the catalogue variants of a key, dropping any older ones"""
+        db = self._db()
+        now = time.time()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.execute('DELETE FROM content WHERE endpoint = ? AND key = ?', (endpoint, key))
+            db.executemany('INSERT INTO content (endpoint, key, variant, text, created) VALUES (?, ?, ?, ?, ?)',
+                           [(endpoint, key, variant, text, now) for variant, text in enumerate(texts)])
+            db.execute('INSERT OR REPLACE INTO content_keys (endpoint, key, count, next, updated, catalogue) '
+                       'VALUES (?, ?, ?, ?, ?, 1)',
+                       (endpoint, key, len(texts), 0, now))
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+
+    def stats(self):
+        keys, rows, kept = 0, 0, 0
+        if self.enabled:
+            keys, rows = self._db().execute('SELECT count(*), coalesce(sum(count), 0) FROM content_keys').fetchone()
+            kept = self._db().execute('SELECT count(*) FROM last_good').fetchone()[0]
+        return {
+            'keys': keys,
+            'variants': rows,
+            'last_good': kept,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+    def _db(self):
+        # One connection per thread, reopened after a fork: sqlite3
+        # connections must not be shared across threads or processes
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = self._local.db = self._connect()
+            self._local.pid = os.getpid()
+        return db
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        db.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+        created = db.execute("SELECT 1 FROM sqlite_master WHERE name = 'content_keys'").fetchone() is None
+        db.executescript(SCHEMA)
+        if created:
+            db.execute(BACKFILL)
+        elif 'catalogue' not in {row[1] for row in db.execute('PRAGMA table_info(content_keys)')}:
+            try:
+                db.execute(ADD_CATALOGUE)
+            except sqlite3.OperationalError:
+                pass  # another process added it first
+        return db
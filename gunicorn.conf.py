@@ -0,0 +1,59 @@
+"""Gunicorn settings for production serving.
+
+    gunicorn app:app                        # threaded WSGI workers
+    SERVER_MODE=async gunicorn asgi:app     # uvicorn (ASGI) workers
+
+Every setting can be overridden through the environment variables below.
+"""
+import gc
+import multiprocessing
+import os
+
+# Warm-up is started from post_worker_init instead of at import time, so a
+# preloaded master never opens upstream connections before forking
+os.environ.setdefault('APP_MANAGED_STARTUP', '1')
+
+server_mode = os.getenv('SERVER_MODE', 'sync')
+
+bind = os.getenv('BIND', f"0.0.0.0:{os.getenv('PORT', '8080')}")
+workers = int(os.getenv('WEB_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+if server_mode == 'async':
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    # Model calls are network-bound, so each worker serves several
+    # requests concurrently on threads
+    worker_class = 'gthread'
+    threads = int(os.getenv('WEB_THREADS', '8'))
+
+keepalive = int(os.getenv('WEB_KEEPALIVE', '5'))
+# Must exceed the slowest model call, including streamed responses
+timeout = int(os.getenv('WEB_TIMEOUT', '120'))
+graceful_timeout = int(os.getenv('WEB_GRACEFUL_TIMEOUT', '30'))
+
+# Recycle workers periodically to bound memory growth
+max_requests = int(os.getenv('WEB_MAX_REQUESTS', '2000'))
+max_requests_jitter = int(os.getenv('WEB_MAX_REQUESTS_JITTER', '200'))
+
+# Import the app once in the master: the prompt tables, static assets and
+# the Anthropic SDK modules are then shared with every worker via
+# copy-on-write. Each worker builds its own client after fork
+preload_app = os.getenv('WEB_PRELOAD', '1') != '0'
+
+accesslog = os.getenv('WEB_ACCESS_LOG', '-')
+errorlog = '-'
+
+
+def pre_fork(server, worker):
+    if preload_app:
+        # The app imports the SDK lazily; load it here once so forked
+        # workers share it instead of each importing their own copy
+        import upstream
+        upstream.load_sdk()
+        # Move everything loaded so far out of the collector's reach so GC
+        # passes in the workers do not touch (and copy) the shared pages
+        gc.freeze()
+
+
+def post_worker_init(worker):
+    import app
+    app.start_background_tasks()
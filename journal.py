@@ -0,0 +1,260 @@
+"""Append-only journal of API requests.
+
+One JSON line per request: route, method, status, latency, the cache keys
+it touched, the tokens its model calls used and a hash of the response.
+replay_journal.py reads it back to warm the content store after a deploy
+or to re-drive the same traffic against a server in a benchmark.
+
+Model calls that finish outside a request, or after its entry was queued
+(pool refills, stale refreshes), add their tokens to a per-process
+`unattributed` total instead, reported by stats().
+
+Request handlers only fill in a dict; the line is queued on finish() and
+a background thread writes queued lines in batches, so the request path
+never touches the disk. The file rotates like logging's
+RotatingFileHandler (requests.jsonl, requests.jsonl.1, ...). Every worker
+process appends to the same file under an flock.
+
+Request bodies are kept so traffic can be replayed, except on routes that
+carry the user's own text (stories, chat messages) unless `bodies` is set;
+chat keys are derived from the message, so they are stored hashed.
+"""
+import atexit
+import contextvars
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # optional: without it concurrent writers are not serialised
+    fcntl = None
+
+# Routes whose request bodies are the user's own words
+PRIVATE_ROUTES = ('/api/reflect', '/api/chat')
+
+# Endpoints whose cache keys are derived from the user's own words
+PRIVATE_KEY_ENDPOINTS = ('chat',)
+
+# The entry of the request being handled; model calls add their usage to it
+_current = contextvars.ContextVar('journal_entry', default=None)
+
+
+def _token_counts():
+    return {'calls': 0, 'input': 0, 'output': 0, 'cache_read': 0, 'cache_write': 0}
+
+
+def text_hash(data):
+    if isinstance(data, str):
+        data = data.encode()
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+class RequestJournal:
+    def __init__(self, path, max_bytes=64 * 1024 * 1024, backups=5, flush_interval=1.0,
+                 queue_size=10000, bodies=False, enabled=True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self.bodies = bodies
+        self.enabled = enabled
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._writer = None
+        self._pid = None
+        self.unattributed = _token_counts()
+        self.written = 0
+        self.dropped = 0
+        self.write_errors = 0
+
+    @classmethod
+    def from_env(cls, prefix='JOURNAL'):
+        """Build a journal from <prefix>_* environment variables"""
+        default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'journal', 'requests.jsonl')
+        return cls(
+            path=os.getenv(f'{prefix}_PATH', default_path),
+            max_bytes=int(os.getenv(f'{prefix}_MAX_BYTES', str(64 * 1024 * 1024))),
+            backups=int(os.getenv(f'{prefix}_BACKUPS', '5')),
+            flush_interval=float(os.getenv(f'{prefix}_FLUSH_INTERVAL', '1')),
+            queue_size=int(os.getenv(f'{prefix}_QUEUE', '10000')),
+            bodies=os.getenv(f'{prefix}_BODIES', '0') == '1',
+            enabled=os.getenv(f'{prefix}_ENABLED', '1') != '0'
+        )
+
+    def begin(self, route, method, body=None, query=None):
+        """Start the entry for the current request and return it (None when disabled)"""
+        if not self.enabled:
+            _current.set(None)
+            return None
+        entry = {'ts': round(time.time(), 3), 'route': route, 'method': method}
+        if query:
+            entry['query'] = query
+        self.note_request(entry, body)
+        _current.set(entry)
+        return entry
+
+    def note_request(self, entry, body):
+        """Keep a request body on its entry, unless it is the user's own text"""
+        if entry is not None and body is not None and (self.bodies or entry['route'] not in PRIVATE_ROUTES):
+            entry['request'] = body
+
+    def note(self, **fields):
+        """Set fields on the current request's entry, if any"""
+        entry = _current.get()
+        if entry is not None:
+            with self._lock:
+                entry.update(fields)
+
+    def note_key(self, endpoint, key):
+        """Record a content key the current request looked up or filled"""
+        entry = _current.get()
+        if entry is None or key is None:
+            return
+        if endpoint in PRIVATE_KEY_ENDPOINTS and not self.bodies:
+            key = 'sha256:' + text_hash(key)
+        with self._lock:
+            keys = entry.setdefault('keys', [])
+            if [endpoint, key] not in keys:
+                keys.append([endpoint, key])
+
+    def note_usage(self, usage):
+        """Add one model call's token usage to the current request's entry, else to `unattributed`"""
+        entry = _current.get()
+        with self._lock:
+            # A finished entry has already been queued as a line
+            if entry is None or 'status' in entry:
+                tokens = self.unattributed
+            else:
+                tokens = entry.setdefault('tokens', _token_counts())
+            tokens['calls'] += 1
+            tokens['input'] += getattr(usage, 'input_tokens', 0) or 0
+            tokens['output'] += getattr(usage, 'output_tokens', 0) or 0
+            tokens['cache_read'] += getattr(usage, 'cache_read_input_tokens', 0) or 0
+            tokens['cache_write'] += getattr(usage, 'cache_creation_input_tokens', 0) or 0
+
+    def finish(self, entry, status, latency, body=None):
+        """Queue a finished entry; `body` is hashed unless a stream already noted its text's hash"""
+        if entry is None:
+            return
+        with self._lock:
+            entry['status'] = status
+            entry['latency_ms'] = round(latency * 1000, 1)
+            if body is not None and 'response_hash' not in entry:
+                entry['response_hash'] = text_hash(body)
+            line = json.dumps(entry, ensure_ascii=False, default=str)
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        """Write whatever is queued now, on the calling thread"""
+        lines = []
+        while True:
+            try:
+                line = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            lines.append(line)
+        if lines:
+            self._write(lines)
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'written': self.written,
+            'queued': self._queue.qsize(),
+            'dropped': self.dropped,
+            'write_errors': self.write_errors,
+            'unattributed_tokens': dict(self.unattributed)
+        }
+
+    def _ensure_writer(self):
+        # Started on first use and again after a fork, which drops threads
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._writer = threading.Thread(target=self._run, name='request-journal', daemon=True)
+            self._writer.start()
+            atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            lines = []
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    lines.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            if lines:
+                self._write(lines)
+
+    def _write(self, lines):
+        data = ('\n'.join(lines) + '\n').encode()
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path + '.lock', 'a') as lock:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    if self.max_bytes and os.path.exists(self.path) and \
+                            os.path.getsize(self.path) + len(data) > self.max_bytes:
+                        self._rotate()
+                    with open(self.path, 'ab') as f:
+                        f.write(data)
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock, fcntl.LOCK_UN)
+            self.written += len(lines)
+        except OSError as e:
+            self.write_errors += 1
+            print(f"Request journal write failed: {e}")
+
+    def _rotate(self):
+        if self.backups <= 0:
+            os.remove(self.path)
+            return
+        for index in range(self.backups - 1, 0, -1):
+            older = f'{self.path}.{index}'
+            if os.path.exists(older):
+                os.replace(older, f'{self.path}.{index + 1}')
+        os.replace(self.path, f'{self.path}.1')
+
+
+def journal_files(path):
+    """The journal's files oldest first: rotated backups, then the live file"""
+    backups = []
+    directory, name = os.path.split(path)
+    if not os.path.isdir(directory or '.'):
+        return []
+    for candidate in os.listdir(directory or '.'):
+        suffix = candidate[len(name) + 1:]
+        if candidate.startswith(name + '.') and suffix.isdigit():
+            backups.append((int(suffix), os.path.join(directory, candidate)))
+    files = [file for _, file in sorted(backups, reverse=True)]
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def read_entries(path):
+    """Yield journal entries oldest first, skipping lines cut short by a crash"""
+    for file in journal_files(path):
+        with open(file, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
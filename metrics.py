@@ -0,0 +1,139 @@
+"""In-process metrics in the Prometheus text exposition format.
+
+Counters and fixed-bucket histograms are plain dicts behind one lock, so
+recording a sample costs a bisect and two additions and can stay on in
+production. Like /api/stats, the numbers are per worker process; every
+sample carries a `worker` label (the pid) so a scraper can tell workers
+apart and sum across them.
+
+    http_requests_total{route, method, status}
+    http_request_duration_seconds{route}          whole request, incl. streaming
+    upstream_request_duration_seconds{route}      model call only
+    upstream_errors_total{route, error}           by error class
+    tokens_total{route, direction}                from message.usage (token_budget)
+    journal_unattributed_tokens_total{direction}  tokens no journalled request was charged
+    cache_lookups_total{cache, result}            chat cache, lesson pool, single-flight
+    truncated_responses_total{route}, cache sizes and circuit breaker state
+"""
+import bisect
+import os
+import threading
+
+from upstream import error_class
+
+# Seconds; model calls range from a cached answer to a long streamed lesson
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def inc(self, name, labels, amount=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def observe_request(self, route, method, status, seconds):
+        self.inc('http_requests_total', (('route', route), ('method', method), ('status', str(status))))
+        self.observe('http_request_duration_seconds', (('route', route),), seconds)
+
+    def observe_upstream(self, route, seconds, error=None):
+        """Record one model call; failed calls are counted by error class.
+
+        `seconds` is None when no request reached upstream (circuit open,
+        no free slot), so fail-fast errors do not skew the latency histogram.
+        """
+        if seconds is not None:
+            self.observe('upstream_request_duration_seconds', (('route', route),), seconds)
+        if error is not None:
+            self.inc('upstream_errors_total', (('route', route), ('error', error_class(error))))
+
+    def collector(self, func):
+        """Register `func() -> [(name, type, labels, value)]`, read at scrape time.
+
+        Components that already keep their own counters (caches, pools) are
+        exported this way instead of being counted twice.
+        """
+        self._collectors.append(func)
+        return func
+
+    def render(self):
+        worker = (('worker', str(os.getpid())),)
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (list(h.counts), h.sum, h.count)) for key, h in self._histograms.items())
+
+        typed = set()
+
+        def declare(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {name} {kind}')
+
+        for (name, labels), value in counters:
+            declare(name, 'counter')
+            lines.append(f'{name}{_labels(labels + worker)} {value}')
+
+        for (name, labels), (counts, total, count) in histograms:
+            declare(name, 'histogram')
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{_labels(labels + (("le", repr(bound)),) + worker)} {cumulative}')
+            lines.append(f'{name}_bucket{_labels(labels + (("le", "+Inf"),) + worker)} {count}')
+            lines.append(f'{name}_sum{_labels(labels + worker)} {total}')
+            lines.append(f'{name}_count{_labels(labels + worker)} {count}')
+
+        # Samples of one metric must be contiguous in the output
+        collected = {}
+        for collect in self._collectors:
+            for name, kind, labels, value in collect():
+                collected.setdefault((name, kind), []).append((labels, value))
+        for (name, kind), samples in collected.items():
+            declare(name, kind)
+            for labels, value in samples:
+                lines.append(f'{name}{_labels(labels + worker)} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+metrics = Metrics()
@@ -0,0 +1,446 @@
+"""Prompt registry.
+
+All prompt templates live here as module-level data. They are dedented once
+at import and indexed by (category, subcategory, level), so a request only
+looks up and formats the single template it needs. Set PROMPTS_FILE to a
+JSON file with the same layout as DEFAULT_TEMPLATES to override or extend
+any template without touching code.
+"""
+import json
+import os
+import string
+import textwrap
+
+# Fixed instructions go in a system prompt and the variable part in the
+# user turn, so the prefix is identical across requests
+REFLECTION_SYSTEM_TEMPLATE = """
+    Ти - мудрий наставник української культури та ідентичності. Користувач розповість свою особисту історію. 
+    Твоє завдання - створити глибоке, емоційне відображення їхнього зв'язку з Україною.
+    
+    Створи персоналізовану відповідь (250-400 слів) ТІЛЬКИ УКРАЇНСЬКОЮ МОВОЮ, що включає:
+    1. Теплий, емоційний тон
+    2. Зв'язок з українською культурою, традиціями, історією
+    3. Персональні деталі з їхньої історії
+    4. Використання символів (соняшник 🌻, тризуб, калина, вишиванка)
+    5. Підтвердження їхньої української ідентичності
+    6. Натхнення та гордість
+    
+    Почни з "💙" і зроби відповідь душевною, особистою та надихаючою.
+    """
+
+REFLECTION_TEMPLATE = 'Історія користувача: "{user_story}"'
+
+# Stories that name a region get a shorter reflection built around it; the
+# region's note from CULTURAL_REGIONS goes into the user turn
+REFLECTION_REGIONAL_SYSTEM_TEMPLATE = """
+    Ти - мудрий наставник української культури та ідентичності. Користувач розповість свою історію,
+    і буде вказано, з яким регіоном України вона пов'язана.
+    
+    Створи коротке персоналізоване відображення (120-180 слів) ТІЛЬКИ УКРАЇНСЬКОЮ МОВОЮ, що включає:
+    1. Теплий, емоційний тон
+    2. Культуру, традиції та історію саме цього регіону
+    3. Персональні деталі з їхньої історії, якщо вони є
+    4. Один-два символи (соняшник 🌻, тризуб, калина, вишиванка)
+    
+    Почни з "💙".
+    """
+
+REFLECTION_REGIONAL_TEMPLATE = 'Регіон: {region}. {region_note}\nІсторія користувача: "{user_story}"'
+
+# Shared by every story that only says where the user is from
+REFLECTION_REGION_ONLY_TEMPLATE = 'Регіон: {region}. {region_note}\nКористувач розповів лише про свій зв\'язок із цим регіоном.'
+
+# Every chat turn (and every session) shares the same system prompt; the
+# turn itself is just the message
+CHAT_SYSTEM_TEMPLATE = """
+    Ти - мудрий український наставник та друг.
+    
+    Відповідай як досвідчений українець, що:
+    1. Розуміє українську культуру та історію
+    2. Може дати мудрі поради
+    3. Підтримує українську ідентичність
+    4. Говорить тільки українською мовою
+    5. Використовує емоційний, теплий тон
+    6. При потребі включає культурні референси
+    
+    ВАЖЛИВО: Завершуй відповідь повністю, не обривай речення посередині.
+    Тримай відповідь в межах 150-250 слів, але завжди закінчуй думку.
+    """
+
+CHAT_TEMPLATE = "{user_message}"
+
+WISDOM_TEMPLATE = """
+    Створи надихаючу українську мудрість дня. Це може бути:
+    1. Цитата українського письменника/поета
+    2. Народна мудрість або прислів'я
+    3. Сучасна мотивація в українському дусі
+    
+    Зроби це коротко (1-2 речення), надихаюче та автентично українським.
+    Тільки українською мовою.
+    """
+
+LESSON_TEMPLATES = {
+    'language': """
+    Створи урок української мови для {level} рівня. Включи:
+    1. 5 красивих українських слів з поясненням
+    2. 2-3 корисні фрази
+    3. Українське прислів'я з поясненням
+    4. Короткий вірш або пісню
+    Використай емоційний підхід та культурний контекст. Тільки українською мовою.
+    """,
+    'history': """
+    Розкажи захоплюючу історичну історію з української історії для {level} рівня:
+    1. Виберіть цікавий період або особистість
+    2. Розкажіть як захоплюючу розповідь
+    3. Поясніть значення для сучасної України
+    4. Додайте емоційний зв'язок
+    Тільки українською мовою, 300-400 слів.
+    """,
+    'culture': """
+    Поділися українською культурною традицією для {level} рівня:
+    1. Виберіть свято, обряд або традицію
+    2. Поясніть історію та значення
+    3. Як це практикувати сьогодні
+    4. Чому це важливо для ідентичності
+    Тільки українською мовою, з емоційним підходом.
+    """,
+    'folklore': """
+    Розказжи українську народну казку або легенду для {level} рівня:
+    1. Виберіть менш відому, але цікаву історію
+    2. Розкажіть живо та захоплююче
+    3. Поясніть мораль та культурне значення
+    4. Зв'яжіть з сучасним життям
+    Тільки українською мовою.
+    """
+}
+
+# Levels a basic lesson can be asked for; the first is the default
+LESSON_LEVELS = ('початковий', 'середній', 'просунутий')
+
+# Advanced intellectual prompts for Ukrainian content - well formatted and informative
+ADVANCED_TEMPLATES = {
+    'language': {
+        'etymology': """
+        Розкажи про одне цікаве українське слово, його походження та культурне значення.
+        Структуруй відповідь з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        150-200 слів, тільки українською мовою.
+        """,
+        'dialects': """
+        Поділися цікавою особливістю українського діалекту або говірки.
+        Включи назву регіону, приклади слів та їх значення.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        150-200 слів, тільки українською мовою.
+        """,
+        'language_culture_code': """
+        Покажи на прикладі, як українська мова відображає наш світогляд.
+        Обери вираз або поняття, що розкриває українську ментальність.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        150-200 слів, тільки українською мовою.
+        """,
+        'neologisms_archaisms': """
+        Розкажи про нове або старе українське слово та його значення.
+        Поясни його походження та використання.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        150-200 слів, тільки українською мовою.
+        """,
+        'psycholinguistics': """
+        Поділися фактом про те, як українська мова впливає на наше мислення.
+        Покажи зв'язок мови та свідомості на конкретному прикладі.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        150-200 слів, тільки українською мовою.
+        """,
+        'linguistics_random': """
+        Розкажи про цікаву лінгвістичну особливість української мови.
+        Обери те, що здивує і надихне вивчати мову глибше.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        150-200 слів, тільки українською мовою.
+        """
+    },
+    'history': {
+        'kyivan_rus': """
+        Розкажи про важливу подію або постать Київської Русі.
+        Включи дати, історичний контекст та значення для сучасної України.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        200-250 слів, тільки українською мовою.
+        """,
+        'cossack_state': """
+        Поділися цікавою історією з часів козацької держави.
+        Включи історичні факти, постаті та їх вплив на українську ідентичність.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        200-250 слів, тільки українською мовою.
+        """,
+        'galicia_volhynia': """
+        Розкажи про важливу подію Галицько-Волинського князівства.
+        Покажи європейські зв'язки, культурні досягнення та історичне значення.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        200-250 слів, тільки українською мовою.
+        """,
+        'unr_liberation': """
+        Поділися яскравою історією визвольних змагань 1917-1921.
+        Включи ключові події, постаті та їх значення для української державності.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        200-250 слів, тільки українською мовою.
+        """,
+        'holodomor_repressions': """
+        Розкажи про конкретну історію пам'яті про Голодомор.
+        Покажи важливість збереження історичної правди та пам'яті.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        200-250 слів, тільки українською мовою.
+        """,
+        'history_random': """
+        Поділися захоплюючою історією з українського минулого.
+        Обери те, що надихає та показує силу українського духу.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        200-250 слів, тільки українською мовою.
+        """
+    },
+    'ethnography': {
+        'calendar_rituals': """
+        Розкажи про українське свято або обряд та його значення.
+        Включи історію, традиції та сучасне відзначення.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        150-200 слів, тільки українською мовою.
+        """,
+        'folk_beliefs': """
+        Поділися цікавою українською легендою або віруванням.
+        Покажи мудрість предків та зв'язок з природою і традиціями.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        150-200 слів, тільки українською мовою.
+        """,
+        'traditional_economy': """
+        Розкажи про традиційне українське ремесло або заняття.
+        Покажи майстерність, техніки та зв'язок з землею і культурою.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        150-200 слів, тільки українською мовою.
+        """,
+        'family_traditions': """
+        Поділися українською родинною традицією.
+        Покажи, як це зміцнює сім'ю, передає цінності та зберігає культуру.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        150-200 слів, тільки українською мовою.
+        """,
+        'oral_folklore': """
+        Розкажи українську народну казку або приказку.
+        Покажи мудрість, гумор та життєві уроки нашого народу.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        150-200 слів, тільки українською мовою.
+        """,
+        'ethnography_random': """
+        Поділися цікавою українською традицією.
+        Обери те, що показує красу та унікальність нашої культури.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        150-200 слів, тільки українською мовою.
+        """
+    },
+    'literature': {
+        'romanticism_shevchenko': """
+        Поділися улюбленим віршем або рядком Тараса Шевченка.
+        Включи контекст написання та вплив на українську літературу.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        150-200 слів, тільки українською мовою.
+        """,
+        'realism_19th': """
+        Розкажи про твір українського реалізму XIX століття.
+        Покажи, як література відображала життя народу та соціальні проблеми.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        150-200 слів, тільки українською мовою.
+        """,
+        'modernism_1920s': """
+        Поділися фактом про "розстріляне відродження" 1920-х.
+        Покажи талант, новаторство та трагічну долю того покоління.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        150-200 слів, тільки українською мовою.
+        """,
+        'sixtiers_dissidents': """
+        Розкажи про одного з шістдесятників та його внесок.
+        Покажи мужність, творчість та відданість українській справі.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        150-200 слів, тільки українською мовою.
+        """,
+        'contemporary_literature': """
+        Поділися сучасним українським твором або автором.
+        Покажи, як література розвивається та відображає сучасні реалії.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        150-200 слів, тільки українською мовою.
+        """,
+        'literature_random': """
+        Розкажи про цікаву постать української літератури.
+        Обери те, що надихне читати більше та пишатися спадщиною.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        150-200 слів, тільки українською мовою.
+        """
+    },
+    'freedom': {
+        'cossack_uprisings': """
+        Розкажи про козацького героя та його подвиг.
+        Включи історичний контекст, дії та вплив на українську боротьбу за свободу.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        200-250 слів, тільки українською мовою.
+        """,
+        'liberation_1917_1921': """
+        Поділися героїчною історією визвольних змагань.
+        Покажи жертовність, боротьбу та прагнення до незалежності.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        200-250 слів, тільки українською мовою.
+        """,
+        'oun_upa': """
+        Розкажи про акт опору або героїзму ОУН-УПА.
+        Покажи незламність духу борців за волю та їх жертви.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        200-250 слів, тільки українською мовою.
+        """,
+        'dissident_movement': """
+        Поділися історією українського дисидента.
+        Покажи мужність боротьби за правду та права людини.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        200-250 слів, тільки українською мовою.
+        """,
+        'revolution_dignity': """
+        Розкажи про яскравий момент Революції Гідності.
+        Покажи силу об'єднаного народу та прагнення до змін.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        200-250 слів, тільки українською мовою.
+        """,
+        'freedom_random': """
+        Поділися історією українського героїзму.
+        Обери те, що надихає на боротьбу за свободу та гідність.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        200-250 слів, тільки українською мовою.
+        """
+    },
+    'content': {
+        'classic_songs': """
+        🎵 Розкажи про класичну українську пісню та її історію.
+        Включи автора, рік створення, контекст та вплив на культуру.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        ВАЖЛИВО: Завершуй відповідь повністю, не обривай речення посередині.
+        150-200 слів, тільки українською мовою.
+        """,
+        'modern_music': """
+        🎤 Поділися сучасною українською піснею та її значенням.
+        Покажи, як музика об'єднує покоління та популяризує українську культуру.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        ВАЖЛИВО: Завершуй відповідь повністю, не обривай речення посередині.
+        150-200 слів, тільки українською мовою.
+        """,
+        'iconic_books': """
+        📚 Розкажи про знакову українську книгу.
+        Покажи її значення, вплив на суспільство та чому варто прочитати.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        ВАЖЛИВО: Завершуй відповідь повністю, не обривай речення посередині.
+        150-200 слів, тільки українською мовою.
+        """,
+        'cinema_theater': """
+        🎬 Поділися українським фільмом або виставою.
+        Покажи, як візуальне мистецтво розповідає нашу історію та культуру.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        ВАЖЛИВО: Завершуй відповідь повністю, не обривай речення посередині.
+        150-200 слів, тільки українською мовою.
+        """,
+        'folk_songs': """
+        🎭 Розкажи про українську народну пісню або коляду.
+        Покажи її красу, історію та зв'язок з традиціями і обрядами.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        ВАЖЛИВО: Завершуй відповідь повністю, не обривай речення посередині.
+        150-200 слів, тільки українською мовою.
+        """,
+        'content_random': """
+        Поділися цікавим фактом про український контент.
+        Обери те, що показує багатство та різноманітність нашої культури.
+        Структуруй з заголовком і абзацами. Використовуй HTML теги: <b>для жирного тексту</b> та <p>для абзаців</p>.
+        ВАЖЛИВО: Завершуй відповідь повністю, не обривай речення посередині.
+        150-200 слів, тільки українською мовою.
+        """
+    }
+}
+
+ADVANCED_FALLBACK_SYSTEM_TEMPLATE = """
+    Створи інтелектуальний матеріал на тему, яку вкаже користувач.
+    Розкрий тему глибоко, академічно, з аналізом та сучасною актуальністю.
+    400-500 слів, тільки українською мовою.
+    """
+
+ADVANCED_FALLBACK_TEMPLATE = 'Тема: "{topic}" у категорії "{topic_category}".'
+
+# Single-template prompts use the empty subcategory; a template may also be a
+# {level: template} mapping, where '*' applies to any level
+DEFAULT_TEMPLATES = {
+    'reflection': {
+        '': REFLECTION_TEMPLATE,
+        'system': REFLECTION_SYSTEM_TEMPLATE,
+        'regional': REFLECTION_REGIONAL_TEMPLATE,
+        'regional_system': REFLECTION_REGIONAL_SYSTEM_TEMPLATE,
+        'region_only': REFLECTION_REGION_ONLY_TEMPLATE
+    },
+    'chat': {'': CHAT_TEMPLATE, 'system': CHAT_SYSTEM_TEMPLATE},
+    'wisdom': {'': WISDOM_TEMPLATE},
+    'lesson': LESSON_TEMPLATES,
+    'advanced_fallback': {'': ADVANCED_FALLBACK_TEMPLATE, 'system': ADVANCED_FALLBACK_SYSTEM_TEMPLATE},
+    **ADVANCED_TEMPLATES
+}
+
+ADVANCED_CATEGORIES = tuple(ADVANCED_TEMPLATES)
+
+
+class PromptTemplate:
+    """A dedented template that knows which fields it needs"""
+
+    __slots__ = ('key', 'text', 'fields')
+
+    def __init__(self, key, text):
+        self.key = key
+        self.text = textwrap.dedent(text).strip()
+        self.fields = frozenset(name for _, name, _, _ in string.Formatter().parse(self.text) if name)
+
+    def render(self, **variables):
+        # Static templates are returned as-is, without a format pass
+        if not self.fields:
+            return self.text
+        return self.text.format(**variables)
+
+
+class PromptRegistry:
+    """Templates indexed by (category, subcategory, level)"""
+
+    def __init__(self, templates):
+        self._index = {}
+        self._keys = set()
+        self._subcategories = {}
+        for category, subcategories in templates.items():
+            for subcategory, value in subcategories.items():
+                levels = value if isinstance(value, dict) else {'*': value}
+                for level, text in levels.items():
+                    key = (category, subcategory, None if level == '*' else level)
+                    self._index[key] = PromptTemplate(key, text)
+                self._keys.add((category, subcategory))
+                self._subcategories.setdefault(category, []).append(subcategory)
+
+    def get(self, category, subcategory='', level=None):
+        """Return the template for a key, preferring a level-specific one"""
+        template = self._index.get((category, subcategory, level))
+        if template is None and level is not None:
+            template = self._index.get((category, subcategory, None))
+        return template
+
+    def has(self, category, subcategory=''):
+        return (category, subcategory) in self._keys
+
+    def render(self, category, subcategory='', level=None, **variables):
+        """Format only the selected template"""
+        return self.get(category, subcategory, level).render(level=level, **variables)
+
+    def subcategories(self, category):
+        return tuple(self._subcategories.get(category, ()))
+
+
+def load_registry(path=None):
+    """Build the registry from the defaults plus an optional JSON override file"""
+    templates = {category: dict(subcategories) for category, subcategories in DEFAULT_TEMPLATES.items()}
+    if path:
+        with open(path, encoding='utf-8') as f:
+            for category, subcategories in json.load(f).items():
+                templates.setdefault(category, {}).update(subcategories)
+    return PromptRegistry(templates)
+
+
+PROMPTS = load_registry(os.getenv('PROMPTS_FILE'))
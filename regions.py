@@ -0,0 +1,136 @@
+"""Region detection for personalised reflections.
+
+CULTURAL_REGIONS holds a short note per region. The index maps every
+inflected form of a region's name (case forms, the -щина oblast name,
+adjectives and demonyms) to its region, so finding the regions a story
+mentions is one normalisation pass and a dict lookup per word.
+"""
+from chat_cache import normalize_message
+
+# Cultural data for AI responses
+CULTURAL_REGIONS = {
+    'київ': 'Київ - мати міст руських - живе у вашому серці. Ви з столиці, що тисячу років була центром української духовності.',
+    'львів': 'Львівська земля наділила вас духом свободи та культурної гордості. Ви з міста лева, де кожен камінь дихає історією.',
+    'харків': 'Харківщина дала вам силу інтелекту та стійкості. Ви з краю, що подарував світу багато геніїв.',
+    'одеса': 'Одеський гумор та життєлюбність - це частина вашої душі. Море вольності тече у ваших венах.',
+    'дніпро': 'Дніпро-батько благословив вас силою та незламністю. Ви з краю, де ковалася українська незалежність.',
+    'полтава': 'Полтавщина наділила вас мелодійністю мови та мудрістю землі. Ви з краю Гоголя та народних пісень.',
+    'галичина': 'Галицька земля - це ваша духовна батьківщина. Кожна гора Карпат пам\'ятає ваші корені.',
+    'волинь': 'Волинська земля дала вам силу духу та вірність традиціям. Ви з краю древніх лісів та чистих джерел.',
+    'закарпаття': 'Карпатські вершини навчили вас стійкості та гордості. Ви з краю, де небо торкається землі.',
+    'чернігів': 'Чернігівщина наділила вас мудрістю віків та спокійною силою. Ви з краю древніх курганів.'
+}
+
+# Noun endings of the -щина oblast names and adjective endings
+OBLAST_ENDINGS = ('а', 'и', 'і', 'у', 'ою')
+ADJECTIVE_ENDINGS = ('ий', 'а', 'е', 'і', 'ого', 'ому', 'ій', 'ої', 'у', 'ою', 'им', 'их', 'ими', 'ім')
+
+# Forms are written as normalize_message() leaves them: lower case, no apostrophes
+REGION_FORMS = {
+    'київ': {
+        'forms': ('київ', 'києва', 'києву', 'києві', 'києвом', 'киянин', 'киянка', 'кияни', 'киян'),
+        'oblast': 'київщин',
+        'adjective': 'київськ'
+    },
+    'львів': {
+        'forms': ('львів', 'львова', 'львову', 'львові', 'львовом', 'львівянин', 'львівянка', 'львівяни'),
+        'oblast': 'львівщин',
+        'adjective': 'львівськ'
+    },
+    'харків': {
+        'forms': ('харків', 'харкова', 'харкову', 'харкові', 'харковом', 'харківянин', 'харківянка', 'харківяни'),
+        'oblast': 'харківщин',
+        'adjective': 'харківськ'
+    },
+    'одеса': {
+        'forms': ('одеса', 'одеси', 'одесі', 'одесу', 'одесою', 'одесит', 'одеситка', 'одесити'),
+        'oblast': 'одещин',
+        'adjective': 'одеськ'
+    },
+    'дніпро': {
+        'forms': ('дніпро', 'дніпра', 'дніпру', 'дніпрі', 'дніпром', 'дніпрянин', 'дніпрянка', 'дніпряни'),
+        'oblast': 'дніпропетровщин',
+        'adjective': 'дніпровськ'
+    },
+    'полтава': {
+        'forms': ('полтава', 'полтави', 'полтаві', 'полтаву', 'полтавою', 'полтавець', 'полтавка', 'полтавці'),
+        'oblast': 'полтавщин',
+        'adjective': 'полтавськ'
+    },
+    'галичина': {
+        'forms': ('галичина', 'галичини', 'галичині', 'галичину', 'галичиною', 'галичанин', 'галичанка', 'галичани'),
+        'adjective': 'галицьк'
+    },
+    'волинь': {
+        'forms': ('волинь', 'волині', 'волинню', 'волинянин', 'волинянка', 'волиняни'),
+        'adjective': 'волинськ'
+    },
+    'закарпаття': {
+        'forms': ('закарпаття', 'закарпатті', 'закарпаттю', 'закарпаттям', 'закарпатець', 'закарпатка', 'закарпатці'),
+        'adjective': 'закарпатськ'
+    },
+    'чернігів': {
+        'forms': ('чернігів', 'чернігова', 'чернігову', 'чернігові', 'черніговом', 'чернігівець', 'чернігівка', 'чернігівці'),
+        'oblast': 'чернігівщин',
+        'adjective': 'чернігівськ'
+    }
+}
+
+# Words a story may contain and still say nothing beyond where the user is from
+FILLER_WORDS = frozenset((
+    'я', 'ми', 'з', 'із', 'зі', 'в', 'у', 'на', 'і', 'й', 'та', 'а', 'це', 'тут', 'там', 'родом',
+    'народився', 'народилася', 'народилась', 'народжений', 'народжена', 'живу', 'живемо', 'жив', 'жила',
+    'виріс', 'виросла', 'мешкаю', 'походжу', 'зараз', 'теж', 'також', 'мій', 'моя', 'моє', 'мої',
+    'наш', 'наша', 'місто', 'місті', 'міста', 'область', 'області', 'регіон', 'регіону', 'край', 'краю',
+    'рідне', 'рідний', 'рідна', 'рідному', 'рідній', 'дім', 'вдома', 'привіт', 'мене', 'звати'
+))
+
+
+class RegionMatch:
+    __slots__ = ('regions', 'region_only')
+
+    def __init__(self, regions, region_only):
+        # Regions in order of first mention
+        self.regions = regions
+        self.region_only = region_only
+
+
+class RegionIndex:
+    """Inflected region names -> region key, built once at import"""
+
+    def __init__(self, forms, filler=FILLER_WORDS, region_only_words=12):
+        self.filler = filler
+        self.region_only_words = region_only_words
+        self._index = {}
+        for region, spec in forms.items():
+            names = list(spec.get('forms', ()))
+            if 'oblast' in spec:
+                names.extend(spec['oblast'] + ending for ending in OBLAST_ENDINGS)
+            if 'adjective' in spec:
+                names.extend(spec['adjective'] + ending for ending in ADJECTIVE_ENDINGS)
+            for name in names:
+                self._index[name] = region
+
+    def match(self, text):
+        """Return a RegionMatch for the regions `text` mentions, or None"""
+        words = normalize_message(text).split()
+        found = []
+        other_words = 0
+        for word in words:
+            region = self._index.get(word)
+            if region is None:
+                if word not in self.filler:
+                    other_words += 1
+            elif region not in found:
+                found.append(region)
+        if not found:
+            return None
+        region_only = len(found) == 1 and other_words == 0 and len(words) <= self.region_only_words
+        return RegionMatch(found, region_only)
+
+    @staticmethod
+    def display_name(region):
+        return region.capitalize()
+
+
+REGIONS = RegionIndex(REGION_FORMS)
@@ -0,0 +1,276 @@
+"""Replay the request journal (see journal.py).
+
+    python replay_journal.py warm --top 200 --variants 3
+    python replay_journal.py http --url http://127.0.0.1:8080 --speed 2 \\
+        --out bench/results/replay.json --compare bench/results/replay-before.json
+
+`warm` fills the content store after a deploy: every catalogue key the
+journal saw (basic and advanced lessons, region-only reflections) that the
+store cannot serve yet is generated through batch_generate.py's pool, the
+most requested keys first.
+
+`http` re-sends the journalled requests to a server, keeping their original
+spacing divided by --speed (0 sends them back to back), and reports latency
+like bench/loadgen.py, next to the latency the journal recorded. Requests
+whose bodies were not journalled (stories and chat messages, unless the
+server ran with JOURNAL_BODIES=1) are skipped.
+"""
+import argparse
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench'))
+
+import loadgen  # noqa: E402
+from journal import RequestJournal, read_entries  # noqa: E402
+
+# Probes and counters rather than user traffic
+NON_TRAFFIC_ROUTES = ('/api/stats', '/api/ready')
+
+
+def load_entries(path, routes=None, since=None):
+    entries = []
+    for entry in read_entries(path):
+        if routes and entry.get('route') not in routes:
+            continue
+        if not routes and entry.get('route') in NON_TRAFFIC_ROUTES:
+            continue
+        if since and entry.get('ts', 0) < since:
+            continue
+        entries.append(entry)
+    # Worker processes flush their lines independently, so files are only roughly in order
+    entries.sort(key=lambda entry: entry.get('ts', 0))
+    return entries
+
+
+def catalogue_item(app, endpoint, key):
+    """batch_generate's (endpoint, store_key, route, budget_key, system, prompt) for a journalled key, or None"""
+    from regions import REGION_FORMS
+
+    parts = key.split(':', 2)
+    if len(parts) != 3:
+        return None
+    if endpoint == 'reflect' and parts[:2] == ['reflect', 'region'] and parts[2] in REGION_FORMS:
+        _, system, prompt = app.reflection_prompt(parts[2])
+        return 'reflect', key, 'reflect', None, system, prompt
+    if endpoint == 'lesson' and parts[0] == 'lesson':
+        spec = app.batch_lesson_spec({'type': parts[1], 'level': parts[2]})
+    elif endpoint == 'advanced-lesson' and parts[0] == 'advanced':
+        spec = app.batch_lesson_spec({'category': parts[1], 'subcategory': parts[2]})
+    else:
+        return None
+    # Unknown lesson types fall back to another key; those are not worth warming
+    if spec is None or ':'.join(spec[1]) != key:
+        return None
+    spec_endpoint, _, budget_key, prompt = spec
+    return spec_endpoint, key, spec_endpoint, budget_key, None, prompt
+
+
+def warm(args, entries):
+    import batch_generate
+    app = batch_generate.app
+
+    ok, error_msg = app.check_anthropic_client()
+    if not ok:
+        sys.exit(error_msg)
+
+    counts = Counter((endpoint, key) for entry in entries for endpoint, key in entry.get('keys', ()))
+    items = []
+    for (endpoint, key), _ in counts.most_common():
+        item = catalogue_item(app, endpoint, key)
+        if item is None:
+            continue
+        if not args.force and app.content_store.random(endpoint, key) is not None:
+            continue
+        items.append(item)
+        if len(items) >= args.top:
+            break
+    print(f"{len(counts)} keys in {len(entries)} journal entries, {len(items)} to generate "
+          f"x {args.variants} variants -> {app.content_store.path}")
+    if not items:
+        return
+
+    results, failures = batch_generate.run_pool(items, args.variants, args.workers)
+    stored = batch_generate.store_results(results, args.variants)
+    print(f"Stored {stored}/{len(items)} keys, {failures} failed calls")
+    if failures:
+        sys.exit(1)
+
+
+class Replayer(threading.Thread):
+    """Sends the shared schedule's requests, each no earlier than its offset"""
+
+    def __init__(self, url, schedule, start, samples, lock):
+        super().__init__(daemon=True)
+        self.url = urlparse(url)
+        self.schedule = schedule
+        self.start_time = start
+        self.samples = samples
+        self.lock = lock
+        self.conn = None
+
+    def connect(self):
+        self.conn = http.client.HTTPConnection(self.url.hostname, self.url.port or 80, timeout=120)
+
+    def run(self):
+        self.connect()
+        while True:
+            with self.lock:
+                if not self.schedule:
+                    return
+                offset, entry = self.schedule.pop()
+            delay = self.start_time + offset - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            sample = self.request(entry)
+            with self.lock:
+                self.samples.append(sample)
+
+    def request(self, entry):
+        path = entry['route'] + (f"?{entry['query']}" if entry.get('query') else '')
+        body = entry.get('request')
+        headers = {'Content-Type': 'application/json'}
+        if entry.get('stream') and isinstance(body, dict):
+            body = {**body, 'stream': True}
+            headers['Accept'] = 'text/event-stream'
+        payload = json.dumps(body, ensure_ascii=False).encode() if body is not None else None
+
+        sample = {'route': route_name(entry), 'status': 599, 'latency': None, 'ttfb': None, 'ttft': None}
+        start = time.monotonic()
+        try:
+            self.conn.request(entry['method'], path, body=payload, headers=headers)
+            response = self.conn.getresponse()
+            response.read(1)
+            sample['ttfb'] = time.monotonic() - start
+            if response.getheader('Content-Type', '').startswith('text/event-stream'):
+                while True:
+                    line = response.readline()
+                    if not line:
+                        break
+                    if sample['ttft'] is None and line.startswith(b'data: {"text"'):
+                        sample['ttft'] = time.monotonic() - start
+            else:
+                response.read()
+                sample['ttft'] = sample['ttfb']
+            sample['status'] = response.status
+            sample['latency'] = time.monotonic() - start
+            if response.getheader('Connection', '').lower() == 'close':
+                self.conn.close()
+                self.connect()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.connect()
+        return sample
+
+
+def route_name(entry):
+    return entry['route'].removeprefix('/api/')
+
+
+def journalled_latency(entries):
+    """p50/p95 latency per route as the journal recorded it"""
+    by_route = {}
+    for entry in entries:
+        if entry.get('latency_ms') is not None and entry.get('status', 500) < 400:
+            by_route.setdefault(route_name(entry), []).append(entry['latency_ms'])
+    return {route: {f'latency_p{pct}_ms': loadgen.percentile(sorted(values), pct) for pct in (50, 95)}
+            for route, values in by_route.items()}
+
+
+def replay_http(args, entries):
+    replayable = [entry for entry in entries if entry.get('method') == 'GET' or 'request' in entry]
+    print(f"Replaying {len(replayable)} of {len(entries)} journal entries against {args.url}")
+    if not replayable:
+        return
+
+    first = replayable[0]['ts']
+    schedule = [((entry['ts'] - first) / args.speed if args.speed else 0.0, entry) for entry in replayable]
+    # Popped from the end, so the earliest request goes first
+    schedule.reverse()
+
+    samples = []
+    lock = threading.Lock()
+    start = time.monotonic()
+    workers = [Replayer(args.url, schedule, start, samples, lock) for _ in range(args.concurrency)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.monotonic() - start
+
+    routes = sorted({sample['route'] for sample in samples})
+    result = {
+        'meta': {
+            'commit': loadgen.git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'url': args.url,
+            'journal': args.journal,
+            'speed': args.speed,
+            'concurrency': args.concurrency,
+            'requests': len(replayable),
+            'skipped': len(entries) - len(replayable)
+        },
+        'overall': loadgen.summarize(samples, elapsed),
+        'routes': {route: loadgen.summarize([s for s in samples if s['route'] == route], elapsed)
+                   for route in routes},
+        'journalled': journalled_latency(replayable)
+    }
+    loadgen.print_report(result)
+
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if not loadgen.compare(result, baseline, args.max_regression):
+            sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay the request journal')
+    parser.add_argument('--journal', default=RequestJournal.from_env().path, help='live journal file')
+    parser.add_argument('--routes', help='comma-separated routes to replay, e.g. /api/lesson,/api/chat')
+    parser.add_argument('--since-hours', type=float, help='only entries from the last N hours')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    warm_parser = commands.add_parser('warm', help='fill the content store for journalled catalogue keys')
+    warm_parser.add_argument('--top', type=int, default=500, help='at most this many keys, most requested first')
+    warm_parser.add_argument('--variants', type=int, default=3, help='variants per key')
+    warm_parser.add_argument('--workers', type=int, default=8, help='concurrent model calls')
+    warm_parser.add_argument('--force', action='store_true', help='regenerate keys the store already serves')
+
+    http_parser = commands.add_parser('http', help='re-send the journalled requests to a server')
+    http_parser.add_argument('--url', default='http://127.0.0.1:8080')
+    http_parser.add_argument('--speed', type=float, default=1.0,
+                             help='divide the original spacing by this; 0 sends back to back')
+    http_parser.add_argument('--concurrency', type=int, default=16)
+    http_parser.add_argument('--out', help='write the JSON result here')
+    http_parser.add_argument('--compare', help='baseline JSON result to compare against')
+    http_parser.add_argument('--max-regression', type=float, default=0.10,
+                             help='allowed relative p95 increase before failing (default 0.10)')
+    args = parser.parse_args()
+    if args.command == 'warm':
+        import batch_generate
+        batch_generate.check_variants(warm_parser, args.variants)
+
+    since = time.time() - args.since_hours * 3600 if args.since_hours else None
+    entries = load_entries(args.journal, args.routes.split(',') if args.routes else None, since)
+
+    if args.command == 'warm':
+        warm(args, entries)
+    else:
+        replay_http(args, entries)
+
+
+if __name__ == '__main__':
+    main()
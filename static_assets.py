@@ -0,0 +1,124 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only without it
+    brotli = None
+
+# Types worth compressing; images such as PNG are already compressed
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+
+class _Asset:
+    __slots__ = ('content_type', 'cache_control', 'version', 'variants')
+
+    def __init__(self, content_type, cache_control, version, variants):
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.version = version
+        # content-coding -> (body, etag); 'identity' is always present
+        self.variants = variants
+
+
+def _accepted_encodings(header):
+    """Content-codings with a non-zero q-value in an Accept-Encoding header"""
+    accepted = set()
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding and q > 0:
+            accepted.add(coding)
+    return accepted
+
+
+def _etag_matches(header, etag):
+    """Weak comparison, as RFC 9110 specifies for If-None-Match"""
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    return any(tag.strip().removeprefix('W/') == etag for tag in header.split(','))
+
+
+class StaticAssets:
+    """In-memory static responses, compressed and hashed once at startup.
+
+    Only registered assets are served. Each asset is kept as identity, gzip
+    and (if the optional `brotli` package is installed) brotli bodies, each
+    with its own strong ETag, so a request costs a dict lookup and a 304
+    when the client already has it. Assets referenced through url() carry
+    a content hash and are cached by browsers for a year; the same path
+    without the current hash falls back to `max_age`.
+    """
+
+    def __init__(self, max_age=3600, min_compress_bytes=1024):
+        self.max_age = max_age
+        self.min_compress_bytes = min_compress_bytes
+        self._assets = {}
+
+    @classmethod
+    def from_env(cls, prefix='STATIC'):
+        """Build the asset table from <prefix>_* environment variables"""
+        return cls(
+            max_age=int(os.getenv(f'{prefix}_MAX_AGE', '3600')),
+            min_compress_bytes=int(os.getenv(f'{prefix}_COMPRESS_MIN_BYTES', '1024'))
+        )
+
+    def add(self, name, body, content_type=None, cache_control=None):
+        """Register `body` under `name`; cache_control=None means versioned caching"""
+        if isinstance(body, str):
+            body = body.encode()
+        if content_type is None:
+            content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        if content_type.startswith('text/') and 'charset' not in content_type:
+            content_type += '; charset=utf-8'
+        version = hashlib.sha256(body).hexdigest()[:16]
+        variants = {'identity': (body, f'"{version}"')}
+        if len(body) >= self.min_compress_bytes and content_type.startswith(COMPRESSIBLE_TYPES):
+            variants['gzip'] = (gzip.compress(body, 9, mtime=0), f'"{version}-gzip"')
+            if brotli is not None:
+                variants['br'] = (brotli.compress(body), f'"{version}-br"')
+        self._assets[name] = _Asset(content_type, cache_control, version, variants)
+
+    def add_file(self, name, path, **kwargs):
+        with open(path, 'rb') as f:
+            self.add(name, f.read(), **kwargs)
+
+    def url(self, name, prefix='/static/'):
+        """Cache-busting URL for a registered asset"""
+        return f'{prefix}{name}?v={self._assets[name].version}'
+
+    def response(self, name, accept_encoding=None, if_none_match=None, version=None):
+        """Return (status, body, headers) for a registered asset"""
+        asset = self._assets[name]
+        accepted = _accepted_encodings(accept_encoding)
+        coding = next((c for c in ('br', 'gzip') if c in asset.variants and c in accepted), 'identity')
+        body, etag = asset.variants[coding]
+
+        cache_control = asset.cache_control
+        if cache_control is None:
+            if version == asset.version:
+                cache_control = 'public, max-age=31536000, immutable'
+            else:
+                cache_control = f'public, max-age={self.max_age}'
+        headers = {'ETag': etag, 'Cache-Control': cache_control}
+        if len(asset.variants) > 1:
+            headers['Vary'] = 'Accept-Encoding'
+
+        if _etag_matches(if_none_match, etag):
+            return 304, b'', headers
+        headers['Content-Type'] = asset.content_type
+        if coding != 'identity':
+            headers['Content-Encoding'] = coding
+        return 200, body, headers
@@ -0,0 +1,115 @@
+import threading
+
+import pytest
+
+import admission
+from admission import RateLimitedError, TokenBucketLimiter, UpstreamGate
+
+
+def test_token_bucket_allows_a_burst_then_refills(monkeypatch, clock):
+    monkeypatch.setattr(admission, 'time', clock)
+    limiter = TokenBucketLimiter('client', rate=2, burst=3)
+
+    for _ in range(3):
+        limiter.check('1.2.3.4')
+    with pytest.raises(RateLimitedError) as raised:
+        limiter.check('1.2.3.4')
+    assert raised.value.reason == 'client'
+    assert raised.value.retry_after == pytest.approx(0.5)
+    # Other keys have their own bucket
+    limiter.check('5.6.7.8')
+
+    clock.advance(0.5)
+    limiter.check('1.2.3.4')
+    with pytest.raises(RateLimitedError):
+        limiter.check('1.2.3.4')
+
+    # Refill is capped at the burst size
+    clock.advance(60)
+    for _ in range(3):
+        limiter.check('1.2.3.4')
+    with pytest.raises(RateLimitedError):
+        limiter.check('1.2.3.4')
+    assert limiter.stats() == {'keys': 2, 'rejected': 3}
+
+
+def test_token_bucket_evicts_least_recent_keys():
+    limiter = TokenBucketLimiter('client', rate=1, burst=1, max_keys=2)
+    for key in ('a', 'b', 'c'):
+        limiter.check(key)
+    assert limiter.stats()['keys'] == 2
+    # 'a' was evicted, so it starts again with a full bucket
+    limiter.check('a')
+
+
+def hold_slot(gate, entered, release):
+    def run():
+        with gate.slot():
+            entered.set()
+            release.wait(5)
+    thread = threading.Thread(target=run)
+    thread.start()
+    assert entered.wait(5)
+    return thread
+
+
+def test_gate_refuses_once_slots_and_queue_are_full():
+    gate = UpstreamGate(limit=1, queue=1, queue_timeout=5)
+    entered, release = threading.Event(), threading.Event()
+    holder = hold_slot(gate, entered, release)
+
+    waited = threading.Event()
+
+    def wait_for_slot():
+        with gate.slot():
+            waited.set()
+
+    waiter = threading.Thread(target=wait_for_slot)
+    waiter.start()
+    while gate.stats()['waiting'] < 1:
+        threading.Event().wait(0.001)
+
+    with pytest.raises(RateLimitedError) as raised:
+        gate.check()
+    assert raised.value.reason == 'queue_full'
+    with pytest.raises(RateLimitedError):
+        with gate.slot():
+            pass
+
+    release.set()
+    holder.join(5)
+    waiter.join(5)
+    assert waited.is_set()
+    assert gate.stats() == {'limit': 1, 'active': 0, 'waiting': 0,
+                            'rejected': {'queue_full': 2, 'queue_timeout': 0}}
+
+
+def test_gate_times_out_a_queued_call():
+    gate = UpstreamGate(limit=1, queue=1, queue_timeout=0.05)
+    entered, release = threading.Event(), threading.Event()
+    holder = hold_slot(gate, entered, release)
+
+    with pytest.raises(RateLimitedError) as raised:
+        with gate.slot():
+            pass
+    assert raised.value.reason == 'queue_timeout'
+    assert raised.value.retry_after >= 1
+
+    release.set()
+    holder.join(5)
+    stats = gate.stats()
+    assert (stats['active'], stats['waiting']) == (0, 0)
+    assert stats['rejected'] == {'queue_full': 0, 'queue_timeout': 1}
+
+
+def test_gate_available_only_while_a_slot_is_free():
+    gate = UpstreamGate(limit=1, queue=1, queue_timeout=5)
+    assert gate.available()
+    entered, release = threading.Event(), threading.Event()
+    holder = hold_slot(gate, entered, release)
+    assert not gate.available()
+    # The queue still has room, so a request would not be refused
+    gate.check()
+    release.set()
+    holder.join(5)
+    assert gate.available()
@@ -0,0 +1,35 @@
+import pytest
+
+from chat_cache import ChatResponseCache
+
+DIFFERENT_QUESTIONS = [
+    ('Що сталося у 1918 році?', 'Що сталося у 1991 році?'),
+    ('Яке свято 7 січня?', 'Яке свято 6 січня?'),
+    ('Хто такий кіт?', 'Хто такий кит?'),
+    ('Що було в XI ст.?', 'Що було в XII ст.?'),
+    ('Що означає номер 0?', 'Що означає номер 1?'),
+]
+
+
+@pytest.mark.parametrize('threshold', [1.0, 0.5])
+@pytest.mark.parametrize('cached, asked', DIFFERENT_QUESTIONS)
+def test_different_questions_never_share_an_answer(cached, asked, threshold):
+    cache = ChatResponseCache(threshold=threshold)
+    cache.put(cached, 'відповідь')
+    assert cache.get(asked) is None
+    assert cache.get(cached) == 'відповідь'
+
+
+def test_exact_match_is_the_default():
+    cache = ChatResponseCache()
+    cache.put('Хто такий Шевченко?', 'поет')
+    assert cache.get('  хто ТАКИЙ шевченко ') == 'поет'
+    assert cache.get('Будь ласка, хто такий Шевченко?') is None
+
+
+def test_near_match_differs_only_in_filler_words():
+    cache = ChatResponseCache(threshold=0.7)
+    cache.put('Хто такий Шевченко?', 'поет')
+    assert cache.get('Ну хто такий Шевченко?') == 'поет'
+    assert cache.get('Хто такий Франко?') is None
+    assert cache.stats()['near_hits'] == 1
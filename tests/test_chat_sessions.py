@@ -0,0 +1,49 @@
+import pytest
+
+import chat_sessions
+from chat_sessions import ChatSessionStore
+
+
+@pytest.fixture
+def store(monkeypatch, clock, tmp_path):
+    monkeypatch.setattr(chat_sessions, 'time', clock)
+    return ChatSessionStore(str(tmp_path / 'sessions.db'), max_sessions=3, idle_ttl=600)
+
+
+def table_totals(store):
+    return tuple(store._db().execute('SELECT count(*), coalesce(sum(size), 0) FROM chat_sessions').fetchone())
+
+
+def test_running_totals_follow_writes_and_evictions(store, clock):
+    for index in range(5):
+        clock.advance(1)
+        store.append(f'session-{index:04d}', 'питання', 'відповідь')
+    store.append('session-0004', 'ще питання', 'ще відповідь')
+
+    stats = store.stats()
+    assert (stats['sessions'], stats['bytes']) == table_totals(store)
+    assert stats['sessions'] == 3
+    assert stats['evictions'] == 2
+    assert store.messages('session-0000') == []
+    assert len(store.messages('session-0004')) == 4
+
+
+def test_idle_sessions_leave_the_totals(store, clock):
+    store.append('session-old', 'питання', 'відповідь')
+    store.append('session-idle', 'питання', 'відповідь')
+    clock.advance(601)
+    # Replacing an expired row that was never evicted must not count it twice
+    store.append('session-old', 'питання', 'відповідь')
+
+    assert (store.stats()['sessions'], store.stats()['bytes']) == table_totals(store)
+    assert store.stats()['sessions'] == 1
+    assert len(store.messages('session-old')) == 2
+
+
+def test_totals_are_backfilled_for_existing_stores(store, tmp_path):
+    store.append('session-0001', 'питання', 'відповідь')
+    db = store._db()
+    db.execute('DROP TABLE chat_sessions_totals')
+
+    reopened = ChatSessionStore(store.path)
+    assert (reopened.stats()['sessions'], reopened.stats()['bytes']) == table_totals(store)
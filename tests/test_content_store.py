@@ -0,0 +1,104 @@
+import sqlite3
+
+import pytest
+
+import content_store
+from content_store import ContentStore
+
+
+@pytest.fixture
+def store(monkeypatch, clock, tmp_path):
+    monkeypatch.setattr(content_store, 'time', clock)
+    return ContentStore(str(tmp_path / 'content.db'), variants=3, min_variants=2, max_age=3600,
+                        stale_ttl=600, stale_max_keys=2, prune_every=1000)
+
+
+def variants(store, endpoint, key):
+    rows = store._db().execute('SELECT variant, text FROM content WHERE endpoint = ? AND key = ? ORDER BY variant',
+                               (endpoint, key)).fetchall()
+    return dict(rows)
+
+
+def test_ring_serves_once_min_variants_exist(store, clock):
+    store.add('lessons', 'k', 'v0')
+    assert store.random('lessons', 'k') is None
+    store.add('lessons', 'k', 'v1')
+    assert store.random('lessons', 'k') in {'v0', 'v1'}
+    assert store.random('lessons', 'other') is None
+    assert (store.hits, store.misses) == (1, 2)
+
+
+def test_ring_replaces_the_oldest_variant(store, clock):
+    for index in range(5):
+        clock.advance(1)
+        store.add('lessons', 'k', f'v{index}')
+
+    assert variants(store, 'lessons', 'k') == {0: 'v3', 1: 'v4', 2: 'v2'}
+    assert store.latest('lessons', 'k') == 'v4'
+    assert store.stats()['variants'] == 3
+    for _ in range(20):
+        assert store.random('lessons', 'k') in {'v2', 'v3', 'v4'}
+
+
+def test_key_not_written_for_max_age_is_missing(store, clock):
+    store.add('lessons', 'k', 'v0')
+    store.add('lessons', 'k', 'v1')
+    clock.advance(3601)
+    assert store.random('lessons', 'k') is None
+    store.add('lessons', 'k', 'v2')
+    assert store.random('lessons', 'k') in {'v0', 'v1', 'v2'}
+
+
+def test_last_good_prefers_the_kept_answer(store, clock):
+    store.add('lessons', 'k', 'variant')
+    assert store.last_good('lessons', 'k') == 'variant'
+    store.keep('lessons', 'k', 'kept')
+    assert store.last_good('lessons', 'k') == 'kept'
+    clock.advance(601)
+    assert store.last_good('lessons', 'k') == 'variant'
+
+
+def test_prune_drops_expired_then_oldest_answers(store, clock):
+    for key in ('a', 'b', 'c', 'd'):
+        clock.advance(100)
+        store.keep('chat', key, key.upper())
+    assert store.stats()['last_good'] == 4
+
+    store.prune()
+    assert store.stats()['last_good'] == 2
+    assert store.last_good('chat', 'a') is None
+    assert store.last_good('chat', 'd') == 'D'
+
+    clock.advance(550)
+    store.prune()
+    assert store.last_good('chat', 'c') is None
+    assert store.last_good('chat', 'd') == 'D'
+
+
+def test_keep_prunes_every_n_writes(store, clock):
+    store.prune_every = 3
+    for key in ('a', 'b', 'c'):
+        clock.advance(1)
+        store.keep('chat', key, key)
+    assert store.stats()['last_good'] == 2
+
+
+def test_catalogue_keys_are_served_past_max_age(store, clock):
+    store.replace('lessons', 'catalogue', ['c0', 'c1'])
+    clock.advance(10 * 3600)
+    assert store.random('lessons', 'catalogue') in {'c0', 'c1'}
+    # Runtime variants added to a catalogue key keep it exempt
+    store.add('lessons', 'catalogue', 'c2')
+    clock.advance(10 * 3600)
+    assert store.random('lessons', 'catalogue') in {'c0', 'c1', 'c2'}
+
+
+def test_catalogue_column_is_added_to_older_stores(tmp_path):
+    path = str(tmp_path / 'old.db')
+    db = sqlite3.connect(path)
+    db.executescript(content_store.SCHEMA.replace('    catalogue INTEGER NOT NULL DEFAULT 0,\n', ''))
+    db.close()
+
+    store = ContentStore(path, min_variants=1)
+    store.replace('lessons', 'k', ['v0'])
+    assert store.random('lessons', 'k') == 'v0'
@@ -0,0 +1,30 @@
+import contextvars
+from types import SimpleNamespace
+
+from journal import RequestJournal
+
+
+def usage(input_tokens, output_tokens):
+    return SimpleNamespace(input_tokens=input_tokens, output_tokens=output_tokens)
+
+
+def test_usage_after_finish_goes_to_the_process_total(tmp_path):
+    journal = RequestJournal(str(tmp_path / 'requests.jsonl'))
+
+    def request():
+        entry = journal.begin('/api/chat', 'POST')
+        journal.note_usage(usage(10, 20))
+        journal.finish(entry, 200, 0.5)
+        # A stale refresh that completes after the response was sent
+        journal.note_usage(usage(3, 4))
+        return entry
+
+    entry = contextvars.copy_context().run(request)
+    # A pool refill outside any request
+    contextvars.copy_context().run(journal.note_usage, usage(1, 2))
+    journal.flush()
+
+    assert entry['tokens']['input'] == 10
+    assert entry['tokens']['calls'] == 1
+    unattributed = journal.stats()['unattributed_tokens']
+    assert (unattributed['calls'], unattributed['input'], unattributed['output']) == (2, 4, 6)
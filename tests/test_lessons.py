@@ -0,0 +1,82 @@
+import importlib
+import os
+import time
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def app_module(tmp_path_factory):
+    cache = tmp_path_factory.mktemp('cache')
+    os.environ.update({
+        'ANTHROPIC_API_KEY': 'test-key',
+        'ANTHROPIC_BASE_URL': 'http://127.0.0.1:9',
+        'APP_MANAGED_STARTUP': '1',
+        'CONTENT_STORE_PATH': str(cache / 'content.db'),
+        'CHAT_SESSIONS_PATH': str(cache / 'chat_sessions.db'),
+        'JOURNAL_PATH': str(cache / 'journal'),
+        'WISDOM_CACHE_FILE': str(cache / 'daily_wisdom.json'),
+    })
+    return importlib.import_module('app')
+
+
+@pytest.fixture
+def client(app_module, monkeypatch):
+    calls = []
+
+    def generate_text(*args, **kwargs):
+        calls.append(args)
+        return 'згенерований урок'
+
+    monkeypatch.setattr(app_module, 'generate_text', generate_text)
+    with app_module.app.test_client() as client:
+        client.model_calls = calls
+        yield client
+
+
+def post_lessons(client, lessons, prefetch=False):
+    response = client.post('/api/lessons', json={'lessons': lessons, 'prefetch': prefetch})
+    try:
+        return response.status_code, response.get_json()
+    finally:
+        response.close()
+
+
+def test_prefetch_reads_without_generating_or_using_up_the_pool(app_module, client):
+    pool = app_module.lesson_pool
+    pooled_key = ('advanced', 'history', 'kyivan_rus')
+    pool._producers[pooled_key] = lambda: client.model_calls.append('refill') or 'урок'
+    pool._entries[pooled_key] = [[time.time(), 'готовий урок', 0]]
+
+    status, body = post_lessons(client, [
+        {'category': 'history', 'subcategory': 'kyivan_rus'},
+        {'category': 'history', 'subcategory': 'cossack_state'},
+    ], prefetch=True)
+    time.sleep(0.1)
+
+    assert status == 200
+    assert body['lessons'][0] == {'lesson': 'готовий урок', 'success': True}
+    assert body['lessons'][1]['missing'] is True
+    assert client.model_calls == []
+    assert len(pool._entries[pooled_key]) == 1
+    assert pooled_key not in pool._pending
+
+
+def test_prefetch_is_charged_to_the_client(app_module, client, monkeypatch):
+    charged = []
+    monkeypatch.setattr(app_module.client_limiter, 'check', charged.append)
+    post_lessons(client, [{'category': 'history', 'subcategory': 'cossack_state'}], prefetch=True)
+    assert len(charged) == 1
+
+
+@pytest.mark.parametrize('item', [
+    {'type': 'astrology'},
+    {'type': 'history', 'level': 'майстер'},
+    {'type': ['history']},
+    {'category': 'history', 'subcategory': 'no_such_topic'},
+])
+def test_unknown_lessons_are_refused(client, item):
+    status, body = post_lessons(client, [{'type': 'history'}, item], prefetch=True)
+    assert status == 400
+    assert body['success'] is False
+    assert client.model_calls == []
@@ -0,0 +1,153 @@
+import threading
+
+import pytest
+
+import upstream
+from upstream import CircuitBreaker, CircuitOpenError, SingleFlight
+
+
+@pytest.fixture
+def breaker(monkeypatch, clock):
+    monkeypatch.setattr(upstream, 'time', clock)
+    return CircuitBreaker(failure_threshold=2, reset_timeout=30)
+
+
+def trip(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+
+def test_breaker_opens_after_consecutive_failures(breaker):
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    assert breaker.before_call() is False
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert breaker.trips == 1
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_success_resets_the_failure_count(breaker):
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+
+
+def test_half_open_lets_exactly_one_probe_through(breaker, clock):
+    trip(breaker)
+    clock.advance(30)
+    breaker.check()
+    assert breaker.before_call() is True
+    assert breaker.state == 'half-open'
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    assert breaker.before_call() is False
+
+
+def test_failed_probe_reopens(breaker, clock):
+    trip(breaker)
+    clock.advance(30)
+    assert breaker.before_call() is True
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert breaker.trips == 2
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_abandoned_probe_frees_the_slot(breaker, clock):
+    trip(breaker)
+    clock.advance(30)
+    assert breaker.before_call() is True
+    breaker.abandon_probe()
+    assert breaker.before_call() is True
+
+
+def test_cancelled_call_abandons_only_its_own_probe(monkeypatch, breaker, clock):
+    monkeypatch.setattr(upstream, 'breaker', breaker)
+
+    def cancelled():
+        raise KeyboardInterrupt
+
+    trip(breaker)
+    clock.advance(30)
+    with pytest.raises(KeyboardInterrupt):
+        upstream.call(cancelled)
+    assert breaker.before_call() is True
+
+
+def run_followers(flight, key, count, leader_started, release):
+    results = []
+
+    def follower():
+        try:
+            results.append(flight.do(key, lambda: pytest.fail('follower ran the call')))
+        except Exception as e:
+            results.append(e)
+
+    leader_started.wait()
+    threads = [threading.Thread(target=follower) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    while flight.stats()['calls_saved'] < count:
+        threading.Event().wait(0.001)
+    release.set()
+    return threads, results
+
+
+def test_single_flight_shares_the_leader_result():
+    flight = SingleFlight()
+    leader_started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def produce():
+        calls.append(1)
+        leader_started.set()
+        release.wait(5)
+        return 'answer'
+
+    leader = threading.Thread(target=lambda: calls.append(flight.do('k', produce)))
+    leader.start()
+    threads, results = run_followers(flight, 'k', 3, leader_started, release)
+    for thread in threads + [leader]:
+        thread.join(5)
+
+    assert calls == [1, 'answer']
+    assert results == ['answer'] * 3
+    assert flight.stats() == {'upstream_calls': 1, 'calls_saved': 3, 'in_flight': 0}
+
+
+def test_single_flight_shares_the_leader_error():
+    flight = SingleFlight()
+    leader_started, release = threading.Event(), threading.Event()
+    error = ValueError('upstream failed')
+
+    def produce():
+        leader_started.set()
+        release.wait(5)
+        raise error
+
+    raised = []
+
+    def lead():
+        try:
+            flight.do('k', produce)
+        except ValueError as e:
+            raised.append(e)
+
+    leader = threading.Thread(target=lead)
+    leader.start()
+    threads, results = run_followers(flight, 'k', 2, leader_started, release)
+    for thread in threads + [leader]:
+        thread.join(5)
+
+    assert raised == [error]
+    assert results == [error, error]
+    # A failed flight is not cached: the next caller runs the call again
+    assert flight.do('k', lambda: 'retried') == 'retried'
@@ -0,0 +1,118 @@
+"""Per-route and per-prompt `max_tokens` budgets, plus output-token accounting.
+
+A budget is resolved in this order:
+1. an explicit per-prompt entry (e.g. "advanced:history:kyivan_rus"),
+2. an explicit per-route entry,
+3. the ceiling.
+Every call gets the ceiling until an override is set from measured output
+(TokenUsage.stats() suggests p95 plus headroom per route); a guessed budget
+that is too low truncates answers. The result is always capped at the
+ceiling. Overrides come from the JSON file in TOKEN_BUDGETS_FILE:
+
+    {"routes": {"chat": 700}, "prompts": {"lesson:history": 900}}
+
+Actual output tokens are recorded per route so these numbers can be tuned
+from production data.
+"""
+import json
+import math
+import os
+import threading
+from collections import deque
+
+# Cyrillic text costs noticeably more tokens per word than English
+TOKENS_PER_WORD = 2.5
+CEILING = 1000
+
+
+def estimate_tokens(text):
+    """Rough token count for Ukrainian text, from its word count"""
+    return int(len(text.split()) * TOKENS_PER_WORD) + 1
+
+
+class TokenBudgets:
+    def __init__(self, routes=None, prompts=None, ceiling=CEILING):
+        self.routes = dict(routes or {})
+        self.prompts = dict(prompts or {})
+        self.ceiling = ceiling
+
+    @classmethod
+    def from_env(cls):
+        path = os.getenv('TOKEN_BUDGETS_FILE')
+        if not path:
+            return cls()
+        with open(path, encoding='utf-8') as f:
+            config = json.load(f)
+        return cls(
+            routes=config.get('routes'),
+            prompts=config.get('prompts'),
+            ceiling=config.get('ceiling', CEILING)
+        )
+
+    def for_prompt(self, route, prompt_key=None):
+        """Return the max_tokens to request for one call"""
+        if prompt_key in self.prompts:
+            budget = self.prompts[prompt_key]
+        else:
+            budget = self.routes.get(route, self.ceiling)
+        return min(budget, self.ceiling)
+
+
+class TokenUsage:
+    """Rolling per-route record of output tokens and truncations"""
+
+    def __init__(self, window=500):
+        self.window = window
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def record(self, route, usage, max_tokens, stop_reason=None):
+        output_tokens = getattr(usage, 'output_tokens', 0) or 0
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = {
+                    'calls': 0, 'input_tokens': 0, 'output_tokens': 0,
+                    'cache_read_tokens': 0, 'cache_write_tokens': 0,
+                    'truncated': 0, 'max_tokens': max_tokens,
+                    'recent': deque(maxlen=self.window)
+                }
+            stats['calls'] += 1
+            stats['input_tokens'] += getattr(usage, 'input_tokens', 0) or 0
+            stats['output_tokens'] += output_tokens
+            # Only reported by the prompt-caching endpoint
+            stats['cache_read_tokens'] += getattr(usage, 'cache_read_input_tokens', 0) or 0
+            stats['cache_write_tokens'] += getattr(usage, 'cache_creation_input_tokens', 0) or 0
+            stats['max_tokens'] = max_tokens
+            stats['recent'].append(output_tokens)
+            if stop_reason == 'max_tokens':
+                stats['truncated'] += 1
+        if stop_reason == 'max_tokens':
+            print(f"Response truncated at max_tokens={max_tokens} on {route}")
+
+    def stats(self):
+        with self._lock:
+            report = {}
+            for route, stats in self._routes.items():
+                recent = sorted(stats['recent'])
+                p50 = recent[len(recent) // 2] if recent else 0
+                p95 = recent[min(len(recent) - 1, int(len(recent) * 0.95))] if recent else 0
+                report[route] = {
+                    'calls': stats['calls'],
+                    'input_tokens': stats['input_tokens'],
+                    'output_tokens': stats['output_tokens'],
+                    'cache_read_tokens': stats['cache_read_tokens'],
+                    'cache_write_tokens': stats['cache_write_tokens'],
+                    'truncated': stats['truncated'],
+                    'max_tokens': stats['max_tokens'],
+                    'output_p50': p50,
+                    'output_p95': p95,
+                    'output_max': recent[-1] if recent else 0,
+                    # p95 plus 20% headroom, a starting point for the budget table
+                    'suggested_budget': math.ceil(p95 * 1.2) if recent else None
+                }
+            return report
+
+
+budgets = TokenBudgets.from_env()
+token_usage = TokenUsage()
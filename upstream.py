@@ -0,0 +1,362 @@
+"""Resilient transport for Anthropic API calls.
+
+Builds clients with an explicitly sized, keep-alive connection pool and
+tuned timeouts, and wraps model calls in a retry policy (jittered
+exponential backoff for 429/529/5xx and connection errors) plus a circuit
+breaker. Once the breaker is open, calls fail fast with CircuitOpenError so
+routes can answer from cached content instead of tying up workers.
+
+The Anthropic SDK (with its httpx/pydantic stack) is imported on first
+use by build_client(), so importing this module stays cheap.
+"""
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling upstream while the circuit breaker is open"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Upstream circuit open, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def load_sdk():
+    """Import the Anthropic SDK; a no-op after the first call"""
+    import anthropic
+    return anthropic
+
+
+def _loaded_sdk():
+    # SDK exceptions can only exist once the SDK has been imported
+    return sys.modules.get('anthropic')
+
+
+def is_retryable(error):
+    anthropic = _loaded_sdk()
+    if anthropic is None:
+        return False
+    if isinstance(error, anthropic.APIConnectionError):
+        return True
+    if isinstance(error, anthropic.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    return False
+
+
+def error_class(error):
+    """Short, bounded label for a failed model call (for metrics)"""
+    if isinstance(error, CircuitOpenError):
+        return 'circuit_open'
+    if isinstance(error, TimeoutError):
+        return 'timeout'
+    anthropic = _loaded_sdk()
+    if anthropic is None:
+        return 'internal'
+    if isinstance(error, anthropic.APITimeoutError):
+        return 'timeout'
+    if isinstance(error, anthropic.APIConnectionError):
+        return 'connection'
+    if isinstance(error, anthropic.APIStatusError):
+        if error.status_code == 429:
+            return 'rate_limited'
+        if error.status_code == 529:
+            return 'overloaded'
+        if error.status_code >= 500:
+            return 'server_error'
+        return 'client_error'
+    return 'internal'
+
+
+def _retry_after_header(error):
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """Full-jitter exponential backoff, honouring Retry-After when present"""
+
+    def __init__(self, attempts=3, base_delay=0.5, max_delay=8.0):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            attempts=int(os.getenv('UPSTREAM_RETRY_ATTEMPTS', '3')),
+            base_delay=float(os.getenv('UPSTREAM_RETRY_BASE_DELAY', '0.5')),
+            max_delay=float(os.getenv('UPSTREAM_RETRY_MAX_DELAY', '8'))
+        )
+
+    def delay(self, attempt, error):
+        retry_after = _retry_after_header(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            failure_threshold=int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5')),
+            reset_timeout=float(os.getenv('BREAKER_RESET_TIMEOUT', '30'))
+        )
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go upstream now; True if this call is the half-open probe"""
+        with self._lock:
+            if self.state == 'closed':
+                return False
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                raise CircuitOpenError(remaining)
+            # Let exactly one probe through; everyone else keeps failing fast
+            if self._probing:
+                raise CircuitOpenError(self.reset_timeout)
+            self.state = 'half-open'
+            self._probing = True
+            return True
+
+    def check(self):
+        """Raise CircuitOpenError while open, without claiming the probe slot"""
+        with self._lock:
+            if self.state == 'open':
+                remaining = self.opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    raise CircuitOpenError(remaining)
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == 'half-open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    self.trips += 1
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+    def abandon_probe(self):
+        """Forget a probe that was cancelled before upstream answered"""
+        with self._lock:
+            self._probing = False
+
+
+retry_policy = RetryPolicy.from_env()
+breaker = CircuitBreaker.from_env()
+
+
+def _transport_settings():
+    import httpx
+    limits = httpx.Limits(
+        max_connections=int(os.getenv('ANTHROPIC_MAX_CONNECTIONS', '100')),
+        max_keepalive_connections=int(os.getenv('ANTHROPIC_MAX_KEEPALIVE', '20')),
+        keepalive_expiry=float(os.getenv('ANTHROPIC_KEEPALIVE_EXPIRY', '30'))
+    )
+    timeout = httpx.Timeout(
+        float(os.getenv('ANTHROPIC_READ_TIMEOUT', '60')),
+        connect=float(os.getenv('ANTHROPIC_CONNECT_TIMEOUT', '5')),
+        write=float(os.getenv('ANTHROPIC_WRITE_TIMEOUT', '10')),
+        pool=float(os.getenv('ANTHROPIC_POOL_TIMEOUT', '5'))
+    )
+    return limits, timeout
+
+
+def build_client(api_key):
+    """Anthropic client on a pooled keep-alive transport; retries are ours"""
+    anthropic = load_sdk()
+    limits, timeout = _transport_settings()
+    return anthropic.Anthropic(
+        api_key=api_key,
+        http_client=anthropic.DefaultHttpxClient(limits=limits, timeout=timeout),
+        timeout=timeout,
+        max_retries=0
+    )
+
+
+def build_async_client(api_key):
+    anthropic = load_sdk()
+    limits, timeout = _transport_settings()
+    return anthropic.AsyncAnthropic(
+        api_key=api_key,
+        http_client=anthropic.DefaultAsyncHttpxClient(limits=limits, timeout=timeout),
+        timeout=timeout,
+        max_retries=0
+    )
+
+
+def record_outcome(error=None):
+    """Feed the result of a call made outside call()/acall() to the breaker.
+
+    Non-retryable errors (bad request, auth) still mean upstream answered,
+    so they count as healthy.
+    """
+    if error is not None and is_retryable(error):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+
+def call(func):
+    """Run a blocking upstream call under the retry policy and circuit breaker"""
+    probe = breaker.before_call()
+    try:
+        for attempt in range(retry_policy.attempts):
+            try:
+                result = func()
+            except Exception as e:
+                if is_retryable(e) and attempt + 1 < retry_policy.attempts:
+                    time.sleep(retry_policy.delay(attempt, e))
+                    continue
+                record_outcome(e)
+                raise
+            record_outcome()
+            return result
+    except BaseException:
+        if probe:
+            breaker.abandon_probe()
+        raise
+
+
+async def acall(func):
+    """Async counterpart of call(); `func` returns a fresh awaitable per attempt"""
+    probe = breaker.before_call()
+    try:
+        for attempt in range(retry_policy.attempts):
+            try:
+                result = await func()
+            except Exception as e:
+                if is_retryable(e) and attempt + 1 < retry_policy.attempts:
+                    await asyncio.sleep(retry_policy.delay(attempt, e))
+                    continue
+                record_outcome(e)
+                raise
+            record_outcome()
+            return result
+    except BaseException:
+        # Cancellation (e.g. a route timeout) leaves no verdict; let the
+        # next caller probe instead of wedging the breaker half-open
+        if probe:
+            breaker.abandon_probe()
+        raise
+
+
+class _Flight:
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent identical calls into one upstream request.
+
+    The first caller for a key (the leader) runs the call; callers that
+    arrive while it is in flight wait and share its result or exception.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.shared = 0
+
+    def do(self, key, func):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.leaders += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = func()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.event.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'upstream_calls': self.leaders,
+                'calls_saved': self.shared,
+                'in_flight': len(self._flights)
+            }
+
+
+class AsyncSingleFlight:
+    """Event-loop counterpart of SingleFlight.
+
+    The shared call runs as its own task, so a caller that times out or
+    disconnects does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._tasks = {}
+        self.leaders = 0
+        self.shared = 0
+
+    async def do(self, key, func):
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+            self.leaders += 1
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {
+            'upstream_calls': self.leaders,
+            'calls_saved': self.shared,
+            'in_flight': len(self._tasks)
+        }
+
+
+coalescer = SingleFlight()
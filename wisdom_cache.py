@@ -0,0 +1,142 @@
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+
+class DailyWisdomCache:
+    """Generate the daily wisdom once per calendar day.
+
+    A visitor's timezone only picks which local date is "today"; the
+    wisdom is keyed by that date, so every zone on the same date shares one
+    generation and at most a few dates (UTC-12 to UTC+14) are live at once.
+    Generated text is kept in memory and mirrored to a JSON file so it
+    survives restarts and is shared by every worker process; the file is
+    reread only when another process has changed it. Until today's wisdom
+    exists, callers get a random fallback quote while a single background
+    generation runs.
+    """
+
+    def __init__(self, producer, fallback, path, default_tz='Europe/Kyiv', retry_after=300, keep_days=3):
+        self.producer = producer
+        self.fallback = fallback
+        self.path = path
+        self.default_tz = default_tz
+        self.retry_after = retry_after
+        self.keep_days = keep_days
+        self._days = {}
+        self._inflight = set()
+        self._failed_at = {}
+        self._loaded_mtime = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def get(self, tz_name=None):
+        """Return today's wisdom for `tz_name`, or a fallback quote while it is generated"""
+        day = self._today(self._resolve_tz(tz_name))
+
+        with self._lock:
+            if day in self._days:
+                return self._days[day]
+
+        # Another worker may already have written today's wisdom
+        self._load()
+        with self._lock:
+            if day in self._days:
+                return self._days[day]
+
+        self._start_generation(day)
+        return random.choice(self.fallback)
+
+    def warm(self, tz_name=None):
+        """Kick off generation for today so the first visitor gets a hit"""
+        day = self._today(self._resolve_tz(tz_name))
+        with self._lock:
+            ready = day in self._days
+        if not ready:
+            self._start_generation(day)
+
+    def ready(self, tz_name=None):
+        """Whether today's wisdom for `tz_name` is already cached"""
+        day = self._today(self._resolve_tz(tz_name))
+        with self._lock:
+            return day in self._days
+
+    def _resolve_tz(self, tz_name):
+        if tz_name:
+            try:
+                ZoneInfo(tz_name)
+                return tz_name
+            except Exception:
+                pass
+        return self.default_tz
+
+    def _today(self, tz_name):
+        try:
+            return datetime.now(ZoneInfo(tz_name)).date().isoformat()
+        except Exception:
+            return datetime.now(timezone.utc).date().isoformat()
+
+    def _start_generation(self, day):
+        with self._lock:
+            if day in self._inflight:
+                return
+            if time.time() - self._failed_at.get(day, 0) < self.retry_after:
+                return
+            self._inflight.add(day)
+        threading.Thread(target=self._generate, args=(day,), daemon=True).start()
+
+    def _generate(self, day):
+        try:
+            wisdom = self.producer()
+            with self._lock:
+                self._days[day] = wisdom
+                self._failed_at.pop(day, None)
+                self._prune()
+            self._save()
+        except Exception as e:
+            print(f"Daily wisdom generation failed for {day}: {e}")
+            with self._lock:
+                self._failed_at[day] = time.time()
+        finally:
+            with self._lock:
+                self._inflight.discard(day)
+
+    def _prune(self):
+        # Caller holds the lock; ISO dates sort chronologically
+        for day in sorted(self._days)[:-self.keep_days]:
+            del self._days[day]
+
+    def _load(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            if mtime == self._loaded_mtime:
+                return
+            with open(self.path, encoding='utf-8') as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            self._loaded_mtime = mtime
+            for day, wisdom in stored.items():
+                # Files written before the cache was keyed by date map zones to entries
+                if isinstance(wisdom, dict):
+                    day, wisdom = wisdom.get('date'), wisdom.get('wisdom')
+                if day and wisdom:
+                    self._days.setdefault(day, wisdom)
+            self._prune()
+
+    def _save(self):
+        with self._lock:
+            snapshot = dict(self._days)
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Could not persist daily wisdom: {e}")